@@ -0,0 +1,146 @@
+"""
+Generator corpus PDF sintetis (PyMuPDF) untuk benchmark ingest.
+
+Jenis PDF (bergiliran):
+- digital : beberapa embedded image per halaman (JPEG/PNG)
+- scanned : 1 gambar full-page per halaman (seperti hasil scan)
+- vector  : tanpa embedded image (shape + teks), jadi lewat fallback render halaman
+- variant : salinan gambar PDF digital sebelumnya yang di-crop / diubah brightness / grayscale
+
+Jalankan dari root repo:
+  py -m bench.corpus out\\corpus --pdfs 20
+"""
+import argparse
+import random
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageEnhance, ImageOps
+
+from bench.hash_regression import synthetic_image
+
+KINDS = ("digital", "scanned", "vector", "variant")
+VARIANTS = ("crop", "brightness", "grayscale")
+
+A4 = (595, 842)  # point
+SCAN_SIZE = (1240, 1754)  # A4 @ 150 DPI
+
+
+def _encode(img: Image.Image, fmt: str) -> bytes:
+    buf = BytesIO()
+    img.save(buf, fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    return buf.getvalue()
+
+
+def apply_variant(img: Image.Image, variant: str) -> Image.Image:
+    """
+    Perubahan yang dijanjikan README: crop ringan, brightness, grayscale.
+    """
+    if variant == "crop":
+        w, h = img.size
+        return img.crop((w // 10, h // 10, w - w // 10, h - h // 10))
+    if variant == "brightness":
+        return ImageEnhance.Brightness(img).enhance(1.3)
+    if variant == "grayscale":
+        return ImageOps.grayscale(img).convert("RGB")
+    raise ValueError(f"variant tidak dikenal: {variant}")
+
+
+def _image_pdf(path: Path, pages: List[List[Tuple[Image.Image, str]]]) -> None:
+    """
+    pages: per halaman, list of (image, format); gambar disusun dalam grid 2 kolom.
+    """
+    doc = fitz.open()
+    for images in pages:
+        page = doc.new_page(width=A4[0], height=A4[1])
+        if len(images) == 1:
+            rects = [page.rect]
+        else:
+            rows = (len(images) + 1) // 2
+            cw, ch = A4[0] / 2, A4[1] / rows
+            rects = [fitz.Rect((k % 2) * cw, (k // 2) * ch, (k % 2 + 1) * cw, (k // 2 + 1) * ch)
+                     for k in range(len(images))]
+        for (img, fmt), rect in zip(images, rects):
+            page.insert_image(rect, stream=_encode(img, fmt))
+    doc.save(path)
+    doc.close()
+
+
+def _vector_pdf(path: Path, rng: random.Random, n_pages: int) -> None:
+    doc = fitz.open()
+    for p in range(n_pages):
+        page = doc.new_page(width=A4[0], height=A4[1])
+        for _ in range(30):
+            x, y = rng.uniform(0, A4[0] - 60), rng.uniform(0, A4[1] - 60)
+            rect = fitz.Rect(x, y, x + rng.uniform(20, 200), y + rng.uniform(20, 200))
+            color = tuple(rng.random() for _ in range(3))
+            if rng.random() < 0.5:
+                page.draw_rect(rect, color=color, fill=color)
+            else:
+                page.draw_oval(rect, color=color, fill=color)
+        page.insert_text((40, 40 + 10 * p), f"Halaman sintetis {p + 1}", fontsize=14)
+    doc.save(path)
+    doc.close()
+
+
+def _scan_page(rng: random.Random) -> Image.Image:
+    img = Image.new("RGB", SCAN_SIZE, (245, 245, 240))
+    img.paste(synthetic_image(rng, (SCAN_SIZE[0] - 200, SCAN_SIZE[1] // 2)), (100, 150))
+    d = ImageDraw.Draw(img)
+    for k in range(25):
+        y = SCAN_SIZE[1] // 2 + 250 + 30 * k
+        d.line([(100, y), (100 + rng.randrange(400, SCAN_SIZE[0] - 200), y)], fill=(40, 40, 40), width=6)
+    return img
+
+
+def generate_corpus(out_dir: Path, n_pdfs: int, seed: int = 0, pages: int = 3,
+                    images_per_page: int = 2) -> List[Dict[str, Any]]:
+    """
+    Tulis n_pdfs PDF ke out_dir (deterministik untuk seed yang sama).
+    return: list of {"path", "kind", "variant"}
+    """
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sources: List[List[List[Image.Image]]] = []  # gambar PDF digital, untuk dibuat varian
+    corpus: List[Dict[str, Any]] = []
+
+    for i in range(n_pdfs):
+        kind = KINDS[i % len(KINDS)]
+        variant = None
+        path = out_dir / f"{i:05d}_{kind}.pdf"
+
+        if kind == "digital":
+            imgs = [[synthetic_image(rng, (rng.choice([640, 1024, 1600]), rng.choice([480, 768, 1200])))
+                     for _ in range(images_per_page)] for _ in range(pages)]
+            sources.append(imgs)
+            _image_pdf(path, [[(img, rng.choice(["JPEG", "PNG"])) for img in page] for page in imgs])
+        elif kind == "scanned":
+            _image_pdf(path, [[(_scan_page(rng), "JPEG")] for _ in range(pages)])
+        elif kind == "vector":
+            _vector_pdf(path, rng, pages)
+        else:
+            variant = VARIANTS[(i // len(KINDS)) % len(VARIANTS)]
+            src = sources[-1]
+            _image_pdf(path, [[(apply_variant(img, variant), "JPEG") for img in page] for page in src])
+
+        corpus.append({"path": path, "kind": kind, "variant": variant})
+    return corpus
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate corpus PDF sintetis")
+    ap.add_argument("out_dir")
+    ap.add_argument("--pdfs", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    corpus = generate_corpus(Path(args.out_dir), args.pdfs, args.seed, pages=args.pages)
+    for c in corpus:
+        print(f"{c['path']}  ({c['kind']}{'/' + c['variant'] if c['variant'] else ''})")
+
+
+if __name__ == "__main__":
+    main()
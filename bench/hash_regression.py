@@ -0,0 +1,124 @@
+"""
+Regression check compute_hashes (single-pass + JPEG draft decode) vs implementasi lama
+(full decode RGB + normalisasi dua kali). Exit code 1 kalau ada jarak di atas toleransi.
+
+Jalankan dari root repo:
+  py -m bench.hash_regression
+  py -m bench.hash_regression --images 40 --json
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from io import BytesIO
+from typing import Dict, Any, List, Tuple
+
+import imagehash
+from PIL import Image, ImageDraw, ImageFilter, ImageOps
+
+from src.fingerprint import compute_hashes_from_data, hamming_hex
+
+# Toleransi jarak Hamming (per hash) terhadap implementasi lama: sedikit di atas drift terburuk yang
+# teramati (phash 0, dhash 1, ehash 4), jauh di bawah threshold match, jadi pergeseran nyata langsung gagal.
+TOLERANCE = {"phash": 2, "dhash": 3, "ehash": 5}
+
+
+def legacy_compute_hashes(data: bytes) -> Tuple[str, str, str, int, int]:
+    """
+    Salinan compute_hashes sebelum optimasi (referensi).
+    """
+    img = Image.open(BytesIO(data)).convert("RGB")
+    w, h = img.size
+
+    def normalize(im):
+        g = ImageOps.grayscale(im)
+        g = ImageOps.autocontrast(g, cutoff=2)
+        return g.resize((512, 512))
+
+    g = normalize(img)
+    e = normalize(img).filter(ImageFilter.FIND_EDGES)
+    e = ImageOps.autocontrast(e, cutoff=2)
+    return str(imagehash.phash(g)), str(imagehash.dhash(g)), str(imagehash.phash(e)), w, h
+
+
+def synthetic_image(rng: random.Random, size: Tuple[int, int]) -> Image.Image:
+    img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    d = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        r = rng.randrange(size[0] // 20, size[0] // 4)
+        box = [x, y, x + r, y + r]
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            d.rectangle(box, fill=color)
+        else:
+            d.ellipse(box, fill=color)
+    return img.filter(ImageFilter.GaussianBlur(2))
+
+
+def encode(img: Image.Image, fmt: str) -> bytes:
+    buf = BytesIO()
+    if fmt == "JPEG-CMYK":
+        img.convert("CMYK").save(buf, "JPEG", quality=90)
+    elif fmt == "JPEG-L":
+        img.convert("L").save(buf, "JPEG", quality=90)
+    else:
+        img.save(buf, fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    return buf.getvalue()
+
+
+def run(n_images: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    sizes = [(600, 400), (1654, 2339), (3000, 4000)]
+    formats = ["JPEG", "JPEG", "JPEG-L", "JPEG-CMYK", "PNG"]
+
+    rows: List[Dict[str, Any]] = []
+    t_old = t_new = 0.0
+    for i in range(n_images):
+        size, fmt = sizes[i % len(sizes)], formats[i % len(formats)]
+        data = encode(synthetic_image(rng, size), fmt)
+
+        t0 = time.perf_counter()
+        old = legacy_compute_hashes(data)
+        t1 = time.perf_counter()
+        new = compute_hashes_from_data(data)
+        t2 = time.perf_counter()
+        t_old += t1 - t0
+        t_new += t2 - t1
+
+        dist = {k: hamming_hex(o, n) for k, o, n in zip(("phash", "dhash", "ehash"), old, new)}
+        rows.append({"size": list(size), "format": fmt, "same_wh": old[3:] == new[3:], **dist})
+
+    worst = {k: max(r[k] for r in rows) for k in TOLERANCE}
+    ok = all(worst[k] <= TOLERANCE[k] for k in TOLERANCE) and all(r["same_wh"] for r in rows)
+    return {
+        "images": n_images,
+        "ok": ok,
+        "tolerance": TOLERANCE,
+        "max_dist": worst,
+        "legacy_ms_per_image": round(1000 * t_old / n_images, 2),
+        "new_ms_per_image": round(1000 * t_new / n_images, 2),
+        "rows": rows,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Regression check hashing vs implementasi lama")
+    ap.add_argument("--images", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    res = run(args.images, args.seed)
+    if args.json:
+        print(json.dumps(res, indent=2))
+    else:
+        print(f"images={res['images']} max_dist={res['max_dist']} tolerance={res['tolerance']}")
+        print(f"legacy {res['legacy_ms_per_image']} ms/img -> new {res['new_ms_per_image']} ms/img")
+        print("OK" if res["ok"] else "GAGAL: hash bergeser di atas toleransi")
+    sys.exit(0 if res["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
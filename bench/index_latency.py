@@ -0,0 +1,107 @@
+"""
+Benchmark latency lookup matcher: scan penuh (vectorized) vs multi-index hashing.
+
+Jalankan dari root repo:
+  py -m bench.index_latency
+  py -m bench.index_latency --sizes 10000 100000 1000000 --queries 200 --json
+"""
+import argparse
+import json
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+
+import src.matcher as matcher
+
+
+def make_corpus(n: int, rng: np.random.Generator) -> matcher.FingerprintIndex:
+    """
+    Corpus sintetis: hash acak uniform 64-bit (fp_id/image_id = 1..n).
+    """
+    index = matcher.FingerprintIndex()
+    ids = np.arange(1, n + 1, dtype=np.int64)
+    ph, dh, eh = (rng.integers(0, 2**64, size=n, dtype=np.uint64) for _ in range(3))
+    index.extend(zip(ids.tolist(), ids.tolist(), ph.tolist(), dh.tolist(), eh.tolist()))
+    return index
+
+
+def make_queries(index: matcher.FingerprintIndex, n_queries: int, rng: np.random.Generator) -> List[tuple]:
+    """
+    Separuh query = near-duplicate dari baris corpus (beberapa bit dibalik), separuh acak.
+    """
+    ph, dh, eh = index.columns()
+    queries = []
+    for i in range(n_queries):
+        if i % 2 == 0:
+            pos = int(rng.integers(0, len(index)))
+            flips = [int(rng.integers(0, 64)) for _ in range(3)]
+            q = tuple(int(col[pos]) ^ (1 << f) for col, f in zip((ph, dh, eh), flips))
+        else:
+            q = tuple(int(v) for v in rng.integers(0, 2**64, size=3, dtype=np.uint64))
+        queries.append(q)
+    return queries
+
+
+def _time_lookup(queries, index, use_index: bool):
+    old_min = matcher.INDEX_MIN_CORPUS
+    matcher.INDEX_MIN_CORPUS = 0 if use_index else 2**62
+    try:
+        t0 = time.perf_counter()
+        results = [matcher.find_best_match(*q, index) for q in queries]
+        elapsed = time.perf_counter() - t0
+    finally:
+        matcher.INDEX_MIN_CORPUS = old_min
+    return results, elapsed
+
+
+def run(sizes: List[int], n_queries: int, seed: int) -> List[Dict[str, Any]]:
+    rows = []
+    for n in sizes:
+        rng = np.random.default_rng(seed)
+        index = make_corpus(n, rng)
+        queries = make_queries(index, n_queries, rng)
+
+        # warm-up: bangun index (tidak dihitung sebagai latency lookup)
+        t0 = time.perf_counter()
+        matcher.INDEX_MIN_CORPUS, old_min = 0, matcher.INDEX_MIN_CORPUS
+        index.candidates(0, 0)
+        matcher.INDEX_MIN_CORPUS = old_min
+        build_s = time.perf_counter() - t0
+
+        scan_res, scan_s = _time_lookup(queries, index, use_index=False)
+        idx_res, idx_s = _time_lookup(queries, index, use_index=True)
+
+        rows.append({
+            "fingerprints": n,
+            "queries": n_queries,
+            "index_build_s": round(build_s, 4),
+            "scan_ms_per_query": round(1000 * scan_s / n_queries, 4),
+            "index_ms_per_query": round(1000 * idx_s / n_queries, 4),
+            "identical_results": scan_res == idx_res,
+            "matches": sum(r is not None for r in idx_res),
+        })
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark latency lookup fingerprint")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", action="store_true", help="output JSON (untuk dibandingkan antar commit)")
+    args = ap.parse_args()
+
+    rows = run(args.sizes, args.queries, args.seed)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'fingerprints':>12} {'build s':>9} {'scan ms/q':>10} {'index ms/q':>11} {'identical':>10}")
+    for r in rows:
+        print(f"{r['fingerprints']:>12} {r['index_build_s']:>9} {r['scan_ms_per_query']:>10} "
+              f"{r['index_ms_per_query']:>11} {str(r['identical_results']):>10}")
+
+
+if __name__ == "__main__":
+    main()
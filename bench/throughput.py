@@ -0,0 +1,199 @@
+"""
+Benchmark throughput ingest per tahap pada corpus PDF sintetis (lihat bench/corpus.py).
+
+Tahap yang diukur (wall + CPU):
+  extract_embedded_images, render_pages_to_images, compute_hashes, db_insert, find_best_match,
+  plus ingest_pdf end-to-end.
+Semua jalan di folder sementara (storage/ terpisah), jadi DB asli tidak tersentuh.
+
+Jalankan dari root repo:
+  py -m bench.throughput
+  py -m bench.throughput --sizes 8 40 200 --out bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from bench.corpus import generate_corpus
+import src.db as db
+from src import fp_cache
+from src.fingerprint import compute_hashes
+from src.ingest_pdf import ingest_pdf
+from src.matcher import FingerprintIndex, find_best_matches
+from src.pdf_extract import count_embedded_images, extract_embedded_images, render_pages_to_images
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0) -> Iterator[Dict[str, float]]:
+        """
+        Ukur 1 tahap; `items` bisa di-set belakangan lewat dict yang di-yield.
+        """
+        rec = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "items": 0})
+        counter = {"items": items}
+        w0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield counter
+        finally:
+            rec["wall_s"] += time.perf_counter() - w0
+            rec["cpu_s"] += time.process_time() - c0
+            rec["items"] += counter["items"]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for name, r in self.stages.items():
+            out[name] = {
+                "wall_s": round(r["wall_s"], 4),
+                "cpu_s": round(r["cpu_s"], 4),
+                "items": int(r["items"]),
+                "ms_per_item": round(1000 * r["wall_s"] / r["items"], 3) if r["items"] else None,
+            }
+        return out
+
+
+@contextmanager
+def _fresh_storage(workdir: Path) -> Iterator[None]:
+    """
+    storage/ di config adalah path relatif: pindah cwd ke workdir supaya DB & images terpisah.
+    """
+    old = os.getcwd()
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+    try:
+        db.init_db(force=True)
+        fp_cache.reset_cache()
+        yield
+    finally:
+        fp_cache.reset_cache()
+        os.chdir(old)
+
+
+def run_size(n_pdfs: int, seed: int, tmp: Path) -> Dict[str, Any]:
+    timer = StageTimer()
+    with timer.stage("generate_corpus", n_pdfs):
+        corpus = generate_corpus(tmp / "corpus", n_pdfs, seed)
+    pdfs = [c["path"].resolve() for c in corpus]
+
+    with _fresh_storage(tmp / "stages"):
+        out_root = Path("extract")
+        extracted = []  # (pdf_index, page, source, img_index, path)
+        for i, pdf in enumerate(pdfs):
+            if count_embedded_images(pdf) > 0:
+                with timer.stage("extract_embedded_images") as c:
+                    saved = extract_embedded_images(pdf, out_root / f"pdf_{i}")
+                    c["items"] = len(saved)
+                extracted += [(i, page, "embedded", idx, p) for page, idx, p in saved]
+            else:
+                with timer.stage("render_pages_to_images") as c:
+                    saved = render_pages_to_images(pdf, out_root / f"pdf_{i}")
+                    c["items"] = len(saved)
+                extracted += [(i, page, "render", idx, p) for page, idx, p in saved]
+
+        hashes: Dict[Path, tuple] = {}
+        with timer.stage("compute_hashes") as c:
+            for *_, p in extracted:
+                if p not in hashes:  # xref berulang menunjuk file yang sama
+                    hashes[p] = compute_hashes(p)
+            c["items"] = len(hashes)
+
+        with timer.stage("db_insert", len(extracted)):
+            with db.session() as conn:
+                for i, pdf in enumerate(pdfs):
+                    pdf_id = db.insert_pdf(pdf.name, str(pdf), conn=conn)
+                    rows = [(page, source, idx, str(p), hashes[p][3], hashes[p][4], None, *hashes[p][:3])
+                            for (j, page, source, idx, p) in extracted if j == i]
+                    db.insert_images_with_fingerprints(pdf_id, rows, conn=conn)
+
+        index = FingerprintIndex(db.fetch_all_fingerprints())
+        queries = [h[:3] for h in hashes.values()]
+        with timer.stage("find_best_match", len(queries)):
+            matches = find_best_matches(queries, index)
+
+    with _fresh_storage(tmp / "ingest"):
+        with timer.stage("ingest_pdf", len(pdfs)):
+            reports = [ingest_pdf(pdf) for pdf in pdfs]
+
+    num_dup = sum(r["is_duplicate"] for rep in reports for r in rep["results"])
+    return {
+        "pdfs": n_pdfs,
+        "images": len(extracted),
+        "unique_images": len(hashes),
+        "fingerprints": len(index),
+        "matches": sum(m is not None for m in matches),
+        "ingest_dup": num_dup,
+        "stages": timer.summary(),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(sizes: List[int], seed: int, keep: bool = False) -> Dict[str, Any]:
+    runs = []
+    for n in sizes:
+        tmp = Path(tempfile.mkdtemp(prefix=f"pdfdup_bench_{n}_"))
+        try:
+            runs.append(run_size(n, seed, tmp))
+        finally:
+            if not keep:
+                shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "runs": runs,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark throughput ingest per tahap")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[8, 40],
+                    help="jumlah PDF per corpus (default: %(default)s)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="tulis hasil JSON ke file ini (untuk dibandingkan antar commit)")
+    ap.add_argument("--json", action="store_true", help="print hasil sebagai JSON")
+    ap.add_argument("--keep", action="store_true", help="jangan hapus folder sementara (corpus + storage)")
+    args = ap.parse_args()
+
+    res = run(args.sizes, args.seed, args.keep)
+    if args.out:
+        Path(args.out).write_text(json.dumps(res, indent=2), encoding="utf-8")
+    if args.json:
+        print(json.dumps(res, indent=2))
+        return
+
+    print(f"commit={res['meta']['commit']} python={res['meta']['python']}")
+    for r in res["runs"]:
+        print(f"\n{r['pdfs']} PDF | {r['images']} images ({r['unique_images']} unik) | "
+              f"{r['matches']} match | ingest DUP={r['ingest_dup']}")
+        print(f"{'stage':<26} {'wall s':>9} {'cpu s':>9} {'items':>7} {'ms/item':>9}")
+        for name, s in r["stages"].items():
+            print(f"{name:<26} {s['wall_s']:>9} {s['cpu_s']:>9} {s['items']:>7} {str(s['ms_per_item']):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,24 @@ import subprocess
 def usage():
     print("""
 Usage:
-  py run.py file   "C:\\path\\to\\file.pdf"
-  py run.py folder "D:\\DatasetPDF" [--no-recursive]
+  py run.py file   "C:\\path\\to\\file.pdf" [--render-workers N]
+  py run.py folder "D:\\DatasetPDF" [--no-recursive] [--workers N] [--render-workers N] [--rescan]
   py run.py ui
+  py run.py migrate [path\\to\\app.db]
+  py run.py regions
+  py run.py snapshot
+  py run.py export out.zip [--images] [--pdfs]
+  py run.py merge shard1.zip [shard2.zip ...] [--report merge_report.json]
 
 Commands:
   file    Ingest 1 PDF
   folder  Ingest semua PDF dalam folder
   ui      Jalankan Streamlit dashboard
+  migrate Migrasi DB lama (hash TEXT -> INTEGER)
+  regions Isi region hash (deteksi crop) untuk gambar yang di-ingest sebelum fitur ini
+  snapshot Tulis ulang snapshot fingerprint (memmap) untuk cold start cepat
+  export  Export DB ini jadi 1 shard (ingest di beberapa mesin)
+  merge   Merge shard dari mesin lain ke DB ini (1 transaksi) + report duplicate lintas shard
 """.strip())
 
 def main():
@@ -26,17 +36,34 @@ def main():
         if len(sys.argv) < 3:
             usage(); sys.exit(1)
         pdf = sys.argv[2]
-        subprocess.check_call([sys.executable, str(Path("src") / "ingest_pdf.py"), pdf])
+        extra = sys.argv[3:]  # bisa berisi --render-workers N
+        subprocess.check_call([sys.executable, "-m", "src.ingest_pdf", pdf, *extra])
 
     elif cmd == "folder":
         if len(sys.argv) < 3:
             usage(); sys.exit(1)
         folder = sys.argv[2]
-        extra = sys.argv[3:]  # bisa berisi --no-recursive
-        subprocess.check_call([sys.executable, str(Path("src") / "ingest_folder.py"), folder, *extra])
+        extra = sys.argv[3:]  # bisa berisi --no-recursive / --workers N / --render-workers N
+        subprocess.check_call([sys.executable, "-m", "src.ingest_folder", folder, *extra])
 
     elif cmd in ("ui", "streamlit"):
-        subprocess.check_call([sys.executable, "-m", "streamlit", "run", str(Path("src") / "streamlit_app.py")])
+        from src.config import MAX_UPLOAD_BYTES
+        # batas upload di server Streamlit (MB): file lebih besar ditolak sebelum ditampung di memory
+        max_mb = -(-MAX_UPLOAD_BYTES // (1024 * 1024))
+        subprocess.check_call([sys.executable, "-m", "streamlit", "run", str(Path("src") / "streamlit_app.py"),
+                               f"--server.maxUploadSize={max_mb}"])
+
+    elif cmd == "migrate":
+        subprocess.check_call([sys.executable, "-m", "src.migrate_db", *sys.argv[2:]])
+
+    elif cmd in ("export", "merge"):
+        subprocess.check_call([sys.executable, "-m", "src.shards", cmd, *sys.argv[2:]])
+
+    elif cmd == "snapshot":
+        subprocess.check_call([sys.executable, "-m", "src.fp_snapshot"])
+
+    elif cmd == "regions":
+        subprocess.check_call([sys.executable, "-m", "src.backfill_regions"])
 
     else:
         usage()
@@ -0,0 +1,58 @@
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+from src.config import PHASH_THRESHOLD
+from src.db import init_db, session, fetch_fingerprints_without_regions, insert_region_hashes
+from src.fingerprint import compute_hashes_with_regions, hash_to_int, region_layout
+from src.fp_cache import reset_cache
+from src.thumbnails import ensure_image_file
+
+BATCH_SIZE = 500
+
+
+def backfill_region_hashes() -> Tuple[int, int]:
+    """
+    Hitung region hash untuk fingerprint yang belum punya (DB lama, atau REGION_GRID/REGION_WINDOWS diganti),
+    dari file gambar yang tersimpan. Halaman render yang belum punya file dirender dulu.
+    Fingerprint yang file gambarnya tidak ada (SAVE_EXTRACTED_IMAGES=False) dilewati, begitu juga
+    file yang phash-nya tidak cocok lagi dengan fingerprint (misal preview lama dirender dari PDF
+    yang sudah tertimpa): region dari gambar lain tidak boleh masuk index.
+    return: (jumlah fingerprint yang diisi, jumlah yang dilewati karena tidak cocok)
+    """
+    init_db()
+    layout = region_layout()
+    todo = fetch_fingerprints_without_regions(layout)
+    done = 0
+    mismatched = 0
+    for i in range(0, len(todo), BATCH_SIZE):
+        rows = []
+        for fp_id, image_id, img_path, _, _, _, phash in todo[i:i + BATCH_SIZE]:
+            path = Path(img_path) if img_path and Path(img_path).exists() else ensure_image_file(image_id)
+            if path is None:
+                continue
+            with Image.open(path) as img:
+                ph, _, _, _, _, regions = compute_hashes_with_regions(img, regions=True)
+            if bin(hash_to_int(ph) ^ phash).count("1") > PHASH_THRESHOLD:
+                mismatched += 1
+                continue
+            rows.append((fp_id, image_id, regions.astype("<u8").tobytes()))
+        with session() as conn:
+            insert_region_hashes(rows, layout, conn=conn)
+        done += len(rows)
+    # proses lain melihat baris ini lewat cek jumlah di fp_cache.get_region_index
+    reset_cache()
+    return done, mismatched
+
+
+def main():
+    n, mismatched = backfill_region_hashes()
+    print(f"Region hash diisi untuk {n} fingerprint (layout {region_layout()}).")
+    if mismatched:
+        print(f"{mismatched} gambar dilewati: file tidak cocok lagi dengan fingerprint-nya.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,94 +2,171 @@ from __future__ import annotations
 
 from pathlib import Path
 from uuid import uuid4
-from typing import Dict, Any, List, Tuple
-
-from src.config import MIN_EMBEDDED_IMAGES_TO_SKIP_RENDER
-from src.pdf_extract import extract_embedded_images, render_pages_to_images
-from src.fingerprint import compute_hashes
-from src.matcher import find_best_match
-
-
-def _extract_images_for_compare(pdf_path: Path, out_dir: Path) -> List[Tuple[str, int, int, Path]]:
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    embedded = extract_embedded_images(pdf_path, out_dir)
-    if len(embedded) >= MIN_EMBEDDED_IMAGES_TO_SKIP_RENDER:
-        return [("embedded", p, idx, path) for (p, idx, path) in embedded]
-
-    rendered = render_pages_to_images(pdf_path, out_dir)
-    return [("render", p, idx, path) for (p, idx, path) in rendered]
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from src.config import STORAGE_DIR
+from src.pdf_extract import iter_pdf_images, extracted_filename, save_image_data
+from src.fingerprint import compute_hashes_from_data
+from src.matcher import match_matrix
+from src.timings import StageTimings
+
+COMPARE_DIR = STORAGE_DIR / "compare"
+
+
+def _hash_images_for_compare(pdf_path: Path, out_dir: Optional[Path], timings: StageTimings,
+                             skipped: Dict[str, int]) -> List[Dict[str, Any]]:
+    """
+    Extract + hashing di memory. Gambar hanya ditulis ke disk kalau out_dir diberikan (preview);
+    tanpa preview, halaman scan cukup dirender di resolusi hashing.
+    return: list of {source, page, img_index, img_path, phash, dhash, ehash}
+    """
+    items: List[Dict[str, Any]] = []
+    first_by_xref: Dict[int, Dict[str, Any]] = {}
+    for source, page, img_index, xref, ext, data in timings.timed_iter(
+            "extract", iter_pdf_images(pdf_path, hash_only=out_dir is None, skipped=skipped)):
+        timings.count(source)
+        item: Dict[str, Any] = {"source": source, "page": int(page), "img_index": int(img_index)}
+        if data is None:
+            # xref berulang: pakai hash + file kemunculan pertama
+            first = first_by_xref[xref]
+            item.update({k: first[k] for k in ("img_path", "phash", "dhash", "ehash")})
+            items.append(item)
+            continue
+
+        if isinstance(data, bytes):
+            timings.count("image_bytes", len(data))
+        with timings.stage("hash"):
+            ph, dh, eh, _, _ = compute_hashes_from_data(data)
+        img_path = ""
+        if out_dir is not None:
+            img_path = str(out_dir / extracted_filename(source, page, img_index, ext))
+            with timings.stage("save_images"):
+                save_image_data(data, Path(img_path))
+            timings.count("bytes_written", Path(img_path).stat().st_size)
+        item.update({"img_path": img_path, "phash": ph, "dhash": dh, "ehash": eh})
+        if xref is not None:
+            first_by_xref[xref] = item
+        items.append(item)
+    return items
+
+
+def image_key(source: str, page: int, img_index: int) -> str:
+    return f"{source}:{int(page)}:{int(img_index)}"
+
+
+def save_compare_images(pdf_path: Path, out_dir: Path) -> Dict[str, str]:
+    """
+    Simpan gambar 1 PDF untuk preview hasil compare (tanpa hashing), terpisah dari compare_pdfs
+    supaya hasil compare tidak tergantung apakah preview ditampilkan.
+    return: {image_key(source, page, img_index): img_path}
+    """
+    paths: Dict[str, str] = {}
+    first_by_xref: Dict[int, str] = {}
+    for source, page, img_index, xref, ext, data in iter_pdf_images(pdf_path, hash_only=False):
+        if data is None:
+            paths[image_key(source, page, img_index)] = first_by_xref[xref]
+            continue
+        img_path = out_dir / extracted_filename(source, page, img_index, ext)
+        save_image_data(data, img_path)
+        paths[image_key(source, page, img_index)] = str(img_path)
+        if xref is not None:
+            first_by_xref[xref] = str(img_path)
+    return paths
+
+
+def _pair(m: Dict[str, np.ndarray], i: int, j: int) -> Dict[str, int]:
+    return {
+        "score": int(m["score"][i, j]),
+        "phash_dist": int(m["phash_dist"][i, j]),
+        "dhash_dist": int(m["dhash_dist"][i, j]),
+        "ehash_dist": int(m["ehash_dist"][i, j]),
+    }
 
 
-def compare_pdfs(pdf_a_path: Path, pdf_b_path: Path) -> Dict[str, Any]:
+def compare_pdfs(pdf_a_path: Path, pdf_b_path: Path, save_previews: bool = False,
+                 all_pairs: bool = False, return_matrix: bool = False) -> Dict[str, Any]:
+    """
+    Bandingkan gambar PDF A vs PDF B tanpa DB. Semua jarak A x B dihitung sekaligus.
+    save_previews: simpan gambar ke storage/compare/run_<id>/ (untuk ditampilkan); default tidak menulis apa pun.
+    all_pairs: tambahkan "pairs" = semua pasangan (A, B) yang lolos threshold (many-to-many).
+    return_matrix: tambahkan "matrix" = matrix score & jarak per hash (|A| x |B|).
+    """
     if not pdf_a_path.exists():
         raise FileNotFoundError(f"PDF A tidak ditemukan: {pdf_a_path}")
     if not pdf_b_path.exists():
         raise FileNotFoundError(f"PDF B tidak ditemukan: {pdf_b_path}")
 
     run_id = uuid4().hex
-    base_dir = Path("storage/compare") / f"run_{run_id}"
-    out_a = base_dir / "A"
-    out_b = base_dir / "B"
-
-    extracted_a = _extract_images_for_compare(pdf_a_path, out_a)
-    extracted_b = _extract_images_for_compare(pdf_b_path, out_b)
-
-    # existing_fps format: (fingerprint_id, image_id, phash, dhash, ehash)
-    b_items: List[Dict[str, Any]] = []
-    existing_fps: List[Tuple[int, int, str, str, str]] = []
-
-    for j, (source, page, img_index, img_path) in enumerate(extracted_b, start=1):
-        ph, dh, eh, w, h = compute_hashes(img_path)
-        image_id_fake = j
-        fp_id_fake = j
-        b_items.append({
-            "image_id": image_id_fake,
-            "page": int(page),
-            "source": source,
-            "img_index": int(img_index),
-            "img_path": str(img_path),
-        })
-        existing_fps.append((fp_id_fake, image_id_fake, ph, dh, eh))
-
-    b_lookup = {it["image_id"]: it for it in b_items}
+    base_dir = COMPARE_DIR / f"run_{run_id}" if save_previews else None
+
+    timings = StageTimings()
+    skipped_a: Dict[str, int] = {}
+    skipped_b: Dict[str, int] = {}
+    extracted_a = _hash_images_for_compare(pdf_a_path, base_dir / "A" if base_dir else None, timings, skipped_a)
+    extracted_b = _hash_images_for_compare(pdf_b_path, base_dir / "B" if base_dir else None, timings, skipped_b)
+
+    with timings.stage("match"):
+        m = match_matrix([(it["phash"], it["dhash"], it["ehash"]) for it in extracted_a],
+                         [(it["phash"], it["dhash"], it["ehash"]) for it in extracted_b])
+
+    # best match per gambar A: argmin ambil B paling awal kalau skor sama (sama dengan find_best_match)
+    if extracted_b:
+        best_b = m["score"].argmin(axis=1)
+        has_match = m["ok"][np.arange(len(extracted_a)), best_b]
+    else:
+        best_b = np.zeros(len(extracted_a), dtype=np.int64)
+        has_match = np.zeros(len(extracted_a), dtype=bool)
 
     results: List[Dict[str, Any]] = []
-    for i, (source, page, img_index, img_path) in enumerate(extracted_a, start=1):
-        ph, dh, eh, w, h = compute_hashes(img_path)
-
-        match = find_best_match(ph, dh, eh, existing_fps)
-
+    for i, it in enumerate(extracted_a):
         item: Dict[str, Any] = {
-            "page": int(page),
-            "source": source,
-            "img_index": int(img_index),
-            "img_path": str(img_path),
-            "is_match": match is not None,
+            "page": it["page"],
+            "source": it["source"],
+            "img_index": it["img_index"],
+            "img_path": it["img_path"],
+            "is_match": bool(has_match[i]),
             "match": None
         }
 
-        if match is not None:
-            binfo = b_lookup.get(match["image_id"])
+        if has_match[i]:
+            j = int(best_b[i])
+            binfo = extracted_b[j]
             item["match"] = {
-                "score": int(match["score"]),
-                "phash_dist": int(match["phash_dist"]),
-                "dhash_dist": int(match["dhash_dist"]),
-                "ehash_dist": int(match["ehash_dist"]),
-                "b_page": int(binfo["page"]) if binfo else None,
-                "b_source": binfo["source"] if binfo else None,
-                "b_img_index": int(binfo["img_index"]) if binfo else None,
-                "b_img_path": binfo["img_path"] if binfo else None,
+                **_pair(m, i, j),
+                "b_index": j,
+                "b_page": binfo["page"],
+                "b_source": binfo["source"],
+                "b_img_index": binfo["img_index"],
+                "b_img_path": binfo["img_path"],
             }
 
         results.append(item)
 
-    return {
+    report: Dict[str, Any] = {
         "run_id": run_id,
         "pdf_a": str(pdf_a_path),
         "pdf_b": str(pdf_b_path),
         "num_images_a": len(extracted_a),
         "num_images_b": len(extracted_b),
+        "skipped_trivial_a": skipped_a,
+        "skipped_trivial_b": skipped_b,
         "results": results,
-        "compare_output_dir": str(base_dir),
+        "compare_output_dir": str(base_dir) if base_dir else None,
+        "timings": timings.to_dict(),
     }
+
+    if all_pairs:
+        report["pairs"] = [{"a_index": int(i), "b_index": int(j), **_pair(m, i, j)}
+                           for i, j in zip(*np.nonzero(m["ok"]))]
+
+    if return_matrix:
+        report["matrix"] = {
+            "a": [{k: it[k] for k in ("page", "source", "img_index")} for it in extracted_a],
+            "b": [{k: it[k] for k in ("page", "source", "img_index")} for it in extracted_b],
+            # score = 1000 untuk pasangan yang tidak lolos threshold (lihat juga "ok")
+            **{k: m[k].tolist() for k in ("score", "phash_dist", "dhash_dist", "ehash_dist", "ok")},
+        }
+
+    return report
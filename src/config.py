@@ -5,11 +5,76 @@ STORAGE_DIR = Path("storage")
 PDF_DIR = STORAGE_DIR / "pdfs"
 IMAGES_DIR = STORAGE_DIR / "images"
 DB_PATH = STORAGE_DIR / "app.db"
+# Snapshot fingerprint biner (storage/fingerprints-<id>.snap) dibuka dengan memmap saat cold start;
+# dibuat/di-compact dengan "py run.py snapshot". False = selalu load dari SQLite.
+FP_SNAPSHOT = True
+UPLOAD_DIR = STORAGE_DIR / "uploads"
+
+# Upload (web & streamlit): ditulis ke disk per chunk, tidak pernah utuh di memory
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024  # upload lebih besar dari ini ditolak
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Streamlit: hasil ingest/compare di-cache per digest file, jadi interaksi widget tidak proses ulang
+STREAMLIT_CACHE_ENTRIES = 32  # entry terlama dibuang kalau lebih dari ini
+STREAMLIT_CACHE_TTL = 60 * 60  # detik
 
 # Extract/render settings
 RENDER_DPI = 200  # naikkan ke 300 kalau butuh lebih detail (lebih berat)
 MIN_EMBEDDED_IMAGES_TO_SKIP_RENDER = 1  # kalau embedded >= ini, kita tidak render halaman
+RENDER_WORKERS = 1  # process untuk render halaman PDF scan (1 = sequential); bisa di-override --render-workers
+RENDER_PAGES_PER_TASK = 8  # halaman per task worker (kecil = urutan output cepat keluar, memory terbatas)
+# Render untuk hashing saja: zoom per halaman supaya sisi terpendek pas HASH_INPUT_SIZE (bukan RENDER_DPI).
+# Render RENDER_DPI untuk preview baru dibuat saat pertama dilihat. False = selalu render + simpan RENDER_DPI.
+RENDER_AT_HASH_SIZE = True
+
+# Pre-filter gambar trivial (spacer, bullet, soft mask, isi polos) sebelum decode + hashing
+FILTER_TRIVIAL_IMAGES = True
+MIN_IMAGE_SIDE = 32  # px; lebar/tinggi di bawah ini dibuang (dari metadata PDF, tanpa decode)
+MIN_IMAGE_PIXELS = 64 * 64  # px; luas di bawah ini dibuang
+MIN_IMAGE_STDDEV = 3.0  # deviasi standar grayscale (0-255) di bawah ini = gambar polos/kosong
+# Halaman yang semua gambarnya trivial dirender hanya kalau gambar itu menutup >= fraksi ini dari halaman
+# (mask/isi polos di atas konten halaman); bullet/spacer kecil di halaman teks tidak membuat halaman di-hash
+TRIVIAL_PAGE_RENDER_MIN_COVERAGE = 0.25
+SAVE_EXTRACTED_IMAGES = True  # False = hash langsung dari memory tanpa simpan salinan ke storage/images
+
+# Preview dashboard: thumbnail dibuat saat pertama dilihat, disimpan di storage/images/pdf_<id>/thumbs/
+THUMBNAIL_SIZE = 320  # sisi terpanjang (px)
+THUMBNAIL_QUALITY = 80
+
+# Batch ingest: jumlah worker process untuk extract + hashing (1 = sequential)
+INGEST_WORKERS = 1
+
+# Web app: ingest jalan di background (extract + hashing di process pool, 1 writer DB)
+WEB_INGEST_WORKERS = 2
+WEB_MAX_PENDING_JOBS = 32  # upload baru ditolak (503) kalau job yang belum selesai sebanyak ini
+WEB_JOB_HISTORY = 200  # jumlah job selesai yang statusnya masih disimpan di memory
 
 # Matching thresholds (awal, nanti tuning)
 PHASH_THRESHOLD = 8   # 0 = identik, makin besar makin longgar
 DHASH_THRESHOLD = 10  # tambahan untuk bantu robustness ringan
+
+# Region hash untuk deteksi crop: gambar dinormalisasi dibagi grid REGION_GRID x REGION_GRID sel,
+# tiap window persegi (gambar penuh + ukuran di REGION_WINDOWS, digeser 1 sel) dapat dhash sendiri.
+REGION_HASHES = True  # False = tidak hitung/simpan region hash dan tidak cari kandidat crop
+REGION_GRID = 8
+REGION_WINDOWS = (6, 5, 4)  # ukuran window dalam sel; grid 8 -> 1 + 9 + 16 + 25 = 51 region per gambar
+REGION_MIN_STDDEV = 4.0  # window lebih polos dari ini tidak di-index (background kosong cocok ke mana saja)
+REGION_THRESHOLD = 8  # jarak dhash maksimum antar 2 region dianggap sama
+REGION_MIN_VOTES = 2  # jumlah region query berbeda yang harus cocok ke 1 gambar lama
+REGION_MAX_BUCKET = 2000  # bucket index yang lebih ramai dari ini dilewati (region generik), jadi lookup tetap terbatas
+
+# Matcher 2 tahap: hash memilih VERIFY_TOP_K kandidat terdekat, lalu hanya kandidat itu yang
+# diverifikasi geometris (ORB keypoint + RANSAC, butuh opencv-python-headless). Tanpa OpenCV: hash saja.
+VERIFY_MATCHES = False
+VERIFY_TOP_K = 5
+VERIFY_MAX_SCORE = 16  # kandidat tahap 1: min(ehash, phash + dhash) <= ini (lebih longgar dari threshold biasa)
+VERIFY_MIN_INLIERS = 15  # inlier RANSAC minimum supaya dianggap gambar yang sama
+VERIFY_ORB_FEATURES = 500
+VERIFY_MAX_SIDE = 800  # px; gambar diperkecil ke sini sebelum cari keypoint
+VERIFY_FEATURE_CACHE = 2048  # jumlah descriptor per image_id yang disimpan di memory (juga disimpan di disk)
+
+# SQLite tuning (dipakai di setiap koneksi)
+SQLITE_TIMEOUT = 30  # detik menunggu lock
+SQLITE_SYNCHRONOUS = "NORMAL"  # aman untuk WAL; "FULL" kalau butuh durability maksimal
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # byte; 0 = matikan mmap
+SQLITE_CACHE_SIZE_KB = 64 * 1024  # page cache per koneksi
@@ -1,15 +1,121 @@
 import sqlite3
-from typing import Optional, Tuple, List
-from src.config import DB_PATH, STORAGE_DIR
+import threading
+from contextlib import contextmanager
+from typing import Optional, Tuple, List, Dict, Iterator, Sequence
+from src.config import (
+    DB_PATH,
+    STORAGE_DIR,
+    SQLITE_TIMEOUT,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE_KB,
+)
+from src.fingerprint import hash_to_int
+
+# Hash 64-bit disimpan sebagai INTEGER (8 byte) bukan hex TEXT.
+# SQLite INTEGER itu signed 64-bit, jadi nilai >= 2^63 disimpan sebagai negatif (two's complement).
+FINGERPRINTS_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        image_id INTEGER NOT NULL,
+        phash INTEGER NOT NULL,
+        dhash INTEGER NOT NULL,
+        ehash INTEGER NOT NULL,
+        FOREIGN KEY(image_id) REFERENCES images(id)
+    )
+"""
+
+# Index lama (equality B-tree di hex TEXT): tidak berguna untuk query Hamming-distance
+LEGACY_HASH_INDEXES = ("idx_fingerprints_ehash", "idx_fingerprints_phash", "idx_fingerprints_dhash")
+
+def hash_to_db(h) -> int:
+    """
+    Hash (hex string / int unsigned) -> int signed 64-bit untuk kolom INTEGER SQLite.
+    """
+    v = hash_to_int(h)
+    return v - (1 << 64) if v >= (1 << 63) else v
+
+def hash_from_db(v: int) -> int:
+    """
+    Nilai kolom INTEGER SQLite -> hash int unsigned 64-bit.
+    """
+    return v & 0xFFFFFFFFFFFFFFFF
+
+def _fingerprint_row(row: Tuple) -> Tuple[int, int, int, int, int]:
+    fp_id, image_id, ph, dh, eh = row
+    return fp_id, image_id, hash_from_db(ph), hash_from_db(dh), hash_from_db(eh)
+
+def _ensure_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def is_legacy_schema(conn: sqlite3.Connection) -> bool:
+    """
+    True kalau tabel fingerprints masih menyimpan hash sebagai hex TEXT.
+    """
+    cols = {r[1]: (r[2] or "").upper() for r in conn.execute("PRAGMA table_info(fingerprints)")}
+    return cols.get("phash") == "TEXT"
+
+_schema_lock = threading.Lock()
+_schema_ready = False
 
 def get_conn() -> sqlite3.Connection:
     STORAGE_DIR.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn = sqlite3.connect(DB_PATH, timeout=SQLITE_TIMEOUT)
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA foreign_keys=ON;")
+    conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS};")
+    conn.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)};")
+    conn.execute(f"PRAGMA cache_size=-{int(SQLITE_CACHE_SIZE_KB)};")
     return conn
 
-def init_db() -> None:
+@contextmanager
+def session() -> Iterator[sqlite3.Connection]:
+    """
+    1 koneksi untuk 1 unit kerja (misal 1 PDF). Commit di akhir, rollback kalau error.
+    Fungsi insert/fetch di bawah menerima conn=... supaya ikut transaksi yang sama.
+    """
+    init_db()
+    conn = get_conn()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@contextmanager
+def _use(conn: Optional[sqlite3.Connection]) -> Iterator[sqlite3.Connection]:
+    """
+    Pakai conn dari session kalau ada (commit diurus session), kalau tidak buka koneksi sendiri.
+    """
+    if conn is not None:
+        yield conn
+        return
+    own = get_conn()
+    try:
+        yield own
+        own.commit()
+    finally:
+        own.close()
+
+def init_db(force: bool = False) -> None:
+    """
+    Buat schema kalau belum ada. Cukup sekali per proses (force=True untuk paksa ulang).
+    """
+    global _schema_ready
+    if _schema_ready and not force:
+        return
+    with _schema_lock:
+        if _schema_ready and not force:
+            return
+        _create_schema()
+        _schema_ready = True
+
+def _create_schema() -> None:
     conn = get_conn()
     cur = conn.cursor()
 
@@ -18,9 +124,12 @@ def init_db() -> None:
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         filename TEXT NOT NULL,
         stored_path TEXT NOT NULL,
-        uploaded_at TEXT DEFAULT (datetime('now','localtime'))
+        uploaded_at TEXT DEFAULT (datetime('now','localtime')),
+        digest TEXT
     )
     """)
+    # DB lama belum punya kolom digest (isi file PDF)
+    _ensure_column(conn, "pdf_files", "digest", "TEXT")
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS images (
@@ -33,81 +142,288 @@ def init_db() -> None:
         width INTEGER,
         height INTEGER,
         created_at TEXT DEFAULT (datetime('now','localtime')),
+        digest TEXT,
         FOREIGN KEY(pdf_id) REFERENCES pdf_files(id)
     )
     """)
+    # DB lama belum punya kolom digest
+    _ensure_column(conn, "images", "digest", "TEXT")
 
+    if is_legacy_schema(conn):
+        conn.close()
+        raise RuntimeError(
+            f"Database {DB_PATH} masih pakai schema lama (hash sebagai TEXT). "
+            "Jalankan migrasi dulu: py run.py migrate"
+        )
+
+    cur.execute(FINGERPRINTS_DDL.format(table="fingerprints"))
+
+    # Region hash (deteksi crop): 1 baris per fingerprint, semua region di-pack jadi 1 BLOB uint64
+    # little-endian (urutan window = fingerprint.region_windows). layout = grid + ukuran window.
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS fingerprints (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+    CREATE TABLE IF NOT EXISTS region_hashes (
+        fingerprint_id INTEGER PRIMARY KEY,
         image_id INTEGER NOT NULL,
-        phash TEXT NOT NULL,
-        dhash TEXT NOT NULL,
-        ehash TEXT NOT NULL,
-        FOREIGN KEY(image_id) REFERENCES images(id)
+        layout TEXT NOT NULL,
+        hashes BLOB NOT NULL,
+        FOREIGN KEY(fingerprint_id) REFERENCES fingerprints(id)
+    )
+    """)
+
+    # Manifest ingest folder: 1 baris per path file sumber, supaya run ulang hanya memproses
+    # file baru / berubah (size atau mtime beda) / yang sebelumnya gagal. status: 'done' | 'failed'
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_manifest (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        digest TEXT,
+        status TEXT NOT NULL,
+        pdf_id INTEGER,
+        error TEXT,
+        updated_at TEXT DEFAULT (datetime('now','localtime'))
     )
     """)
 
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_ehash ON fingerprints(ehash)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_phash ON fingerprints(phash)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_dhash ON fingerprints(dhash)")
+    # Matching pakai Hamming-distance di memory, jadi hash tidak perlu di-index di SQLite
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_image_id ON fingerprints(image_id)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_images_pdf_id ON images(pdf_id)")
+    # exact-match: gambar byte-identik langsung ketemu tanpa decode + hashing
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_images_digest ON images(digest)")
+    # fp_cache cek jumlah region per layout (backfill menulis fingerprint_id lama, di bawah high-water)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_region_hashes_layout ON region_hashes(layout)")
+    # PDF yang di-upload ulang persis sama langsung ketemu sebelum extract
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_pdf_files_digest ON pdf_files(digest)")
 
     conn.commit()
     conn.close()
 
-def insert_pdf(filename: str, stored_path: str) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO pdf_files(filename, stored_path) VALUES(?, ?)", (filename, stored_path))
-    conn.commit()
-    pdf_id = cur.lastrowid
-    conn.close()
-    return int(pdf_id)
+def insert_pdf(filename: str, stored_path: str, digest: Optional[str] = None,
+               conn: Optional[sqlite3.Connection] = None) -> int:
+    with _use(conn) as c:
+        cur = c.execute("INSERT INTO pdf_files(filename, stored_path, digest) VALUES(?, ?, ?)",
+                        (filename, stored_path, digest))
+        return int(cur.lastrowid)
 
-def insert_image(pdf_id: int, page: int, source: str, img_index: int, img_path: str, w: int, h: int) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO images(pdf_id, page, source, img_index, img_path, width, height)
-        VALUES(?,?,?,?,?,?,?)
-    """, (int(pdf_id), int(page), source, int(img_index), img_path, int(w), int(h)))
-    conn.commit()
-    image_id = cur.lastrowid
-    conn.close()
-    return int(image_id)
+def fetch_pdf_by_digest(digest: str, conn: Optional[sqlite3.Connection] = None) -> Optional[Tuple[int, str, str]]:
+    """
+    PDF yang sudah pernah di-ingest dengan isi file sama persis (lookup lewat index).
+    return: (pdf_id, filename, stored_path) atau None
+    """
+    with _use(conn) as c:
+        row = c.execute("""
+            SELECT id, filename, stored_path FROM pdf_files
+            WHERE digest = ?
+            ORDER BY id
+            LIMIT 1
+        """, (digest,)).fetchone()
+    if row is None:
+        return None
+    return int(row[0]), row[1], row[2]
 
-def insert_fingerprint(image_id: int, phash: str, dhash: str, ehash: str) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO fingerprints(image_id, phash, dhash, ehash)
-        VALUES(?,?,?,?)
-    """, (int(image_id), phash, dhash, ehash))
-    conn.commit()
-    conn.close()
+def fetch_manifest(conn: Optional[sqlite3.Connection] = None) -> Dict[str, Tuple[int, int, Optional[str], str]]:
+    """
+    Isi manifest ingest folder.
+    return: dict path -> (size, mtime_ns, digest, status)
+    """
+    with _use(conn) as c:
+        rows = c.execute("SELECT path, size, mtime_ns, digest, status FROM ingest_manifest").fetchall()
+    return {r[0]: (int(r[1]), int(r[2]), r[3], r[4]) for r in rows}
 
-def fetch_all_fingerprints() -> List[Tuple[int, int, str, str, str]]:
+def record_manifest(path: str, size: int, mtime_ns: int, status: str, digest: Optional[str] = None,
+                    pdf_id: Optional[int] = None, error: Optional[str] = None,
+                    conn: Optional[sqlite3.Connection] = None) -> None:
     """
-    return: list of (fingerprint_id, image_id, phash, dhash, ehash)
+    Catat hasil ingest 1 file sumber (baris lama untuk path yang sama ditimpa).
     """
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, image_id, phash, dhash, ehash FROM fingerprints")
-    rows = cur.fetchall()
-    conn.close()
-    return rows  # type: ignore
+    with _use(conn) as c:
+        c.execute("""
+            INSERT INTO ingest_manifest(path, size, mtime_ns, digest, status, pdf_id, error, updated_at)
+            VALUES(?, ?, ?, ?, ?, ?, ?, datetime('now','localtime'))
+            ON CONFLICT(path) DO UPDATE SET
+                size = excluded.size, mtime_ns = excluded.mtime_ns, digest = excluded.digest,
+                status = excluded.status, pdf_id = excluded.pdf_id, error = excluded.error,
+                updated_at = excluded.updated_at
+        """, (path, int(size), int(mtime_ns), digest, status, pdf_id, error))
 
-def fetch_image_info(image_id: int) -> Optional[Tuple]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT images.id, images.pdf_id, images.page, images.source, images.img_index, images.img_path,
-               pdf_files.filename
-        FROM images
-        JOIN pdf_files ON pdf_files.id = images.pdf_id
-        WHERE images.id = ?
-    """, (int(image_id),))
-    row = cur.fetchone()
-    conn.close()
-    return row
+def insert_image(pdf_id: int, page: int, source: str, img_index: int, img_path: str, w: int, h: int,
+                 digest: Optional[str] = None, conn: Optional[sqlite3.Connection] = None) -> int:
+    with _use(conn) as c:
+        cur = c.execute("""
+            INSERT INTO images(pdf_id, page, source, img_index, img_path, width, height, digest)
+            VALUES(?,?,?,?,?,?,?,?)
+        """, (int(pdf_id), int(page), source, int(img_index), img_path, int(w), int(h), digest))
+        return int(cur.lastrowid)
+
+def insert_fingerprint(image_id: int, phash, dhash, ehash, conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    phash/dhash/ehash: hex string (dari compute_hashes) atau int unsigned 64-bit.
+    """
+    with _use(conn) as c:
+        cur = c.execute("""
+            INSERT INTO fingerprints(image_id, phash, dhash, ehash)
+            VALUES(?,?,?,?)
+        """, (int(image_id), hash_to_db(phash), hash_to_db(dhash), hash_to_db(ehash)))
+        return int(cur.lastrowid)
+
+def _max_id(conn: sqlite3.Connection, table: str) -> int:
+    return int(conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0])
+
+def insert_images_with_fingerprints(pdf_id: int, items: Sequence[Tuple],
+                                    conn: Optional[sqlite3.Connection] = None) -> List[Tuple[int, Optional[int]]]:
+    """
+    Bulk insert semua image + fingerprint 1 PDF pakai executemany dalam 1 transaksi.
+    items: list of (page, source, img_index, img_path, w, h, digest, phash, dhash, ehash);
+           phash None = image tanpa fingerprint (kemunculan ulang xref yang sama)
+    return: list of (image_id, fingerprint_id atau None), urutannya sama dengan items
+    """
+    if not items:
+        return []
+    with _use(conn) as c:
+        if not c.in_transaction:
+            # ambil write lock di awal, jadi id yang dibuat pasti berurutan milik kita
+            c.execute("BEGIN IMMEDIATE")
+
+        img_start = _max_id(c, "images")
+        c.executemany("""
+            INSERT INTO images(pdf_id, page, source, img_index, img_path, width, height, digest)
+            VALUES(?,?,?,?,?,?,?,?)
+        """, [(int(pdf_id), int(page), source, int(img_index), str(img_path), int(w), int(h), digest)
+              for (page, source, img_index, img_path, w, h, digest, _, _, _) in items])
+        image_ids = [r[0] for r in c.execute(
+            "SELECT id FROM images WHERE id > ? ORDER BY id", (img_start,))]
+
+        with_fp = [(image_id, ph, dh, eh)
+                   for image_id, (*_, ph, dh, eh) in zip(image_ids, items) if ph is not None]
+        fp_start = _max_id(c, "fingerprints")
+        c.executemany("""
+            INSERT INTO fingerprints(image_id, phash, dhash, ehash)
+            VALUES(?,?,?,?)
+        """, [(image_id, hash_to_db(ph), hash_to_db(dh), hash_to_db(eh)) for image_id, ph, dh, eh in with_fp])
+        fp_by_image = {image_id: fp_id for fp_id, image_id in c.execute(
+            "SELECT id, image_id FROM fingerprints WHERE id > ? ORDER BY id", (fp_start,))}
+
+        return [(image_id, fp_by_image.get(image_id)) for image_id in image_ids]
+
+def fetch_all_fingerprints() -> List[Tuple[int, int, int, int, int]]:
+    """
+    return: list of (fingerprint_id, image_id, phash, dhash, ehash), hash sebagai int unsigned
+    """
+    return fetch_fingerprints_since(0)
+
+def fetch_fingerprints_since(last_id: int,
+                             conn: Optional[sqlite3.Connection] = None) -> List[Tuple[int, int, int, int, int]]:
+    """
+    Fingerprint dengan id > last_id (delta sejak high-water mark), urut id.
+    return: list of (fingerprint_id, image_id, phash, dhash, ehash), hash sebagai int unsigned
+    """
+    with _use(conn) as c:
+        cur = c.execute("""
+            SELECT id, image_id, phash, dhash, ehash FROM fingerprints
+            WHERE id > ?
+            ORDER BY id
+        """, (int(last_id),))
+        return [_fingerprint_row(r) for r in cur.fetchall()]
+
+def insert_region_hashes(rows: Sequence[Tuple[int, int, bytes]], layout: str,
+                         conn: Optional[sqlite3.Connection] = None) -> None:
+    """
+    rows: list of (fingerprint_id, image_id, hashes BLOB)
+    """
+    if not rows:
+        return
+    with _use(conn) as c:
+        c.executemany("""
+            INSERT OR REPLACE INTO region_hashes(fingerprint_id, image_id, layout, hashes)
+            VALUES(?,?,?,?)
+        """, [(int(fp_id), int(image_id), layout, blob) for fp_id, image_id, blob in rows])
+
+def fetch_region_hashes_since(last_fp_id: int, layout: str,
+                              conn: Optional[sqlite3.Connection] = None) -> List[Tuple[int, int, bytes]]:
+    """
+    Region hash untuk fingerprint_id > last_fp_id dengan layout yang sama, urut fingerprint_id.
+    return: list of (fingerprint_id, image_id, hashes BLOB)
+    """
+    with _use(conn) as c:
+        return c.execute("""
+            SELECT fingerprint_id, image_id, hashes FROM region_hashes
+            WHERE fingerprint_id > ? AND layout = ?
+            ORDER BY fingerprint_id
+        """, (int(last_fp_id), layout)).fetchall()
+
+def fetch_fingerprints_without_regions(layout: str, conn: Optional[sqlite3.Connection] = None) -> List[Tuple]:
+    """
+    Fingerprint yang belum punya region hash dengan layout ini (DB lama / layout diganti).
+    return: list of (fingerprint_id, image_id, img_path, pdf_stored_path, page, source, phash)
+    """
+    with _use(conn) as c:
+        rows = c.execute("""
+            SELECT fingerprints.id, images.id, images.img_path, pdf_files.stored_path,
+                   images.page, images.source, fingerprints.phash
+            FROM fingerprints
+            JOIN images ON images.id = fingerprints.image_id
+            JOIN pdf_files ON pdf_files.id = images.pdf_id
+            LEFT JOIN region_hashes ON region_hashes.fingerprint_id = fingerprints.id
+                                   AND region_hashes.layout = ?
+            WHERE region_hashes.fingerprint_id IS NULL
+            ORDER BY fingerprints.id
+        """, (layout,)).fetchall()
+    return [(*r[:6], hash_from_db(r[6])) for r in rows]
+
+def count_region_hashes(layout: str, conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    Jumlah baris region hash dengan layout ini (lewat idx_region_hashes_layout, tanpa baca BLOB).
+    """
+    with _use(conn) as c:
+        return int(c.execute("SELECT COUNT(*) FROM region_hashes WHERE layout = ?", (layout,)).fetchone()[0])
+
+def count_fingerprints(conn: Optional[sqlite3.Connection] = None) -> int:
+    with _use(conn) as c:
+        return int(c.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0])
+
+def fetch_by_digest(digest: str, conn: Optional[sqlite3.Connection] = None) -> Optional[Tuple]:
+    """
+    Fingerprint pertama untuk gambar dengan digest isi yang sama persis (lookup lewat index).
+    return: (fingerprint_id, image_id, phash, dhash, ehash, width, height) atau None
+    """
+    with _use(conn) as c:
+        row = c.execute("""
+            SELECT fingerprints.id, fingerprints.image_id, fingerprints.phash, fingerprints.dhash,
+                   fingerprints.ehash, images.width, images.height
+            FROM images
+            JOIN fingerprints ON fingerprints.image_id = images.id
+            WHERE images.digest = ?
+            ORDER BY fingerprints.id
+            LIMIT 1
+        """, (digest,)).fetchone()
+    if row is None:
+        return None
+    return _fingerprint_row(row[:5]) + (row[5], row[6])
+
+_IMAGE_INFO_SQL = """
+    SELECT images.id, images.pdf_id, images.page, images.source, images.img_index, images.img_path,
+           pdf_files.filename, pdf_files.stored_path, pdf_files.digest, images.digest
+    FROM images
+    JOIN pdf_files ON pdf_files.id = images.pdf_id
+"""
+
+def fetch_image_info(image_id: int, conn: Optional[sqlite3.Connection] = None) -> Optional[Tuple]:
+    with _use(conn) as c:
+        return c.execute(_IMAGE_INFO_SQL + " WHERE images.id = ?", (int(image_id),)).fetchone()
+
+def fetch_images_info(image_ids: Sequence[int], conn: Optional[sqlite3.Connection] = None) -> Dict[int, Tuple]:
+    """
+    Versi batch fetch_image_info (1 query untuk semua match 1 PDF).
+    return: {image_id: (images.id, pdf_id, page, source, img_index, img_path, pdf_filename, pdf_stored_path,
+                        pdf_digest, image_digest)}
+    """
+    ids = sorted({int(i) for i in image_ids})
+    out: Dict[int, Tuple] = {}
+    with _use(conn) as c:
+        # batas parameter SQLite (default 999 di versi lama)
+        for i in range(0, len(ids), 900):
+            chunk = ids[i:i + 900]
+            marks = ",".join("?" * len(chunk))
+            for row in c.execute(_IMAGE_INFO_SQL + f" WHERE images.id IN ({marks})", chunk):
+                out[int(row[0])] = row
+    return out
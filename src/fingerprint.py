@@ -1,8 +1,16 @@
+from io import BytesIO
+import hashlib
 from pathlib import Path
-from typing import Tuple
-from PIL import Image, ImageOps, ImageFilter
+from typing import List, Optional, Tuple, Union
+import numpy as np
+from PIL import Image, ImageOps, ImageFilter, ImageStat
 import imagehash
 
+from src.config import REGION_GRID, REGION_WINDOWS, REGION_MIN_STDDEV
+
+# Ukuran input hashing (semua gambar di-resize ke sini sebelum phash/dhash)
+HASH_INPUT_SIZE = 512
+
 def _normalize_gray(img: Image.Image) -> Image.Image:
     """
     Normalisasi untuk hashing supaya lebih stabil terhadap perubahan brightness/contrast.
@@ -10,33 +18,152 @@ def _normalize_gray(img: Image.Image) -> Image.Image:
     g = ImageOps.grayscale(img)
     g = ImageOps.autocontrast(g, cutoff=2)
     # Samakan ukuran agar konsisten (mengurangi efek scaling/anti-alias)
-    g = g.resize((512, 512))
+    g = g.resize((HASH_INPUT_SIZE, HASH_INPUT_SIZE))
     return g
 
+def _edge_from_normalized(g: Image.Image) -> Image.Image:
+    e = g.filter(ImageFilter.FIND_EDGES)
+    e = ImageOps.autocontrast(e, cutoff=2)
+    return e
+
 def _edge_image(img: Image.Image) -> Image.Image:
     """
     Buat edge-map (struktur) biar tahan beda warna/brightness.
     """
-    g = _normalize_gray(img)
-    e = g.filter(ImageFilter.FIND_EDGES)
-    e = ImageOps.autocontrast(e, cutoff=2)
-    return e
+    return _edge_from_normalized(_normalize_gray(img))
+
+def _decode_for_hashing(img: Image.Image) -> Image.Image:
+    """
+    Decode secukupnya untuk hashing. JPEG pakai draft mode: decoder langsung skala-turun (1/2, 1/4, 1/8)
+    ke ukuran >= HASH_INPUT_SIZE dan hanya channel luminance, jadi tidak decode full-res RGB.
+    """
+    # no-op untuk format selain JPEG, dan untuk image yang sudah ter-load (mis. hasil render)
+    img.draft("L", (HASH_INPUT_SIZE, HASH_INPUT_SIZE))
+    if img.mode not in ("L", "RGB"):
+        # mode lain (P, RGBA, CMYK, ...) lewat RGB dulu, sama seperti sebelumnya
+        img = img.convert("RGB")
+    return img
 
 def compute_hashes(image_path: Path) -> Tuple[str, str, str, int, int]:
     """
     return: (phash_hex, dhash_hex, ehash_hex, width, height)
     """
-    img = Image.open(image_path).convert("RGB")
+    return compute_hashes_from_image(Image.open(image_path))
+
+def compute_hashes_from_data(data: Union[bytes, Image.Image]) -> Tuple[str, str, str, int, int]:
+    """
+    Sama dengan compute_hashes, tapi langsung dari bytes gambar (embedded) atau PIL image (render),
+    tanpa baca/tulis file.
+    """
+    if isinstance(data, bytes):
+        data = Image.open(BytesIO(data))
+    return compute_hashes_from_image(data)
+
+def compute_hashes_from_image(img: Image.Image) -> Tuple[str, str, str, int, int]:
+    return compute_hashes_with_regions(img, regions=False)[:5]
+
+def compute_hashes_with_regions(data: Union[bytes, Image.Image], regions: bool = True
+                                ) -> Tuple[str, str, str, int, int, Optional[np.ndarray]]:
+    """
+    Sama dengan compute_hashes_from_data, plus region hash (lihat compute_region_hashes)
+    dari buffer normalisasi yang sama, jadi gambar tidak di-decode 2x.
+    return: (phash_hex, dhash_hex, ehash_hex, width, height, region_hashes atau None)
+    """
+    img = Image.open(BytesIO(data)) if isinstance(data, bytes) else data
+    # ukuran asli dicatat sebelum draft mengecilkan gambar
     w, h = img.size
+    img = _decode_for_hashing(img)
 
+    # normalisasi sekali, phash/dhash/edge-hash diturunkan dari buffer yang sama
     g = _normalize_gray(img)
-    e = _edge_image(img)
+    e = _edge_from_normalized(g)
 
     ph = imagehash.phash(g)
     dh = imagehash.dhash(g)
     eh = imagehash.phash(e)  # edge-hash
 
-    return str(ph), str(dh), str(eh), w, h
+    return str(ph), str(dh), str(eh), w, h, compute_region_hashes(g) if regions else None
+
+# Sisi gambar kecil tempat region di-crop: 16 px per sel grid, cukup untuk dhash 9x8 per window
+_REGION_CELL_PX = 16
+
+def region_windows(grid: int = REGION_GRID, windows: Tuple[int, ...] = REGION_WINDOWS
+                   ) -> List[Tuple[int, int, int]]:
+    """
+    Daftar window (x, y, size) dalam satuan sel grid: gambar penuh dulu, lalu tiap ukuran di
+    REGION_WINDOWS digeser 1 sel (row-major). Urutan ini = urutan kolom di region_hashes.
+    """
+    out = [(0, 0, grid)]
+    for size in windows:
+        for y in range(grid - size + 1):
+            for x in range(grid - size + 1):
+                out.append((x, y, size))
+    return out
+
+def region_layout() -> str:
+    """
+    Identitas layout region (grid + ukuran window); region hash dengan layout lain tidak sebanding.
+    """
+    return f"{REGION_GRID}:{','.join(str(s) for s in REGION_WINDOWS)}"
+
+def compute_region_hashes(g: Image.Image) -> np.ndarray:
+    """
+    dhash 64-bit per window yang saling overlap (lihat region_windows), untuk deteksi crop:
+    gambar hasil crop kira-kira sama dengan salah satu window gambar aslinya (dan sebaliknya).
+    g: grayscale yang sudah dinormalisasi (_normalize_gray).
+    return: array uint64; 0 = window polos (tidak informatif, tidak di-index)
+    """
+    side = REGION_GRID * _REGION_CELL_PX
+    small = g.resize((side, side))
+    wins = region_windows()
+    out = np.zeros(len(wins), dtype=np.uint64)
+    for k, (x, y, size) in enumerate(wins):
+        box = (x * _REGION_CELL_PX, y * _REGION_CELL_PX,
+               (x + size) * _REGION_CELL_PX, (y + size) * _REGION_CELL_PX)
+        tile = small.crop(box)
+        if ImageStat.Stat(tile).stddev[0] < REGION_MIN_STDDEV:
+            continue
+        out[k] = hash_to_int(str(imagehash.dhash(tile)))
+    return out
+
+def content_digest(data: Union[bytes, Image.Image]) -> str:
+    """
+    Digest cepat isi gambar (stream bytes asli, atau pixel hasil render) untuk exact-match.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(data, bytes):
+        h.update(data)
+    else:
+        h.update(f"{data.mode}:{data.size[0]}x{data.size[1]}:".encode())
+        h.update(data.tobytes())
+    return h.hexdigest()
+
+def file_digest(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Digest isi file (dibaca per chunk), untuk deteksi PDF yang di-upload ulang persis sama.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def hash_to_hex(h) -> str:
+    """
+    int unsigned 64-bit -> hex string (format yang sama dengan str(imagehash) 8x8).
+    """
+    if isinstance(h, str):
+        return h
+    return f"{int(h):016x}"
 
 def hamming_hex(hash1: str, hash2: str) -> int:
     return imagehash.hex_to_hash(hash1) - imagehash.hex_to_hash(hash2)
+
+def hash_to_int(h) -> int:
+    """
+    Hash 64-bit (hex string dari imagehash, atau int) -> int unsigned.
+    Urutan bit sama dengan hex_to_hash, jadi popcount(a ^ b) == hamming_hex(a, b).
+    """
+    if isinstance(h, str):
+        return int(h, 16)
+    return int(h)
@@ -0,0 +1,116 @@
+import threading
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from src.config import FP_SNAPSHOT
+from src.db import fetch_fingerprints_since, fetch_region_hashes_since, count_region_hashes
+from src.fingerprint import region_layout
+from src.fp_snapshot import open_snapshot
+from src.matcher import FingerprintIndex
+from src.region_index import RegionIndex
+
+# Cache fingerprint level proses: load sekali, lalu hanya ambil delta.
+# _high_water = id fingerprint terbesar yang sudah ada di cache (semua id <= ini sudah dimuat).
+# Kalau ada snapshot (fp_snapshot), load awal = memmap snapshot + delta dari SQLite setelahnya.
+_lock = threading.RLock()
+_index: Optional[FingerprintIndex] = None
+_high_water = 0
+# Region index (deteksi crop) punya high-water sendiri: tidak semua fingerprint punya region hash.
+# Backfill (py run.py regions) mengisi fingerprint lama di bawah high-water, jadi jumlah baris
+# juga dicek: kalau DB punya lebih banyak dari yang dimuat, index dibangun ulang.
+_regions: Optional[RegionIndex] = None
+_region_high_water = 0
+_region_rows = 0
+
+
+def _refresh() -> None:
+    global _index, _high_water
+    if _index is None:
+        snap = open_snapshot() if FP_SNAPSHOT else None
+        if snap is not None:
+            columns, _high_water = snap
+            _index = FingerprintIndex(base=columns)
+        else:
+            _index = FingerprintIndex()
+    rows = fetch_fingerprints_since(_high_water)
+    if rows:
+        _index.extend(rows)
+        _high_water = int(rows[-1][0])
+
+
+def get_fingerprint_index() -> FingerprintIndex:
+    """
+    Index fingerprint seluruh DB. Panggilan pertama load semua baris,
+    panggilan berikutnya hanya membaca baris baru (termasuk yang ditulis proses lain).
+    """
+    with _lock:
+        _refresh()
+        return _index  # type: ignore
+
+
+def add_fingerprints(rows: Iterable[Tuple]) -> None:
+    """
+    Tambahkan baris yang baru saja di-insert proses ini, tanpa baca ulang dari DB.
+    rows: (fingerprint_id, image_id, phash, dhash, ehash), urut id.
+    """
+    global _high_water
+    rows = list(rows)
+    if not rows:
+        return
+    with _lock:
+        if _index is None:
+            # belum pernah load; biar get_fingerprint_index yang load semuanya nanti
+            return
+        if int(rows[0][0]) == _high_water + 1 and all(
+            int(b[0]) == int(a[0]) + 1 for a, b in zip(rows, rows[1:])
+        ):
+            _index.extend(rows)
+            _high_water = int(rows[-1][0])
+        else:
+            # ada celah id (proses lain ikut menulis) -> ambil delta dari DB supaya urutan tetap benar
+            _refresh()
+
+
+def get_region_index() -> RegionIndex:
+    """
+    Inverted index region hash seluruh DB, di-load sekali lalu hanya delta (fingerprint_id > high-water);
+    di-load ulang kalau ada baris baru di bawah high-water (backfill).
+    """
+    global _regions, _region_high_water, _region_rows
+    layout = region_layout()
+    with _lock:
+        rows = fetch_region_hashes_since(_region_high_water, layout) if _regions is not None else []
+        if _regions is None or count_region_hashes(layout) != _region_rows + len(rows):
+            # load pertama, atau ada baris di bawah high-water / baris diganti layout lain: muat ulang semua
+            _regions = RegionIndex()
+            _region_high_water = 0
+            _region_rows = 0
+            rows = fetch_region_hashes_since(0, layout)
+        if rows:
+            _regions.extend((fp_id, image_id, np.frombuffer(blob, dtype="<u8"))
+                            for fp_id, image_id, blob in rows)
+            _region_high_water = int(rows[-1][0])
+            _region_rows += len(rows)
+        return _regions
+
+
+def loaded_size() -> Optional[int]:
+    """
+    Jumlah fingerprint di cache tanpa refresh (None kalau cache belum pernah di-load).
+    """
+    with _lock:
+        return len(_index) if _index is not None else None
+
+
+def reset_cache() -> None:
+    """
+    Buang cache (misal setelah DB diganti/di-migrate). Load ulang saat dipakai lagi.
+    """
+    global _index, _high_water, _regions, _region_high_water, _region_rows
+    with _lock:
+        _index = None
+        _high_water = 0
+        _regions = None
+        _region_high_water = 0
+        _region_rows = 0
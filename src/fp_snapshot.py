@@ -0,0 +1,225 @@
+"""
+Snapshot fingerprint biner di samping storage/app.db, untuk cold start cepat.
+
+Format file storage/fingerprints-<max_fp_id>.snap (little-endian):
+  header 64 byte: magic "PDFDUPFP", versi (u32), padding (u32), jumlah baris (u64), max fingerprint_id (i64),
+                  min fingerprint_id (i64), checksum sampel baris (u64)
+  lalu 5 kolom fixed-width berurutan, masing-masing n x 8 byte:
+  fp_ids (i64), image_ids (i64), phash (u64), dhash (u64), ehash (u64)
+
+Kolom dibuka dengan numpy.memmap (read-only), jadi semua proses (CLI, worker FastAPI, session
+Streamlit) berbagi page yang sama lewat OS cache, tanpa copy per proses. Baris yang ditambahkan
+setelah snapshot ditulis dibaca dari SQLite sebagai delta (lihat fp_cache).
+
+Saat dibuka, snapshot dicek ke DB: jumlah + min/max id, dan checksum (id, phash, dhash, ehash)
+dari SAMPLE_ROWS baris yang tersebar rata. DB yang di-restore / diganti dengan jumlah baris sama
+tapi isi beda tidak lolos, jadi matcher tidak pernah memakai fingerprint basi.
+
+Snapshot baru selalu ditulis ke file baru (nama berisi max id), jadi proses yang masih memakai
+snapshot lama tidak terganggu; file lama dihapus kalau sudah tidak dipakai.
+
+Jalankan dari root repo (rebuild / compact: delta digabung ke snapshot baru):
+  py run.py snapshot
+"""
+import struct
+from hashlib import blake2b
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from src.config import STORAGE_DIR
+from src.db import get_conn, init_db, count_fingerprints
+from src.matcher import Columns
+
+MAGIC = b"PDFDUPFP"
+VERSION = 2
+HEADER = struct.Struct("<8sIIQqqQ")
+HEADER_SIZE = 64
+COLUMN_DTYPES = ("<i8", "<i8", "<u8", "<u8", "<u8")  # fp_ids, image_ids, phash, dhash, ehash
+SNAPSHOT_GLOB = "fingerprints-*.snap"
+BATCH_SIZE = 100_000
+SAMPLE_ROWS = 1024
+
+
+def snapshot_path(max_fp_id: int, storage_dir: Path = STORAGE_DIR) -> Path:
+    return storage_dir / f"fingerprints-{max_fp_id:012d}.snap"
+
+
+def list_snapshots(storage_dir: Path = STORAGE_DIR) -> List[Path]:
+    """
+    Semua file snapshot, terbaru (max id terbesar) dulu.
+    """
+    return sorted(storage_dir.glob(SNAPSHOT_GLOB), reverse=True)
+
+
+def _read_header(path: Path) -> Optional[Tuple[int, int, int, int]]:
+    """
+    return: (jumlah baris, max_fp_id, min_fp_id, checksum), atau None kalau bukan snapshot versi ini
+    """
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        return None
+    magic, version, _, n, max_fp_id, min_fp_id, checksum = HEADER.unpack(raw)
+    if magic != MAGIC or version != VERSION:
+        return None
+    if path.stat().st_size != HEADER_SIZE + 8 * len(COLUMN_DTYPES) * n:
+        return None
+    return n, max_fp_id, min_fp_id, checksum
+
+
+def _sample_positions(n: int) -> np.ndarray:
+    return np.unique(np.linspace(0, n - 1, min(n, SAMPLE_ROWS)).astype(np.int64))
+
+
+def _checksum(rows: np.ndarray) -> int:
+    """
+    rows: int64 (k, 4) = (id, phash, dhash, ehash) dalam representasi SQLite (signed), urut id.
+    """
+    return int.from_bytes(blake2b(np.ascontiguousarray(rows, dtype="<i8").tobytes(), digest_size=8).digest(),
+                          "little")
+
+
+def _db_sample_checksum(conn, fp_ids: Sequence[int]) -> Optional[int]:
+    """
+    Checksum baris DB dengan id ini; None kalau ada id yang tidak ada lagi di DB.
+    """
+    ids = [int(i) for i in fp_ids]
+    rows = []
+    for i in range(0, len(ids), 900):
+        chunk = ids[i:i + 900]
+        marks = ",".join("?" * len(chunk))
+        rows.extend(conn.execute(f"SELECT id, phash, dhash, ehash FROM fingerprints WHERE id IN ({marks}) "
+                                 "ORDER BY id", chunk).fetchall())
+    if len(rows) != len(ids):
+        return None
+    return _checksum(np.array(rows, dtype=np.int64).reshape(-1, 4))
+
+
+def _matches_db(conn, path: Path, header: Tuple[int, int, int, int]) -> bool:
+    """
+    Snapshot masih sama dengan DB: jumlah + min/max id baris id <= max_fp_id sama, dan checksum sampel
+    baris dari DB sama dengan yang dicatat di header.
+    """
+    n, max_fp_id, min_fp_id, checksum = header
+    in_db = conn.execute("SELECT COUNT(*), MIN(id), MAX(id) FROM fingerprints WHERE id <= ?",
+                         (max_fp_id,)).fetchone()
+    if tuple(int(v or 0) for v in in_db) != (n, min_fp_id, max_fp_id):
+        return False
+    fp_ids = np.memmap(path, dtype=COLUMN_DTYPES[0], mode="r", offset=HEADER_SIZE, shape=(n,))
+    sample = np.array(fp_ids[_sample_positions(n)])
+    del fp_ids  # jangan tahan map file (Windows: file yang di-map tidak bisa di-rename/hapus)
+    return _db_sample_checksum(conn, sample) == checksum
+
+
+def open_snapshot(storage_dir: Path = STORAGE_DIR) -> Optional[Tuple[Columns, int]]:
+    """
+    Buka snapshot terbaru yang masih cocok dengan DB (lihat _matches_db;
+    DB diganti / di-restore / dari mesin lain -> snapshot diabaikan).
+    return: (kolom memmap read-only, max_fp_id), atau None kalau tidak ada snapshot yang valid
+    """
+    for path in list_snapshots(storage_dir):
+        header = _read_header(path)
+        if header is None or header[0] == 0:
+            continue
+        conn = get_conn()
+        try:
+            ok = _matches_db(conn, path, header)
+        finally:
+            conn.close()
+        if not ok:
+            continue
+        n, max_fp_id = header[0], header[1]
+        columns = tuple(np.memmap(path, dtype=dt, mode="r", offset=HEADER_SIZE + 8 * c * n, shape=(n,))
+                        for c, dt in enumerate(COLUMN_DTYPES))
+        return columns, max_fp_id  # type: ignore
+    return None
+
+
+def _fill_columns(path: Path, n: int, cur) -> int:
+    """
+    Isi kolom file snapshot dari cursor (id, image_id, phash, dhash, ehash) urut id, per batch.
+    Memmap ditutup saat fungsi selesai (Windows tidak bisa rename file yang masih di-map).
+    return: checksum sampel baris (lihat open_snapshot)
+    """
+    columns = [np.memmap(path, dtype=dt, mode="r+", offset=HEADER_SIZE + 8 * c * n, shape=(n,))
+               for c, dt in enumerate(COLUMN_DTYPES)]
+    pos = 0
+    while True:
+        rows = cur.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        # hash di SQLite = int signed 64-bit; view sebagai uint64 = hash_from_db tanpa loop python
+        block = np.array(rows, dtype=np.int64)
+        k = len(block)
+        for c, col in enumerate(columns):
+            col[pos:pos + k] = np.ascontiguousarray(block[:, c]).view(col.dtype)
+        pos += k
+    for col in columns:
+        col.flush()
+    # checksum sampel dari kolom yang baru ditulis (= isi DB di transaksi baca yang sama)
+    sample = _sample_positions(n)
+    return _checksum(np.stack([columns[0][sample]] + [col[sample].view("<i8") for col in columns[2:]], axis=1))
+
+
+def write_snapshot(storage_dir: Path = STORAGE_DIR) -> Tuple[Optional[Path], int]:
+    """
+    Tulis snapshot baru berisi semua fingerprint di DB (dibaca dalam 1 transaksi baca, per batch),
+    lalu hapus snapshot lama yang sudah tidak dipakai proses lain.
+    return: (path snapshot, jumlah baris); path None kalau DB belum punya fingerprint
+    """
+    init_db()
+    conn = get_conn()
+    try:
+        # 1 read transaction: jumlah baris & isi konsisten walau ada ingest yang sedang jalan
+        conn.execute("BEGIN")
+        n, min_fp_id, max_fp_id = conn.execute(
+            "SELECT COUNT(*), COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM fingerprints").fetchone()
+        n, min_fp_id, max_fp_id = int(n), int(min_fp_id), int(max_fp_id)
+        if n == 0:
+            return None, 0
+
+        final_path = snapshot_path(max_fp_id, storage_dir)
+        header = _read_header(final_path) if final_path.exists() else None
+        if header is not None and header[0] == n and _matches_db(conn, final_path, header):
+            # tidak ada baris baru sejak snapshot terakhir
+            return final_path, n
+        tmp_path = final_path.with_name(f"{final_path.name}.{uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.truncate(HEADER_SIZE + 8 * len(COLUMN_DTYPES) * n)
+
+        cur = conn.execute("SELECT id, image_id, phash, dhash, ehash FROM fingerprints WHERE id <= ? ORDER BY id",
+                           (max_fp_id,))
+        checksum = _fill_columns(tmp_path, n, cur)
+        conn.rollback()
+        # header terakhir: file yang terputus di tengah tidak punya magic, jadi tidak pernah dibuka
+        with open(tmp_path, "r+b") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, n, max_fp_id, min_fp_id, checksum).ljust(HEADER_SIZE, b"\0"))
+    finally:
+        conn.close()
+
+    tmp_path.replace(final_path)
+    for old in list_snapshots(storage_dir):
+        if old != final_path:
+            try:
+                old.unlink()
+            except OSError:
+                # masih di-mmap proses lain (Windows): dihapus di rebuild berikutnya
+                pass
+    return final_path, n
+
+
+def main():
+    path, n = write_snapshot()
+    if path is None:
+        print("DB belum punya fingerprint, snapshot tidak dibuat.")
+        return
+    total = count_fingerprints()
+    print(f"Snapshot {path}: {n} fingerprint ({path.stat().st_size / 1e6:.1f} MB), "
+          f"delta saat ini: {total - n} baris.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+from itertools import combinations
+from typing import Dict, List, Optional
+import numpy as np
+
+CHUNKS = 4
+CHUNK_BITS = 16
+_CHUNK_MASK = np.uint64((1 << CHUNK_BITS) - 1)
+
+# Entry baru ditampung dulu di "pending" (dicek linear), lalu digabung ke array sorted
+# kalau sudah sebanyak ini. Jadi insert tetap murah, dan sort tidak terjadi tiap insert.
+MERGE_PENDING_AT = 4096
+
+_probe_cache: Dict[int, np.ndarray] = {}
+
+
+if hasattr(np, "bitwise_count"):
+    def popcount64(x: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(x)
+else:  # numpy < 2.0
+    _POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount64(x: np.ndarray) -> np.ndarray:
+        x = np.ascontiguousarray(x, dtype=np.uint64)
+        b = x.view(np.uint8).reshape(x.shape + (8,))
+        return _POPCOUNT8[b].sum(axis=-1, dtype=np.uint8)
+
+
+def probe_masks(radius: int) -> np.ndarray:
+    """
+    Semua mask 16-bit dengan jumlah bit 1 <= radius (termasuk 0).
+    """
+    if radius not in _probe_cache:
+        masks: List[int] = []
+        for k in range(radius + 1):
+            for bits in combinations(range(CHUNK_BITS), k):
+                m = 0
+                for b in bits:
+                    m |= 1 << b
+                masks.append(m)
+        _probe_cache[radius] = np.array(masks, dtype=np.uint16)
+    return _probe_cache[radius]
+
+
+def unique_sorted(positions: np.ndarray) -> np.ndarray:
+    """
+    Seperti np.unique, tapi pakai sort biasa (lebih cepat untuk array int kecil-menengah).
+    """
+    if len(positions) == 0:
+        return positions
+    positions = np.sort(positions)
+    keep = np.empty(len(positions), dtype=bool)
+    keep[0] = True
+    np.not_equal(positions[1:], positions[:-1], out=keep[1:])
+    return positions[keep]
+
+
+def _chunk(values: np.ndarray, c: int) -> np.ndarray:
+    return ((values >> np.uint64(c * CHUNK_BITS)) & _CHUNK_MASK).astype(np.uint16)
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing untuk hash 64-bit.
+
+    Hash dipecah jadi 4 substring 16-bit, tiap substring punya tabel sorted (key -> posisi).
+    Kalau hamming(a, b) <= r, minimal satu substring punya jarak <= r // 4 (pigeonhole),
+    jadi cukup probe key yang berjarak <= r // 4 di tiap tabel, tanpa menyentuh semua baris.
+    Hasilnya superset kandidat; jarak penuh tetap harus dicek oleh pemanggil.
+    """
+
+    def __init__(self):
+        self._keys = [np.empty(0, dtype=np.uint16) for _ in range(CHUNKS)]
+        self._pos = [np.empty(0, dtype=np.int64) for _ in range(CHUNKS)]
+        self._pending_values: List[np.ndarray] = []
+        self._pending_pos: List[np.ndarray] = []
+        self._n_pending = 0
+
+    def __len__(self) -> int:
+        return len(self._pos[0]) + self._n_pending
+
+    def add_many(self, values: np.ndarray, positions: np.ndarray) -> None:
+        if len(values) == 0:
+            return
+        self._pending_values.append(np.asarray(values, dtype=np.uint64))
+        self._pending_pos.append(np.asarray(positions, dtype=np.int64))
+        self._n_pending += len(values)
+        if self._n_pending >= MERGE_PENDING_AT:
+            self._merge()
+
+    def _merge(self) -> None:
+        if not self._n_pending:
+            return
+        values = np.concatenate(self._pending_values)
+        positions = np.concatenate(self._pending_pos)
+        for c in range(CHUNKS):
+            keys = np.concatenate([self._keys[c], _chunk(values, c)])
+            pos = np.concatenate([self._pos[c], positions])
+            # stable: posisi dengan key sama tetap urut insert
+            order = np.argsort(keys, kind="stable")
+            self._keys[c] = keys[order]
+            self._pos[c] = pos[order]
+        self._pending_values, self._pending_pos, self._n_pending = [], [], 0
+
+    def candidates(self, value: int, max_dist: int, max_bucket: Optional[int] = None) -> np.ndarray:
+        """
+        return: posisi (sorted, unik) yang mungkin berjarak <= max_dist dari value
+        max_bucket: lewati key yang isinya lebih dari ini (stop-word di inverted index), supaya
+                    biaya 1 probe tidak ikut tumbuh dengan corpus; hasilnya bukan superset lagi.
+        """
+        value = np.uint64(value)
+        masks = probe_masks(max_dist // CHUNKS)
+        found: List[np.ndarray] = []
+
+        for c in range(CHUNKS):
+            keys = self._keys[c]
+            if len(keys) == 0:
+                break
+            probes = _chunk(value, c) ^ masks
+            lo = np.searchsorted(keys, probes, side="left")
+            hi = np.searchsorted(keys, probes, side="right")
+            lengths = hi - lo
+            if max_bucket is not None:
+                lengths = np.where(lengths > max_bucket, 0, lengths)
+            total = int(lengths.sum())
+            if total:
+                # gabungkan semua slice [lo, hi) tanpa loop python
+                starts = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+                found.append(self._pos[c][starts + np.arange(total)])
+
+        if self._n_pending:
+            # pending masih sedikit, cek jarak penuh secara linear
+            values = np.concatenate(self._pending_values)
+            positions = np.concatenate(self._pending_pos)
+            found.append(positions[popcount64(values ^ value) <= max_dist])
+
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return unique_sorted(np.concatenate(found))
@@ -1,9 +1,18 @@
 from pathlib import Path
-from typing import List, Dict, Any
-import sys
+from typing import List, Dict, Any, Iterator, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import argparse
 import traceback
 
-from ingest_pdf import ingest_pdf, print_report
+from src.config import INGEST_WORKERS
+from src.db import init_db, fetch_manifest, record_manifest
+from src.ingest_pdf import ingest_pdf, prepare_pdf, commit_pdf, discard_prepared, discard_stored_pdf, print_report
+
+# (pdf_path, report atau None, error atau None)
+Outcome = Tuple[Path, Optional[Dict[str, Any]], Optional[BaseException]]
+# (size, mtime_ns) file sumber saat run dimulai
+FileStat = Tuple[int, int]
 
 
 def find_pdfs(folder: Path, recursive: bool = True) -> List[Path]:
@@ -12,6 +21,45 @@ def find_pdfs(folder: Path, recursive: bool = True) -> List[Path]:
     return sorted(folder.glob("*.pdf"))
 
 
+def manifest_key(pdf_path: Path) -> str:
+    return str(pdf_path.resolve())
+
+
+def plan_pdfs(pdfs: List[Path], rescan: bool = False) -> Tuple[List[Path], Dict[Path, FileStat], int]:
+    """
+    Bandingkan file di folder dengan manifest di DB: file yang sudah 'done' dengan size & mtime sama
+    dilewati tanpa dibaca. File baru, berubah, atau yang sebelumnya gagal diproses (lagi).
+    rescan: abaikan manifest (semua file diproses; PDF yang isinya sudah ada tetap tidak masuk DB dua kali).
+    return: (pdf yang perlu diproses, stat per pdf, jumlah yang dilewati)
+    """
+    init_db()
+    manifest = {} if rescan else fetch_manifest()
+    todo: List[Path] = []
+    stats: Dict[Path, FileStat] = {}
+    for pdf_path in pdfs:
+        st = pdf_path.stat()
+        stats[pdf_path] = (st.st_size, st.st_mtime_ns)
+        prior = manifest.get(manifest_key(pdf_path))
+        if prior is not None and prior[3] == "done" and prior[:2] == stats[pdf_path]:
+            continue
+        todo.append(pdf_path)
+    return todo, stats, len(pdfs) - len(todo)
+
+
+def record_outcome(pdf_path: Path, stat: FileStat, report: Optional[Dict[str, Any]],
+                   error: Optional[BaseException]) -> None:
+    """
+    Tulis hasil 1 file ke manifest (stat yang diambil sebelum ingest, jadi file yang berubah
+    selama run tetap diproses ulang di run berikutnya).
+    """
+    if error is None:
+        pdf_id = report.get("existing_pdf_id") if report.get("already_ingested") else report.get("pdf_id")
+        record_manifest(manifest_key(pdf_path), *stat, status="done", digest=report.get("pdf_digest"),
+                        pdf_id=pdf_id)
+    else:
+        record_manifest(manifest_key(pdf_path), *stat, status="failed", error=f"{type(error).__name__}: {error}")
+
+
 def summarize_report(report: Dict[str, Any]) -> Dict[str, int]:
     """
     Mengembalikan ringkasan sederhana dari 1 report ingest:
@@ -26,15 +74,65 @@ def summarize_report(report: Dict[str, Any]) -> Dict[str, int]:
     return {"num_images": num_images, "num_dup": num_dup, "num_new": num_new}
 
 
-def main():
-    if len(sys.argv) < 2:
-        print('Usage: py src\\ingest_folder.py "D:\\DatasetPDF" [--no-recursive]')
-        raise SystemExit(1)
+def _ingest_sequential(pdfs: List[Path], render_workers: Optional[int] = None) -> Iterator[Outcome]:
+    for pdf_path in pdfs:
+        try:
+            yield pdf_path, ingest_pdf(pdf_path, render_workers=render_workers), None
+        except Exception as e:
+            yield pdf_path, None, e
+
+
+def _ingest_parallel(pdfs: List[Path], workers: int) -> Iterator[Outcome]:
+    """
+    Extract + hashing di process pool, matching + tulis DB tetap di proses ini (single writer).
+    Hasil di-commit sesuai urutan input, jadi report & DUP/NEW sama dengan mode sequential.
+    Worker menyalin PDF ke storage/pdfs bersamaan; nama file per digest isi (ingest_pdf.stored_pdf_name),
+    jadi PDF bernama sama dari subfolder berbeda tidak saling timpa.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: deque = deque()
+        it = iter(pdfs)
+
+        def submit_next() -> None:
+            pdf_path = next(it, None)
+            if pdf_path is not None:
+                pending.append((pdf_path, pool.submit(prepare_pdf, pdf_path)))
+
+        # batasi jumlah PDF yang sudah di-prepare tapi belum di-commit (memory & disk staging)
+        for _ in range(workers * 2):
+            submit_next()
+
+        while pending:
+            pdf_path, fut = pending.popleft()
+            submit_next()
+            try:
+                prepared = fut.result()
+            except Exception as e:
+                yield pdf_path, None, e
+                continue
+            try:
+                yield pdf_path, commit_pdf(prepared), None
+            except Exception as e:
+                discard_prepared(prepared)
+                discard_stored_pdf(prepared)
+                yield pdf_path, None, e
 
-    folder = Path(sys.argv[1])
-    recursive = True
-    if len(sys.argv) >= 3 and sys.argv[2].strip().lower() == "--no-recursive":
-        recursive = False
+
+def main():
+    ap = argparse.ArgumentParser(description="Ingest semua PDF dalam folder")
+    ap.add_argument("folder", help='contoh: "D:\\DatasetPDF"')
+    ap.add_argument("--no-recursive", action="store_true", help="jangan masuk ke subfolder")
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                    help="jumlah process untuk extract + hashing (default: %(default)s = sequential)")
+    ap.add_argument("--render-workers", type=int, default=None,
+                    help="process untuk render halaman PDF scan di mode sequential (default: RENDER_WORKERS)")
+    ap.add_argument("--rescan", action="store_true",
+                    help="abaikan manifest: proses ulang semua file (PDF yang sudah ada tetap tidak dobel)")
+    args = ap.parse_args()
+
+    folder = Path(args.folder)
+    recursive = not args.no_recursive
+    workers = max(1, args.workers)
 
     if not folder.exists() or not folder.is_dir():
         print(f"Folder tidak ditemukan / bukan folder: {folder}")
@@ -45,7 +143,10 @@ def main():
         print(f"Tidak ada file .pdf di folder: {folder}")
         return
 
-    print(f"Menemukan {len(pdfs)} PDF di: {folder} (recursive={recursive})")
+    found = len(pdfs)
+    pdfs, stats, unchanged = plan_pdfs(pdfs, rescan=args.rescan)
+    print(f"Menemukan {found} PDF di: {folder} (recursive={recursive}, workers={workers})")
+    print(f"Sudah di-ingest & tidak berubah (manifest): {unchanged}, diproses: {len(pdfs)}")
     print("=" * 70)
 
     success = 0
@@ -53,15 +154,26 @@ def main():
     total_images = 0
     total_dup = 0
     total_new = 0
+    reused = 0
 
     failed_files: List[str] = []
 
-    for i, pdf_path in enumerate(pdfs, start=1):
+    if workers > 1:
+        outcomes = _ingest_parallel(pdfs, workers)
+    else:
+        outcomes = _ingest_sequential(pdfs, args.render_workers)
+
+    for i, (pdf_path, report, error) in enumerate(outcomes, start=1):
         print(f"\n[{i}/{len(pdfs)}] Ingest: {pdf_path}")
-        try:
-            report = ingest_pdf(pdf_path)
+        record_outcome(pdf_path, stats[pdf_path], report, error)
+        if error is None:
             # Optional: tampilkan report per file (bisa kamu matikan kalau kebanyakan output)
             print_report(report)
+            if report.get("already_ingested"):
+                # PDF identik dengan yang sudah ada di DB: tidak ada image baru
+                success += 1
+                reused += 1
+                continue
 
             s = summarize_report(report)
             success += 1
@@ -69,21 +181,24 @@ def main():
             total_dup += s["num_dup"]
             total_new += s["num_new"]
 
-        except Exception as e:
+        else:
             failed += 1
             failed_files.append(str(pdf_path))
             print("!! GAGAL ingest PDF ini:")
-            print(f"   {e}")
+            print(f"   {error}")
             # supaya tetap stable, kita lanjut file berikutnya
             # kalau mau log detail stacktrace:
-            traceback.print_exc()
+            traceback.print_exception(type(error), error, error.__traceback__)
 
     print("\n" + "=" * 70)
     print("RINGKASAN INGEST FOLDER")
     print(f"Folder          : {folder}")
-    print(f"Total PDF        : {len(pdfs)}")
+    print(f"Total PDF        : {found}")
+    print(f"Tidak berubah    : {unchanged}")
+    print(f"Diproses         : {len(pdfs)}")
     print(f"Sukses           : {success}")
     print(f"Gagal            : {failed}")
+    print(f"Sudah ada (skip) : {reused}")
     print(f"Total images     : {total_images}")
     print(f"Total DUP        : {total_dup}")
     print(f"Total NEW        : {total_new}")
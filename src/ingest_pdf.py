@@ -1,87 +1,402 @@
 from pathlib import Path
+from uuid import uuid4
 import shutil
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
-from src.config import PDF_DIR, IMAGES_DIR, MIN_EMBEDDED_IMAGES_TO_SKIP_RENDER
+import numpy as np
+
+from src.config import (
+    PDF_DIR,
+    IMAGES_DIR,
+    SAVE_EXTRACTED_IMAGES,
+    RENDER_AT_HASH_SIZE,
+    REGION_HASHES,
+    VERIFY_MATCHES,
+    VERIFY_TOP_K,
+    VERIFY_MAX_SCORE,
+)
 from src.db import (
     init_db,
+    session,
     insert_pdf,
-    insert_image,
-    insert_fingerprint,
-    fetch_all_fingerprints,
-    fetch_image_info
+    insert_images_with_fingerprints,
+    insert_region_hashes,
+    fetch_pdf_by_digest,
+    fetch_images_info,
+    fetch_by_digest
 )
-from src.pdf_extract import extract_embedded_images, render_pages_to_images
-from src.fingerprint import compute_hashes
-from src.matcher import find_best_match
+from src.fp_cache import get_fingerprint_index, add_fingerprints, get_region_index
+from src.pdf_extract import iter_pdf_images, extracted_filename, save_image_data
+from src.fingerprint import (
+    compute_hashes_with_regions,
+    content_digest,
+    file_digest,
+    hash_to_hex,
+    hash_to_int,
+    region_layout
+)
+from src.matcher import FingerprintIndex, find_best_matches, find_top_candidates
+from src.verify import available as verify_available, compute_features, get_features, save_features, verify_pair
+from src.timings import StageTimings
+
+
+STAGING_DIR = IMAGES_DIR / "_staging"
+
+
+def stored_pdf_name(pdf_digest: str, filename: str) -> str:
+    """
+    Nama file PDF di storage/pdfs: digest isi + nama asli (nama asli saja bisa bentrok antar subfolder).
+    """
+    return f"{pdf_digest}_{Path(filename).name}"
 
 
-def ingest_pdf(pdf_input_path: Path) -> Dict[str, Any]:
+def existing_report(pdf_id: int, pdf_filename: str) -> Dict[str, Any]:
+    """
+    Report untuk PDF yang isinya sama persis dengan PDF yang sudah di-ingest:
+    report.json lama dipakai ulang, tanpa extract/hashing dan tanpa baris DB baru.
+    """
+    report_path = IMAGES_DIR / f"pdf_{pdf_id}" / "report.json"
+    if report_path.exists():
+        report = json.loads(report_path.read_text(encoding="utf-8"))
+    else:
+        # report lama hilang: cukup tunjuk ke pdf_id sebelumnya
+        report = {"pdf_id": int(pdf_id), "num_images_processed": 0, "results": []}
+    report["already_ingested"] = True
+    report["existing_pdf_id"] = int(pdf_id)
+    report["uploaded_filename"] = pdf_filename
+    return report
+
+
+def prepare_pdf(pdf_input_path: Path, pdf_digest: Optional[str] = None, move: bool = False,
+                render_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Tahap CPU-bound (boleh jalan di worker process): simpan PDF, extract/render, hashing.
+    Tidak menulis ke DB; hasil extract ditaruh di folder staging sampai pdf_id diketahui.
+    pdf_digest: digest file kalau sudah dihitung (misal saat upload di-stream), supaya tidak baca ulang.
+    move: pindahkan file input ke storage/pdfs (untuk file upload sementara) alih-alih copy.
+    render_workers: process untuk render halaman PDF scan (default RENDER_WORKERS di config).
+    """
     init_db()
+    timings = StageTimings()
+    # descriptor untuk verifikasi geometris dihitung di sini (CPU stage), bukan di writer
+    with_features = VERIFY_MATCHES and verify_available()
 
     if not pdf_input_path.exists():
         raise FileNotFoundError(f"PDF tidak ditemukan: {pdf_input_path}")
 
+    # PDF yang sama persis sudah pernah di-ingest: tidak perlu copy/extract/hashing
+    with timings.stage("pdf_digest"):
+        if pdf_digest is None:
+            pdf_digest = file_digest(pdf_input_path)
+            timings.count("bytes_read", pdf_input_path.stat().st_size)
+        prior = fetch_pdf_by_digest(pdf_digest)
+    if prior:
+        if move:
+            # upload sementara tidak dibutuhkan lagi
+            pdf_input_path.unlink(missing_ok=True)
+        return {
+            "pdf_filename": pdf_input_path.name,
+            "pdf_digest": pdf_digest,
+            "existing_pdf_id": prior[0],
+            "timings": timings.to_dict(),
+        }
+
     PDF_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Simpan file PDF ke storage/pdfs
-    stored_pdf_path = PDF_DIR / pdf_input_path.name
-    shutil.copy2(pdf_input_path, stored_pdf_path)
+    # Simpan file PDF ke storage/pdfs dengan nama unik per isi: preview render dibuat ulang
+    # dari file ini, jadi PDF lain dengan nama file sama tidak boleh menimpanya
+    stored_pdf_path = PDF_DIR / stored_pdf_name(pdf_digest, pdf_input_path.name)
+    # file yang sudah ada (PDF identik lain sedang/pernah di-prepare) tidak dihapus kalau prepare ini gagal
+    created_stored = not stored_pdf_path.exists()
+    with timings.stage("store_pdf"):
+        if move:
+            # rename di filesystem yang sama, tanpa salin isi file
+            shutil.move(str(pdf_input_path), str(stored_pdf_path))
+        else:
+            # via file sementara: worker paralel dengan PDF identik tidak menulis file yang sama bersamaan
+            tmp_path = stored_pdf_path.with_name(f"{stored_pdf_path.name}.{uuid4().hex}.tmp")
+            shutil.copy2(pdf_input_path, tmp_path)
+            tmp_path.replace(stored_pdf_path)
+            timings.count("bytes_written", stored_pdf_path.stat().st_size)
+    timings.count("pdf_bytes", stored_pdf_path.stat().st_size)
 
-    pdf_id = insert_pdf(pdf_input_path.name, str(stored_pdf_path))
+    staging_dir = STAGING_DIR / uuid4().hex
+    staging_dir.mkdir(parents=True, exist_ok=True)
 
-    # Output folder image untuk PDF ini
-    out_dir = IMAGES_DIR / f"pdf_{pdf_id}"
-    out_dir.mkdir(parents=True, exist_ok=True)
+    items: List[Dict[str, Any]] = []
+    first_by_xref: Dict[int, int] = {}
+    skipped: Dict[str, int] = {}  # gambar trivial yang dibuang sebelum hashing, per alasan
 
-    # 1) coba embedded images
-    embedded = extract_embedded_images(stored_pdf_path, out_dir)
+    try:
+        # Embedded images (atau render halaman kalau embedded kosong/kurang) di-hash langsung
+        # dari memory; salinan ke disk hanya kalau SAVE_EXTRACTED_IMAGES aktif.
+        with session() as conn:
+            for source, page, img_index, xref, ext, data in timings.timed_iter(
+                    "extract", iter_pdf_images(stored_pdf_path, render_workers=render_workers, skipped=skipped)):
+                extract_s = timings.last_wall_s
+                timings.count(source)
+                item: Dict[str, Any] = {
+                    "page": int(page),
+                    "source": source,
+                    "img_index": int(img_index),
+                    "file": "",      # nama file di staging ("" kalau tidak disimpan)
+                    "first": None,   # index item kemunculan pertama kalau xref berulang
+                    "exact": None,   # (fingerprint_id, image_id) kalau digest sudah ada di DB
+                    "regions": None,  # region hash (uint64) untuk deteksi crop
+                    "features": None,  # keypoint + descriptor ORB (matcher 2 tahap)
+                }
 
-    # 2) kalau embedded kosong/kurang, fallback render pages
-    if len(embedded) >= MIN_EMBEDDED_IMAGES_TO_SKIP_RENDER:
-        extracted = [("embedded", p, idx, path) for (p, idx, path) in embedded]
-    else:
-        rendered = render_pages_to_images(stored_pdf_path, out_dir)
-        extracted = [("render", p, idx, path) for (p, idx, path) in rendered]
+                if data is None:
+                    # xref yang sama sudah di-extract di halaman lain: pakai hasil pertama
+                    first = first_by_xref[xref]
+                    item.update({k: items[first][k] for k in ("file", "w", "h", "digest", "phash", "dhash", "ehash",
+                                                          "regions", "features")})
+                    item["first"] = first
+                    items.append(item)
+                    timings.count("repeated_xref")
+                    continue
 
-    # Ambil semua fingerprint yang sudah ada di DB (sebelum PDF ini dimasukkan)
-    existing_fps = fetch_all_fingerprints()
+                if isinstance(data, bytes):
+                    timings.count("image_bytes", len(data))
+                with timings.stage("exact_lookup"):
+                    digest = content_digest(data)
+                    hit = fetch_by_digest(digest, conn=conn)
+                hash_s = 0.0
+                if hit:
+                    # byte-identik dengan gambar di corpus: tidak perlu decode + hashing
+                    # (region hash juga tidak: gambar lamanya sudah punya, crop tetap ketemu ke sana)
+                    fp_id, image_id, ph, dh, eh, w, h = hit
+                    phash, dhash, ehash = hash_to_hex(ph), hash_to_hex(dh), hash_to_hex(eh)
+                    item["exact"] = (fp_id, image_id)
+                else:
+                    with timings.stage("hash"):
+                        phash, dhash, ehash, w, h, item["regions"] = compute_hashes_with_regions(
+                            data, regions=REGION_HASHES)
+                    hash_s = timings.last_wall_s
+                    if with_features:
+                        with timings.stage("features"):
+                            item["features"] = compute_features(data)
 
-    results: List[Dict[str, Any]] = []
+                if SAVE_EXTRACTED_IMAGES:
+                    item["file"] = extracted_filename(source, page, img_index, ext)
+                    if source == "render" and RENDER_AT_HASH_SIZE:
+                        # render ini hanya seukuran hashing; preview RENDER_DPI dibuat belakangan
+                        # di path yang sama saat pertama dilihat (thumbnails.ensure_image_file)
+                        timings.count("render_deferred")
+                    else:
+                        with timings.stage("save_images"):
+                            save_image_data(data, staging_dir / item["file"])
+                        timings.count("bytes_written", (staging_dir / item["file"]).stat().st_size)
+
+                timings.image(index=len(items), page=int(page), source=source, img_index=int(img_index),
+                              extract_ms=round(1000 * extract_s, 3), hash_ms=round(1000 * hash_s, 3),
+                              exact=bool(hit))
+
+                item.update({"w": w, "h": h, "digest": digest, "phash": phash, "dhash": dhash, "ehash": ehash})
+                if xref is not None:
+                    first_by_xref[xref] = len(items)
+                items.append(item)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        if created_stored:
+            discard_stored_pdf({"stored_pdf_path": str(stored_pdf_path), "pdf_digest": pdf_digest})
+        raise
+
+    return {
+        "pdf_filename": pdf_input_path.name,
+        "pdf_digest": pdf_digest,
+        "existing_pdf_id": None,
+        "stored_pdf_path": str(stored_pdf_path),
+        "staging_dir": str(staging_dir),
+        "items": items,
+        "skipped": skipped,
+        "timings": timings.to_dict(),
+    }
+
+
+def _move_staging(staging_dir: Path, out_dir: Path) -> None:
+    if out_dir.exists():
+        # sisa dari transaksi yang di-rollback (id bisa dipakai ulang), tidak direferensikan DB
+        shutil.rmtree(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(staging_dir), str(out_dir))
+
+
+def _crop_match(index: FingerprintIndex, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Kandidat crop lewat voting region hash (hanya untuk gambar yang tidak match sebagai gambar utuh).
+    Jarak phash/dhash/ehash tetap diisi (jarak gambar utuh ke kandidat) supaya report seragam.
+    """
+    candidates = get_region_index().lookup(item["regions"], top_k=1)
+    if not candidates:
+        return None
+    best = candidates[0]
+    pos = index.position_of(best["fingerprint_id"])
+    if pos is None:
+        return None
+    _, _, *hashes = index.take(np.array([pos]))
+    ph, dh, eh = (bin(hash_to_int(item[k]) ^ int(col[0])).count("1")
+                  for k, col in zip(("phash", "dhash", "ehash"), hashes))
+    return {"fingerprint_id": best["fingerprint_id"], "image_id": best["image_id"], "phash_dist": ph,
+            "dhash_dist": dh, "ehash_dist": eh, "score": best["region_dist"], "crop": True,
+            "region_votes": best["votes"], "hash_ok": True}
 
-    for source, page, img_index, img_path in extracted:
-        # UPDATED: compute_hashes sekarang return (phash, dhash, ehash, w, h)
-        phash, dhash, ehash, w, h = compute_hashes(img_path)
 
-        # UPDATED: matcher menerima ehash juga
-        match = find_best_match(phash, dhash, ehash, existing_fps)
+def _verified_match(item: Dict[str, Any], candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Tahap 2 matcher: kandidat dari hash diverifikasi geometris berurutan (score terdekat dulu),
+    kandidat pertama yang lolos jadi match. Kandidat yang tidak bisa diverifikasi (gambar tanpa
+    keypoint, atau file gambar lama tidak ada) ikut aturan threshold hash biasa.
+    """
+    for cand in candidates:
+        v = verify_pair(item["features"], get_features(cand["image_id"]))
+        if v is None:
+            if cand["hash_ok"]:
+                return {**cand, "verify": None}
+        elif v["ok"]:
+            return {**cand, "verify": v}
+    return None
 
-        # Simpan image + fingerprint untuk PDF baru ke DB (jadi referensi ke depannya)
-        image_id = insert_image(pdf_id, page, source, img_index, str(img_path), w, h)
-        insert_fingerprint(image_id, phash, dhash, ehash)
 
+def _match_items(items: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Match per item: exact digest langsung jadi match skor 0, xref berulang ikut hasil
+    kemunculan pertamanya, sisanya lewat matcher (1 panggilan untuk seluruh PDF).
+    Yang tidak match sebagai gambar utuh dicek lagi sebagai crop lewat region hash.
+    VERIFY_MATCHES: hash hanya memilih VERIFY_TOP_K kandidat, keputusan akhir lewat verifikasi geometris.
+    """
+    matches: List[Optional[Dict[str, Any]]] = [None] * len(items)
+
+    to_match = [i for i, it in enumerate(items) if it["first"] is None and it["exact"] is None]
+    if to_match:
+        # Semua fingerprint yang sudah ada di DB (sebelum PDF ini dimasukkan).
+        # Cache level proses: hanya delta sejak ingest sebelumnya yang dibaca dari DB.
+        existing_fps = get_fingerprint_index()
+        queries = [(items[i]["phash"], items[i]["dhash"], items[i]["ehash"]) for i in to_match]
+        two_stage = VERIFY_MATCHES and verify_available()
+        if two_stage:
+            for i, cands in zip(to_match, find_top_candidates(queries, existing_fps, VERIFY_TOP_K, VERIFY_MAX_SCORE)):
+                matches[i] = _verified_match(items[i], cands)
+        else:
+            for i, m in zip(to_match, find_best_matches(queries, existing_fps)):
+                matches[i] = m
+        if REGION_HASHES:
+            for i in to_match:
+                if matches[i] is None and items[i]["regions"] is not None:
+                    crop = _crop_match(existing_fps, items[i])
+                    matches[i] = _verified_match(items[i], [crop]) if two_stage and crop else crop
+
+    for i, it in enumerate(items):
+        if it["exact"] is not None:
+            fp_id, image_id = it["exact"]
+            matches[i] = {"fingerprint_id": fp_id, "image_id": image_id, "phash_dist": 0,
+                          "dhash_dist": 0, "ehash_dist": 0, "score": 0, "exact": True}
+        elif it["first"] is not None:
+            matches[i] = matches[it["first"]]
+
+    return matches
+
+
+def commit_pdf(prepared: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Tahap writer (selalu 1 proses): matching vs corpus + tulis ke DB dalam 1 transaksi.
+    Karena cache fingerprint di-update tiap PDF, PDF berikutnya di batch yang sama ikut
+    terdeteksi sebagai duplicate dari PDF ini.
+    """
+    init_db()
+    timings = StageTimings(prepared.get("timings"))
+    if prepared["existing_pdf_id"] is not None:
+        report = existing_report(prepared["existing_pdf_id"], prepared["pdf_filename"])
+        report["pdf_digest"] = prepared["pdf_digest"]
+        report["timings"] = timings.to_dict()
+        return report
+
+    # cek ulang: PDF identik bisa saja baru di-commit (misal 2 file sama dalam 1 batch paralel)
+    with timings.stage("pdf_digest"):
+        prior = fetch_pdf_by_digest(prepared["pdf_digest"])
+    if prior:
+        discard_prepared(prepared)
+        if prepared["stored_pdf_path"] != prior[2]:
+            Path(prepared["stored_pdf_path"]).unlink(missing_ok=True)
+        report = existing_report(prior[0], prepared["pdf_filename"])
+        report["pdf_digest"] = prepared["pdf_digest"]
+        report["timings"] = timings.to_dict()
+        return report
+
+    staging_dir = Path(prepared["staging_dir"])
+    items = prepared["items"]
+
+    with timings.stage("match"):
+        matches = _match_items(items)
+
+    # 1 koneksi + 1 transaksi untuk seluruh PDF (pdf_files, images, fingerprints)
+    with timings.stage("db_write"), session() as conn:
+        pdf_id = insert_pdf(prepared["pdf_filename"], prepared["stored_pdf_path"],
+                            digest=prepared["pdf_digest"], conn=conn)
+
+        # Output folder image untuk PDF ini
+        out_dir = IMAGES_DIR / f"pdf_{pdf_id}"
+        _move_staging(staging_dir, out_dir)
+        for it in items:
+            it["img_path"] = str(out_dir / it["file"]) if it["file"] else ""
+
+        # Simpan image + fingerprint untuk PDF baru ke DB (jadi referensi ke depannya).
+        # xref berulang hanya dapat baris images, fingerprint cukup sekali per gambar unik.
+        rows = [(it["page"], it["source"], it["img_index"], it["img_path"], it["w"], it["h"], it["digest"],
+                 *((it["phash"], it["dhash"], it["ehash"]) if it["first"] is None else (None, None, None)))
+                for it in items]
+        ids = insert_images_with_fingerprints(pdf_id, rows, conn=conn)
+        insert_region_hashes([(fp_id, image_id, np.asarray(it["regions"], dtype="<u8").tobytes())
+                              for (image_id, fp_id), it in zip(ids, items)
+                              if fp_id is not None and it["regions"] is not None],
+                             region_layout(), conn=conn)
+        infos = fetch_images_info([m["image_id"] for m in matches if m], conn=conn)
+
+    with timings.stage("save_features"):
+        for (_, fp_id), it in zip(ids, items):
+            if fp_id is not None and it["features"] is not None:
+                save_features(it["digest"], it["features"])
+
+    with timings.stage("match"):
+        add_fingerprints([(fp_id, image_id, it["phash"], it["dhash"], it["ehash"])
+                          for (image_id, fp_id), it in zip(ids, items) if fp_id is not None])
+
+    results: List[Dict[str, Any]] = []
+
+    for it, match, (image_id, _) in zip(items, matches, ids):
         item: Dict[str, Any] = {
-            "page": int(page),
-            "source": source,
-            "img_index": int(img_index),
-            "img_path": str(img_path),
-            "phash": phash,
-            "dhash": dhash,
-            "ehash": ehash,
+            "image_id": int(image_id),
+            "page": it["page"],
+            "source": it["source"],
+            "img_index": it["img_index"],
+            "img_path": it["img_path"],
+            "phash": it["phash"],
+            "dhash": it["dhash"],
+            "ehash": it["ehash"],
+            "digest": it["digest"],
             "is_duplicate": match is not None,
             "match": None
         }
 
         if match:
-            info = fetch_image_info(match["image_id"])
-            # info: (images.id, pdf_id, page, source, img_index, img_path, pdf_filename)
+            info = infos.get(match["image_id"])
+            # info: (images.id, pdf_id, page, source, img_index, img_path, pdf_filename, pdf_stored_path,
+            #        pdf_digest, image_digest)
             if info:
                 item["match"] = {
                     "score": int(match["score"]),
                     "phash_dist": int(match["phash_dist"]),
                     "dhash_dist": int(match["dhash_dist"]),
                     "ehash_dist": int(match["ehash_dist"]),
+                    "exact": bool(match.get("exact", False)),
+                    # crop: match lewat region hash (gambar ini potongan gambar lama, atau sebaliknya)
+                    "crop": bool(match.get("crop", False)),
+                    "region_votes": int(match.get("region_votes", 0)),
+                    # matcher 2 tahap: inlier RANSAC & skor verifikasi (None = tidak diverifikasi)
+                    "verify_inliers": match["verify"]["inliers"] if match.get("verify") else None,
+                    "verify_score": match["verify"]["score"] if match.get("verify") else None,
+                    "old_image_id": int(info[0]),
                     "old_pdf_id": int(info[1]),
                     "old_pdf_filename": info[6],
                     "old_page": int(info[2]),
@@ -94,10 +409,18 @@ def ingest_pdf(pdf_input_path: Path) -> Dict[str, Any]:
 
     report = {
         "pdf_id": int(pdf_id),
-        "pdf_filename": pdf_input_path.name,
-        "stored_pdf_path": str(stored_pdf_path),
+        "pdf_filename": prepared["pdf_filename"],
+        "stored_pdf_path": prepared["stored_pdf_path"],
+        "pdf_digest": prepared["pdf_digest"],
+        "already_ingested": False,
         "num_images_processed": len(results),
-        "results": results
+        "num_unique_images": sum(1 for it in items if it["first"] is None),
+        "num_exact_hits": sum(1 for it in items if it["exact"] is not None),
+        "num_skipped_trivial": sum(prepared["skipped"].values()),
+        "skipped_trivial": prepared["skipped"],
+        "results": results,
+        # wall/CPU per tahap, counter (embedded/render, byte dibaca/ditulis) dan detail per gambar
+        "timings": timings.to_dict(),
     }
 
     # simpan report json biar gampang dicek
@@ -107,18 +430,60 @@ def ingest_pdf(pdf_input_path: Path) -> Dict[str, Any]:
     return report
 
 
+def discard_prepared(prepared: Dict[str, Any]) -> None:
+    """
+    Buang hasil prepare_pdf yang tidak jadi di-commit.
+    """
+    if prepared.get("staging_dir"):
+        shutil.rmtree(prepared["staging_dir"], ignore_errors=True)
+
+
+def discard_stored_pdf(prepared: Dict[str, Any]) -> None:
+    """
+    Hapus salinan PDF di storage dari prepare_pdf yang gagal di-commit, kecuali sudah dipakai baris pdf_files
+    (nama file per digest, jadi PDF identik yang sudah di-commit memakai file yang sama).
+    """
+    stored = prepared.get("stored_pdf_path")
+    if stored and fetch_pdf_by_digest(prepared["pdf_digest"]) is None:
+        Path(stored).unlink(missing_ok=True)
+
+
+def ingest_pdf(pdf_input_path: Path, pdf_digest: Optional[str] = None, move: bool = False,
+               render_workers: Optional[int] = None) -> Dict[str, Any]:
+    prepared = prepare_pdf(pdf_input_path, pdf_digest=pdf_digest, move=move, render_workers=render_workers)
+    try:
+        return commit_pdf(prepared)
+    except BaseException:
+        discard_prepared(prepared)
+        discard_stored_pdf(prepared)
+        raise
+
+
 def print_report(report: Dict[str, Any]) -> None:
+    if report.get("already_ingested"):
+        print(f"\nPDF: {report['uploaded_filename']} identik dengan pdf_id={report['existing_pdf_id']} "
+              f"({report.get('pdf_filename', '')}), tidak diproses ulang")
+        return
     print(f"\nPDF: {report['pdf_filename']} (pdf_id={report['pdf_id']})")
     print(f"Images processed: {report['num_images_processed']}")
+    if report.get("num_skipped_trivial"):
+        print(f"Gambar trivial dilewati: {report['num_skipped_trivial']} {report['skipped_trivial']}")
+    t = report.get("timings")
+    if t:
+        stages = ", ".join(f"{k} {v['wall_s']:.2f}s" for k, v in t["stages"].items())
+        print(f"Waktu: {t['total_wall_s']:.2f}s ({stages})")
     print("-" * 60)
 
     for r in report["results"]:
         if r["is_duplicate"]:
             m = r["match"]
-            print(f"[DUP] page {r['page']} ({r['source']}) -> {Path(r['img_path']).name}")
+            crop = f" [crop, {m['region_votes']} region]" if m.get("crop") else ""
+            print(f"[DUP] page {r['page']} ({r['source']}) -> {Path(r['img_path']).name}{crop}")
+            verified = (f", verify={m['verify_score']} ({m['verify_inliers']} inlier)"
+                        if m.get("verify_score") is not None else "")
             print(
                 f"     score={m['score']} "
-                f"(ph={m['phash_dist']}, dh={m['dhash_dist']}, eh={m['ehash_dist']})"
+                f"(ph={m['phash_dist']}, dh={m['dhash_dist']}, eh={m['ehash_dist']}){verified}"
             )
             print(
                 f"     pernah ada di: {m['old_pdf_filename']} "
@@ -129,12 +494,14 @@ def print_report(report: Dict[str, Any]) -> None:
 
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        print('Usage: py src\\ingest_pdf.py "D:\\path\\file.pdf"')
-        raise SystemExit(1)
+    import argparse
+    ap = argparse.ArgumentParser(description="Ingest 1 PDF")
+    ap.add_argument("pdf", help='contoh: "D:\\path\\file.pdf"')
+    ap.add_argument("--render-workers", type=int, default=None,
+                    help="jumlah process untuk render halaman PDF scan (default: RENDER_WORKERS di config)")
+    args = ap.parse_args()
 
-    pdf_path = Path(sys.argv[1])
-    rep = ingest_pdf(pdf_path)
+    pdf_path = Path(args.pdf)
+    rep = ingest_pdf(pdf_path, render_workers=args.render_workers)
     print_report(rep)
     print("\nReport JSON tersimpan di folder storage/images/pdf_<id>/report.json")
@@ -0,0 +1,118 @@
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from src.config import PDF_DIR
+from src.ingest_pdf import prepare_pdf, commit_pdf, discard_prepared, discard_stored_pdf, stored_pdf_name
+from src import metrics
+
+# Status job: queued (antri / extract + hashing di pool) -> committing (matching + DB) -> done / error
+FINISHED = ("done", "error")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Antrian ingest untuk web app. Extract + hashing jalan di process pool (bounded),
+    matching + tulis DB lewat 1 thread writer (sama seperti ingest_folder paralel),
+    jadi event loop tidak pernah menunggu ingest selesai.
+    """
+
+    def __init__(self, workers: int, max_pending: int, history: int):
+        self._pool = ProcessPoolExecutor(max_workers=max(1, workers))
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._max_pending = max_pending
+        self._history = history
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _pending(self) -> int:
+        return sum(1 for j in self._jobs.values() if j["status"] not in FINISHED)
+
+    def _evict(self) -> None:
+        # simpan hanya `history` job terakhir yang sudah selesai
+        finished = [k for k, j in self._jobs.items() if j["status"] in FINISHED]
+        for k in finished[:max(0, len(finished) - self._history)]:
+            del self._jobs[k]
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                if job["status"] in FINISHED:
+                    job["finished_at"] = time.time()
+                    self._evict()
+
+    def submit(self, pdf_path: Path, filename: str, pdf_digest: Optional[str] = None) -> str:
+        """
+        Daftarkan 1 PDF upload untuk di-ingest (file dipindah ke storage/pdfs, bukan di-copy).
+        Langsung return job_id (tidak menunggu proses).
+        Raise QueueFull kalau job yang belum selesai sudah sebanyak max_pending.
+        """
+        job_id = uuid4().hex
+        with self._lock:
+            if self._pending() >= self._max_pending:
+                raise QueueFull(f"Antrian penuh ({self._max_pending} job belum selesai)")
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "filename": filename,
+                "status": "queued",
+                "submitted_at": time.time(),
+                "finished_at": None,
+                "error": None,
+                "report": None,
+            }
+        fut = self._pool.submit(prepare_pdf, pdf_path, pdf_digest, True)
+        fut.add_done_callback(lambda f: self._writer.submit(self._commit, job_id, f, pdf_path, pdf_digest))
+        return job_id
+
+    def _commit(self, job_id: str, fut: Future, pdf_path: Path, pdf_digest: Optional[str]) -> None:
+        try:
+            prepared = fut.result()
+        except Exception as e:
+            # prepare_pdf membersihkan sendiri kalau gagal; ini untuk worker yang mati di tengah jalan
+            # (BrokenProcessPool): upload sementara / salinan di storage tidak boleh tertinggal
+            pdf_path.unlink(missing_ok=True)
+            if pdf_digest:
+                discard_stored_pdf({"stored_pdf_path": str(PDF_DIR / stored_pdf_name(pdf_digest, pdf_path.name)),
+                                    "pdf_digest": pdf_digest})
+            metrics.observe_error()
+            self._update(job_id, status="error", error=_format_error(e))
+            return
+        self._update(job_id, status="committing")
+        try:
+            report = commit_pdf(prepared)
+        except Exception as e:
+            discard_prepared(prepared)
+            discard_stored_pdf(prepared)
+            metrics.observe_error()
+            self._update(job_id, status="error", error=_format_error(e))
+            return
+        metrics.observe_report(report)
+        self._update(job_id, status="done", report=report)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pending": self._pending(), "tracked": len(self._jobs)}
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._writer.shutdown(wait=True)
+
+
+def _format_error(e: BaseException) -> str:
+    return "".join(traceback.format_exception_only(type(e), e)).strip()
@@ -1,34 +1,382 @@
-from typing import Optional, Dict, Any, List, Tuple
-from src.fingerprint import hamming_hex
+from typing import Optional, Dict, Any, List, Sequence, Tuple, Union, Iterable, Iterator
+import numpy as np
+
+from src.fingerprint import hash_to_int
+from src.hash_index import MultiIndexHash, popcount64, unique_sorted, CHUNKS
 from src.config import PHASH_THRESHOLD, DHASH_THRESHOLD
 
 EHASH_THRESHOLD = 10  # bisa kamu tuning
 
-def find_best_match(new_phash, new_dhash, new_ehash, existing):
+# Batas jumlah elemen matrix (query x corpus) yang dihitung sekaligus,
+# supaya batch besar tidak meledakkan memory.
+MATCH_BLOCK_ELEMENTS = 2_000_000
+
+# Corpus sekecil ini lebih cepat di-scan penuh daripada lewat index
+INDEX_MIN_CORPUS = 100_000
+# Kalau threshold terlalu longgar (probe per substring > radius ini), index tidak membantu
+INDEX_MAX_CHUNK_RADIUS = 3
+
+# Nilai score untuk kandidat yang tidak lolos threshold (pasti > skor valid mana pun)
+_NO_MATCH = np.int16(1000)
+
+HashValue = Union[str, int]
+FingerprintRow = Tuple[int, int, HashValue, HashValue, HashValue]
+
+
+def _u64(values: Iterable[HashValue]) -> np.ndarray:
+    return np.fromiter((hash_to_int(v) for v in values), dtype=np.uint64)
+
+
+_COLUMN_DTYPES = (np.int64, np.int64, np.uint64, np.uint64, np.uint64)  # fp_id, image_id, phash, dhash, ehash
+
+Columns = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+class FingerprintIndex:
+    """
+    Corpus fingerprint yang sudah di-pack ke array uint64 contiguous.
+    Pack sekali, lalu dipakai untuk banyak query (tanpa parse hex per baris).
+    Untuk corpus besar, ehash & phash juga di-index (multi-index hashing) supaya lookup
+    hanya menyentuh kandidat di sekitar threshold, bukan seluruh corpus.
+
+    base: kolom read-only (fp_ids, image_ids, phash, dhash, ehash) yang dipakai tanpa di-copy,
+    misal np.memmap dari snapshot (lihat fp_snapshot). Baris dari extend() masuk ke "tail" di
+    belakangnya; posisi baris = posisi di base, lalu len(base) + posisi di tail.
+    """
+
+    def __init__(self, rows: Iterable[FingerprintRow] = (), base: Optional[Columns] = None):
+        if base is None:
+            base = tuple(np.empty(0, dtype=dt) for dt in _COLUMN_DTYPES)  # type: ignore
+        self._base: Columns = base  # type: ignore
+        self._nb = len(base[0])
+        self._nt = 0
+        self._tail: List[np.ndarray] = [np.empty(0, dtype=dt) for dt in _COLUMN_DTYPES]
+        self._mih_ph = MultiIndexHash()
+        self._mih_eh = MultiIndexHash()
+        self._indexed = 0
+        self.extend(rows)
+
+    def __len__(self) -> int:
+        return self._nb + self._nt
+
+    def _reserve(self, extra: int) -> None:
+        need = self._nt + extra
+        cap = len(self._tail[0])
+        if need <= cap:
+            return
+        new_cap = max(need, cap * 2, 1024)
+        for c, old in enumerate(self._tail):
+            arr = np.empty(new_cap, dtype=old.dtype)
+            arr[:self._nt] = old[:self._nt]
+            self._tail[c] = arr
+
+    def extend(self, rows: Iterable[FingerprintRow]) -> None:
+        """
+        rows: iterable of (fp_id, image_id, phash, dhash, ehash); hash boleh hex string atau int.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        fp_ids, image_ids, ph, dh, eh = zip(*rows)
+        k = len(rows)
+        self._reserve(k)
+        s = slice(self._nt, self._nt + k)
+        self._tail[0][s] = fp_ids
+        self._tail[1][s] = image_ids
+        self._tail[2][s] = _u64(ph)
+        self._tail[3][s] = _u64(dh)
+        self._tail[4][s] = _u64(eh)
+        self._nt += k
+
+    def add(self, fp_id: int, image_id: int, phash: HashValue, dhash: HashValue, ehash: HashValue) -> None:
+        self.extend([(fp_id, image_id, phash, dhash, ehash)])
+
+    def segments(self) -> List[Tuple[int, Columns]]:
+        """
+        Kolom per segmen tanpa copy: [(posisi awal, (fp_ids, image_ids, phash, dhash, ehash)), ...].
+        """
+        out: List[Tuple[int, Columns]] = []
+        if self._nb:
+            out.append((0, self._base))
+        if self._nt:
+            out.append((self._nb, tuple(col[:self._nt] for col in self._tail)))  # type: ignore
+        return out
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (phash, dhash, ehash) seluruh corpus; di-copy kalau ada base + tail sekaligus.
+        """
+        segs = self.segments()
+        if len(segs) == 1:
+            return segs[0][1][2:]  # type: ignore
+        return tuple(np.concatenate([seg[c] for _, seg in segs]) if segs else np.empty(0, dtype=np.uint64)
+                     for c in (2, 3, 4))  # type: ignore
+
+    def take(self, positions: np.ndarray) -> Columns:
+        """
+        Baris di posisi tertentu (gather dari base dan/atau tail).
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        tail = [col[:self._nt] for col in self._tail]
+        if not self._nb:
+            return tuple(col[positions] for col in tail)  # type: ignore
+        if not self._nt:
+            return tuple(col[positions] for col in self._base)  # type: ignore
+        in_base = positions < self._nb
+        out = []
+        for b, t in zip(self._base, tail):
+            o = np.empty(len(positions), dtype=b.dtype)
+            o[in_base] = b[positions[in_base]]
+            o[~in_base] = t[positions[~in_base] - self._nb]
+            out.append(o)
+        return tuple(out)  # type: ignore
+
+    def position_of(self, fp_id: int) -> Optional[int]:
+        """
+        Posisi baris untuk fingerprint_id (id urut naik di base lalu tail), atau None.
+        """
+        for start, seg in self.segments():
+            ids = seg[0]
+            pos = int(np.searchsorted(ids, fp_id))
+            if pos < len(ids) and ids[pos] == fp_id:
+                return start + pos
+        return None
+
+    def use_index(self, eh_dist: int = EHASH_THRESHOLD, ph_dist: int = PHASH_THRESHOLD) -> bool:
+        radius = max(eh_dist, ph_dist) // CHUNKS
+        return len(self) >= INDEX_MIN_CORPUS and radius <= INDEX_MAX_CHUNK_RADIUS
+
+    def candidates(self, q_ph: int, q_eh: int, eh_dist: int = EHASH_THRESHOLD,
+                   ph_dist: int = PHASH_THRESHOLD) -> np.ndarray:
+        """
+        Posisi baris yang mungkin lolos aturan match (superset, sorted).
+        Cukup lihat ehash & phash: kandidat lolos kalau ehash dekat ATAU (phash dan dhash) dekat.
+        eh_dist/ph_dist: radius pencarian (default threshold match; lebih longgar untuk prefilter top-k).
+        """
+        n = len(self)
+        if self._indexed < n:
+            # index di-update incremental: hanya baris baru sejak query terakhir
+            positions = np.arange(self._indexed, n, dtype=np.int64)
+            _, _, ph, _, eh = self.take(positions)
+            self._mih_ph.add_many(ph, positions)
+            self._mih_eh.add_many(eh, positions)
+            self._indexed = n
+        return unique_sorted(np.concatenate([self._mih_eh.candidates(q_eh, eh_dist),
+                                             self._mih_ph.candidates(q_ph, ph_dist)]))
+
+
+def _as_index(existing: Union[FingerprintIndex, Sequence[FingerprintRow]]) -> FingerprintIndex:
+    if isinstance(existing, FingerprintIndex):
+        return existing
+    return FingerprintIndex(existing)
+
+
+def _pair_scores(q_ph: np.ndarray, q_dh: np.ndarray, q_eh: np.ndarray,
+                 ph: np.ndarray, dh: np.ndarray, eh: np.ndarray):
+    """
+    Matrix jarak (query x corpus) per hash + score (_NO_MATCH kalau tidak lolos threshold).
+    return: (score, d_ph, d_dh, d_eh), masing-masing int16 shape (len(q), len(corpus))
+    """
+    raw, ok, d_ph, d_dh, d_eh = _raw_scores(q_ph, q_dh, q_eh, ph, dh, eh)
+    score = np.where(ok, raw, _NO_MATCH)
+    return score, d_ph, d_dh, d_eh
+
+
+def _raw_scores(q_ph: np.ndarray, q_dh: np.ndarray, q_eh: np.ndarray,
+                ph: np.ndarray, dh: np.ndarray, eh: np.ndarray):
+    """
+    Seperti _pair_scores, tapi score tidak di-mask: min(d_eh, d_ph + d_dh) untuk semua pasangan,
+    plus ok = lolos aturan threshold.
+    return: (score, ok, d_ph, d_dh, d_eh)
     """
-    existing: list of (fp_id, image_id, phash, dhash, ehash)
+    d_ph = popcount64(q_ph[:, None] ^ ph[None, :]).astype(np.int16)
+    d_dh = popcount64(q_dh[:, None] ^ dh[None, :]).astype(np.int16)
+    d_eh = popcount64(q_eh[:, None] ^ eh[None, :]).astype(np.int16)
+
+    # Aturan: kalau edge mirip, anggap kandidat kuat
+    ok = (d_eh <= EHASH_THRESHOLD) | ((d_ph <= PHASH_THRESHOLD) & (d_dh <= DHASH_THRESHOLD))
+    return np.minimum(d_eh, d_ph + d_dh), ok, d_ph, d_dh, d_eh
+
+
+def _match_block(q_ph: np.ndarray, q_dh: np.ndarray, q_eh: np.ndarray,
+                 ph: np.ndarray, dh: np.ndarray, eh: np.ndarray):
+    """
+    Hitung jarak (query x corpus) untuk satu blok, lalu ambil kandidat terbaik per query.
+    return: (best_col, best_score, d_ph, d_dh, d_eh) dengan d_* sudah dipilih per query
+    """
+    score, d_ph, d_dh, d_eh = _pair_scores(q_ph, q_dh, q_eh, ph, dh, eh)
+
+    # argmin ambil index pertama kalau skor sama -> sama dengan loop lama (pakai "<")
+    col = score.argmin(axis=1)
+    rows = np.arange(len(col))
+    return col, score[rows, col], d_ph[rows, col], d_dh[rows, col], d_eh[rows, col]
+
+
+def find_best_matches(queries: Sequence[Tuple[HashValue, HashValue, HashValue]],
+                      existing: Union[FingerprintIndex, Sequence[FingerprintRow]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Batch version dari find_best_match: satu panggilan untuk semua gambar dalam 1 PDF.
+    queries: list of (phash, dhash, ehash)
+    existing: FingerprintIndex atau list of (fp_id, image_id, phash, dhash, ehash)
+    return: list hasil (dict atau None), urutannya sama dengan queries
     """
-    best = None
+    index = _as_index(existing)
+    n_q = len(queries)
+    n = len(index)
+    if n_q == 0:
+        return []
+    if n == 0:
+        return [None] * n_q
 
-    for fp_id, img_id, ph, dh, eh in existing:
-        d_ph = hamming_hex(new_phash, ph)
-        d_dh = hamming_hex(new_dhash, dh)
-        d_eh = hamming_hex(new_ehash, eh)
+    q_ph = _u64(q[0] for q in queries)
+    q_dh = _u64(q[1] for q in queries)
+    q_eh = _u64(q[2] for q in queries)
+
+    best_pos = np.full(n_q, -1, dtype=np.int64)
+    best_score = np.full(n_q, _NO_MATCH, dtype=np.int16)
+    best_d = np.zeros((3, n_q), dtype=np.int16)
+
+    if index.use_index():
+        for i in range(n_q):
+            cand = index.candidates(q_ph[i], q_eh[i])
+            if len(cand) == 0:
+                continue
+            # kandidat sorted, jadi tie-break tetap baris paling awal (sama dengan scan penuh)
+            _, _, ph, dh, eh = index.take(cand)
+            col, score, d_ph, d_dh, d_eh = _match_block(q_ph[i:i + 1], q_dh[i:i + 1], q_eh[i:i + 1], ph, dh, eh)
+            best_pos[i] = cand[col[0]]
+            best_score[i] = score[0]
+            best_d[:, i] = (d_ph[0], d_dh[0], d_eh[0])
+        return _collect_results(index, best_pos, best_score, best_d)
+
+    col_block = min(n, MATCH_BLOCK_ELEMENTS)
+    row_block = max(1, MATCH_BLOCK_ELEMENTS // col_block)
+
+    for r0 in range(0, n_q, row_block):
+        r1 = min(n_q, r0 + row_block)
+        for c0, ph, dh, eh in _corpus_blocks(index, col_block):
+            col, score, d_ph, d_dh, d_eh = _match_block(q_ph[r0:r1], q_dh[r0:r1], q_eh[r0:r1], ph, dh, eh)
+            # blok corpus diproses berurutan, jadi "<" menjaga kandidat paling awal saat seri
+            better = score < best_score[r0:r1]
+            idx = np.nonzero(better)[0]
+            best_score[r0 + idx] = score[idx]
+            best_pos[r0 + idx] = c0 + col[idx]
+            best_d[0, r0 + idx] = d_ph[idx]
+            best_d[1, r0 + idx] = d_dh[idx]
+            best_d[2, r0 + idx] = d_eh[idx]
+
+    return _collect_results(index, best_pos, best_score, best_d)
+
+
+def _corpus_blocks(index: FingerprintIndex, col_block: int) -> Iterator[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Potong corpus (base lalu tail, berurutan) jadi blok <= col_block baris, tanpa copy.
+    yield: (posisi awal blok, phash, dhash, ehash)
+    """
+    for start, (_, _, ph, dh, eh) in index.segments():
+        for c0 in range(0, len(ph), col_block):
+            c1 = min(len(ph), c0 + col_block)
+            yield start + c0, ph[c0:c1], dh[c0:c1], eh[c0:c1]
 
-        # Aturan: kalau edge mirip, anggap kandidat kuat
-        ok = (d_eh <= EHASH_THRESHOLD) or ((d_ph <= PHASH_THRESHOLD) and (d_dh <= DHASH_THRESHOLD))
-        if not ok:
+
+def _collect_results(index: FingerprintIndex, best_pos: np.ndarray, best_score: np.ndarray,
+                     best_d: np.ndarray) -> List[Optional[Dict[str, Any]]]:
+    fp_ids, image_ids, *_ = index.take(np.maximum(best_pos, 0))
+    results: List[Optional[Dict[str, Any]]] = []
+    for i in range(len(best_pos)):
+        pos = best_pos[i]
+        if pos < 0 or best_score[i] >= _NO_MATCH:
+            results.append(None)
             continue
+        results.append({
+            "fingerprint_id": int(fp_ids[i]),
+            "image_id": int(image_ids[i]),
+            "phash_dist": int(best_d[0, i]),
+            "dhash_dist": int(best_d[1, i]),
+            "ehash_dist": int(best_d[2, i]),
+            "score": int(best_score[i])
+        })
+    return results
+
+
+def find_top_candidates(queries: Sequence[Tuple[HashValue, HashValue, HashValue]],
+                        existing: Union[FingerprintIndex, Sequence[FingerprintRow]],
+                        k: int, max_score: int) -> List[List[Dict[str, Any]]]:
+    """
+    Tahap 1 matcher 2 tahap: k kandidat terdekat per query (score = min(d_eh, d_ph + d_dh) <= max_score),
+    termasuk yang tidak lolos threshold biasa. Tahap 2 (verifikasi geometris) yang memutuskan.
+    return: per query, list kandidat urut score (lalu baris paling awal); tiap kandidat seperti hasil
+            find_best_matches plus "hash_ok" = lolos aturan threshold biasa
+    """
+    index = _as_index(existing)
+    n_q = len(queries)
+    n = len(index)
+    if n_q == 0:
+        return []
+    if n == 0:
+        return [[] for _ in range(n_q)]
+
+    q_ph = _u64(q[0] for q in queries)
+    q_dh = _u64(q[1] for q in queries)
+    q_eh = _u64(q[2] for q in queries)
+    found: List[List[Tuple[int, int, int, int, int, bool]]] = [[] for _ in range(n_q)]
+
+    def collect(i0: int, cols: np.ndarray, block):
+        score, ok, d_ph, d_dh, d_eh = block
+        for r in range(score.shape[0]):
+            sel = np.nonzero(score[r] <= max_score)[0]
+            if len(sel) > k:
+                sel = sel[np.argpartition(score[r, sel], k - 1)[:k]]
+            found[i0 + r] += [(int(score[r, c]), int(cols[c]), int(d_ph[r, c]), int(d_dh[r, c]),
+                               int(d_eh[r, c]), bool(ok[r, c])) for c in sel]
+
+    if index.use_index(max_score, max_score):
+        for i in range(n_q):
+            cand = index.candidates(q_ph[i], q_eh[i], max_score, max_score)
+            if len(cand):
+                _, _, ph, dh, eh = index.take(cand)
+                collect(i, cand, _raw_scores(q_ph[i:i + 1], q_dh[i:i + 1], q_eh[i:i + 1], ph, dh, eh))
+    else:
+        col_block = min(n, MATCH_BLOCK_ELEMENTS)
+        row_block = max(1, MATCH_BLOCK_ELEMENTS // col_block)
+        for r0 in range(0, n_q, row_block):
+            r1 = min(n_q, r0 + row_block)
+            for c0, ph, dh, eh in _corpus_blocks(index, col_block):
+                collect(r0, np.arange(c0, c0 + len(ph)), _raw_scores(q_ph[r0:r1], q_dh[r0:r1], q_eh[r0:r1],
+                                                                     ph, dh, eh))
+
+    out: List[List[Dict[str, Any]]] = []
+    for cands in found:
+        cands.sort(key=lambda c: (c[0], c[1]))
+        cands = cands[:k]
+        fp_ids, image_ids, *_ = index.take(np.array([c[1] for c in cands], dtype=np.int64))
+        out.append([{
+            "fingerprint_id": int(fp_ids[j]),
+            "image_id": int(image_ids[j]),
+            "phash_dist": d_ph,
+            "dhash_dist": d_dh,
+            "ehash_dist": d_eh,
+            "score": score,
+            "hash_ok": ok,
+        } for j, (score, _, d_ph, d_dh, d_eh, ok) in enumerate(cands)])
+    return out
 
-        score = min(d_eh, d_ph + d_dh)  # pakai yang “lebih meyakinkan”
-        if best is None or score < best["score"]:
-            best = {
-                "fingerprint_id": fp_id,
-                "image_id": img_id,
-                "phash_dist": d_ph,
-                "dhash_dist": d_dh,
-                "ehash_dist": d_eh,
-                "score": score
-            }
-
-    return best
+
+def find_best_match(new_phash, new_dhash, new_ehash, existing):
+    """
+    existing: FingerprintIndex atau list of (fp_id, image_id, phash, dhash, ehash)
+    """
+    return find_best_matches([(new_phash, new_dhash, new_ehash)], existing)[0]
+
+
+def match_matrix(a_hashes: Sequence[Tuple[HashValue, HashValue, HashValue]],
+                 b_hashes: Sequence[Tuple[HashValue, HashValue, HashValue]]) -> Dict[str, np.ndarray]:
+    """
+    Semua pasangan A x B sekaligus (1 operasi vectorized per jenis hash), untuk compare 2 PDF.
+    return: {"score", "phash_dist", "dhash_dist", "ehash_dist": int16 (|A|, |B|), "ok": bool (|A|, |B|)}
+    """
+    a = [_u64(h[k] for h in a_hashes) for k in range(3)]
+    b = [_u64(h[k] for h in b_hashes) for k in range(3)]
+    score, d_ph, d_dh, d_eh = _pair_scores(*a, *b)
+    return {"score": score, "phash_dist": d_ph, "dhash_dist": d_dh, "ehash_dist": d_eh,
+            "ok": score < _NO_MATCH}
@@ -0,0 +1,108 @@
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Metric in-process untuk endpoint /metrics (format teks Prometheus), tanpa dependency tambahan.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+IMAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, v: float) -> None:
+        for i, b in enumerate(self.buckets):
+            if v <= b:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += v
+
+    def lines(self, name: str, labels: str = "") -> List[str]:
+        sep = "," if labels else ""
+        out = [f'{name}_bucket{{{labels}{sep}le="{b:g}"}} {c}' for b, c in zip(self.buckets, self.counts)]
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.total}')
+        suffix = f"{{{labels}}}" if labels else ""
+        out.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        out.append(f"{name}_count{suffix} {self.total}")
+        return out
+
+
+_stage_seconds: Dict[str, Histogram] = {}
+_stage_cpu_seconds: Dict[str, float] = {}
+_pdf_seconds = Histogram(STAGE_BUCKETS)
+_image_hash_seconds = Histogram(IMAGE_BUCKETS)
+_counters: Dict[Tuple[str, str], float] = {}
+
+
+def _inc(name: str, labels: str = "", v: float = 1) -> None:
+    _counters[(name, labels)] = _counters.get((name, labels), 0) + v
+
+
+def observe_report(report: Dict[str, Any]) -> None:
+    """
+    Masukkan blok "timings" dari 1 report ingest ke metric.
+    """
+    t = report.get("timings") or {}
+    with _lock:
+        _inc("pdfdup_pdfs_total", 'result="already_ingested"' if report.get("already_ingested") else 'result="ingested"')
+        for stage, rec in t.get("stages", {}).items():
+            _stage_seconds.setdefault(stage, Histogram(STAGE_BUCKETS)).observe(rec["wall_s"])
+            _stage_cpu_seconds[stage] = _stage_cpu_seconds.get(stage, 0.0) + rec["cpu_s"]
+        _pdf_seconds.observe(t.get("total_wall_s", 0.0))
+        for img in t.get("images", []):
+            if img.get("hash_ms"):
+                _image_hash_seconds.observe(img["hash_ms"] / 1000)
+        counts = t.get("counts", {})
+        for source in ("embedded", "render"):
+            if counts.get(source):
+                _inc("pdfdup_images_total", f'source="{source}"', counts[source])
+        for key in ("bytes_read", "bytes_written", "pdf_bytes", "image_bytes"):
+            if counts.get(key):
+                _inc(f"pdfdup_{key}_total", "", counts[key])
+
+
+def observe_error() -> None:
+    with _lock:
+        _inc("pdfdup_pdfs_total", 'result="error"')
+
+
+def render(fingerprints: Optional[int] = None, jobs_pending: Optional[int] = None) -> str:
+    lines: List[str] = []
+    with _lock:
+        lines += ["# HELP pdfdup_stage_seconds Wall time per tahap ingest per PDF",
+                  "# TYPE pdfdup_stage_seconds histogram"]
+        for stage in sorted(_stage_seconds):
+            lines += _stage_seconds[stage].lines("pdfdup_stage_seconds", f'stage="{stage}"')
+
+        lines += ["# HELP pdfdup_stage_cpu_seconds_total CPU time per tahap ingest",
+                  "# TYPE pdfdup_stage_cpu_seconds_total counter"]
+        for stage in sorted(_stage_cpu_seconds):
+            lines.append(f'pdfdup_stage_cpu_seconds_total{{stage="{stage}"}} {_stage_cpu_seconds[stage]:.6f}')
+
+        lines += ["# HELP pdfdup_pdf_seconds Wall time total per PDF (semua tahap)",
+                  "# TYPE pdfdup_pdf_seconds histogram"]
+        lines += _pdf_seconds.lines("pdfdup_pdf_seconds")
+
+        lines += ["# HELP pdfdup_image_hash_seconds Waktu hashing per gambar",
+                  "# TYPE pdfdup_image_hash_seconds histogram"]
+        lines += _image_hash_seconds.lines("pdfdup_image_hash_seconds")
+
+        seen = set()
+        for (name, labels), v in sorted(_counters.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{{{labels}}} {v:g}" if labels else f"{name} {v:g}")
+
+    if fingerprints is not None:
+        lines += ["# HELP pdfdup_fingerprints Jumlah fingerprint di corpus",
+                  "# TYPE pdfdup_fingerprints gauge",
+                  f"pdfdup_fingerprints {fingerprints}"]
+    if jobs_pending is not None:
+        lines += ["# TYPE pdfdup_jobs_pending gauge", f"pdfdup_jobs_pending {jobs_pending}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,77 @@
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Optional
+
+from src.config import DB_PATH
+from src.db import FINGERPRINTS_DDL, LEGACY_HASH_INDEXES, hash_to_db, is_legacy_schema
+
+BATCH_SIZE = 50_000
+
+
+def migrate_hashes_to_int(db_path: Path = DB_PATH, vacuum: bool = True) -> Optional[int]:
+    """
+    Migrasi in-place: kolom phash/dhash/ehash dari hex TEXT -> INTEGER, index hash lama di-drop.
+    id fingerprint tetap sama. Aman dijalankan ulang (no-op kalau sudah schema baru).
+    return: jumlah fingerprint yang dimigrasi (bisa 0 kalau DB lama masih kosong),
+            atau None kalau DB sudah schema baru
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA foreign_keys=OFF;")
+    try:
+        if not is_legacy_schema(conn):
+            return None
+
+        total = 0
+        with conn:  # 1 transaksi: kalau gagal di tengah, DB tetap utuh (schema lama)
+            # sqlite3 tidak membuka transaksi otomatis untuk DDL: tanpa BEGIN, DROP/CREATE/RENAME
+            # langsung autocommit (tabel kosong = seluruh migrasi di luar transaksi)
+            conn.execute("BEGIN")
+            conn.execute("DROP TABLE IF EXISTS fingerprints_new")
+            conn.execute(FINGERPRINTS_DDL.format(table="fingerprints_new"))
+
+            src = conn.execute("SELECT id, image_id, phash, dhash, ehash FROM fingerprints ORDER BY id")
+            while True:
+                rows = src.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                conn.executemany(
+                    "INSERT INTO fingerprints_new(id, image_id, phash, dhash, ehash) VALUES(?,?,?,?,?)",
+                    [(fp_id, img_id, hash_to_db(ph), hash_to_db(dh), hash_to_db(eh))
+                     for fp_id, img_id, ph, dh, eh in rows]
+                )
+                total += len(rows)
+
+            for name in LEGACY_HASH_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+            conn.execute("DROP TABLE fingerprints")
+            conn.execute("ALTER TABLE fingerprints_new RENAME TO fingerprints")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_image_id ON fingerprints(image_id)")
+
+        if vacuum:
+            # kembalikan halaman bekas TEXT + index lama ke filesystem
+            conn.execute("VACUUM")
+        return total
+    finally:
+        conn.close()
+
+
+def main():
+    db_path = Path(sys.argv[1]) if len(sys.argv) >= 2 else DB_PATH
+    if not db_path.exists():
+        print(f"Database tidak ditemukan: {db_path}")
+        raise SystemExit(1)
+
+    size_before = db_path.stat().st_size
+    n = migrate_hashes_to_int(db_path)
+    if n is None:
+        print(f"{db_path}: sudah schema baru, tidak ada yang dimigrasi.")
+        return
+
+    size_after = db_path.stat().st_size
+    print(f"{db_path}: {n} fingerprint dimigrasi ke INTEGER.")
+    print(f"Ukuran DB: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,387 @@
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from uuid import uuid4
 import fitz  # PyMuPDF
-from typing import List, Tuple
-from src.config import RENDER_DPI
+from io import BytesIO
+from typing import List, Tuple, Iterator, Union, Optional, Dict, Set
+from PIL import Image, ImageStat
+from src.config import (
+    RENDER_DPI,
+    MIN_EMBEDDED_IMAGES_TO_SKIP_RENDER,
+    RENDER_WORKERS,
+    RENDER_PAGES_PER_TASK,
+    RENDER_AT_HASH_SIZE,
+    FILTER_TRIVIAL_IMAGES,
+    MIN_IMAGE_SIDE,
+    MIN_IMAGE_PIXELS,
+    MIN_IMAGE_STDDEV,
+    TRIVIAL_PAGE_RENDER_MIN_COVERAGE,
+)
+from src.fingerprint import HASH_INPUT_SIZE
 from src.image_utils import safe_save_jpg
 
-def extract_embedded_images(pdf_path: Path, out_dir: Path) -> List[Tuple[int, int, Path]]:
+# data gambar hasil extract: bytes asli (embedded) atau PIL image (hasil render)
+ImageData = Union[bytes, Image.Image]
+
+# Ukuran decode untuk cek gambar polos (cukup kecil supaya murah)
+_FLAT_CHECK_SIZE = 64
+# Gambar polos terkompresi sangat kecil; stream di atas rasio ini (byte/pixel) tidak perlu dicek sama sekali
+_FLAT_MAX_BYTES_PER_PIXEL = 0.05
+
+
+def _page_image_lists(doc: "fitz.Document") -> List[List[Tuple]]:
     """
-    Return list: (page_number_1based, img_index_1based, saved_path)
+    get_images(full=True) per halaman, dibaca sekali lalu dipakai untuk soft mask, hitung, dan extract.
     """
-    out_dir.mkdir(parents=True, exist_ok=True)
-    doc = fitz.open(pdf_path)
-    saved = []
+    return [doc[page_i].get_images(full=True) for page_i in range(len(doc))]
+
+
+def _smask_xrefs(image_lists: List[List[Tuple]]) -> Set[int]:
+    """
+    xref yang dipakai sebagai soft mask (alpha) gambar lain: bukan konten, tidak perlu di-hash.
+    """
+    return {img[1] for images in image_lists for img in images if img[1]}
+
 
-    for page_i in range(len(doc)):
-        page = doc[page_i]
-        image_list = page.get_images(full=True)
+def trivial_reason_meta(img: Tuple, smasks: Set[int]) -> Optional[str]:
+    """
+    Cek dari metadata get_images(full=True) saja (tanpa decode).
+    img: (xref, smask, width, height, bpc, colorspace, ...)
+    return: alasan dibuang ("smask", "mask", "tiny") atau None kalau gambar dipakai.
+    """
+    if not FILTER_TRIVIAL_IMAGES:
+        return None
+    xref, _, w, h, bpc, colorspace = img[:6]
+    if xref in smasks:
+        return "smask"
+    if bpc == 1 and not colorspace:
+        # stencil/image mask 1-bit tanpa colorspace
+        return "mask"
+    if w < MIN_IMAGE_SIDE or h < MIN_IMAGE_SIDE or w * h < MIN_IMAGE_PIXELS:
+        return "tiny"
+    return None
+
+
+def is_flat_image(data: ImageData, pixels: Optional[int] = None) -> bool:
+    """
+    Gambar polos/kosong (solid fill, halaman putih): deviasi standar grayscale sangat kecil.
+    Decode di resolusi kecil (JPEG draft), jauh lebih murah dari hashing.
+    pixels: luas gambar dari metadata; stream yang besar relatif ke luasnya pasti tidak polos (skip decode).
+    """
+    if not FILTER_TRIVIAL_IMAGES:
+        return False
+    if isinstance(data, bytes) and pixels and len(data) > pixels * _FLAT_MAX_BYTES_PER_PIXEL:
+        return False
+    try:
+        img = Image.open(BytesIO(data)) if isinstance(data, bytes) else data
+        if isinstance(data, bytes):
+            img.draft("L", (_FLAT_CHECK_SIZE, _FLAT_CHECK_SIZE))
+        g = img.convert("L")
+        g.thumbnail((_FLAT_CHECK_SIZE, _FLAT_CHECK_SIZE))
+        return ImageStat.Stat(g).stddev[0] < MIN_IMAGE_STDDEV
+    except Exception:
+        # format yang tidak bisa dibaca PIL: biarkan hashing yang menentukan
+        return False
+
+
+def _skip(skipped: Optional[Dict[str, int]], reason: str) -> None:
+    if skipped is not None:
+        skipped[reason] = skipped.get(reason, 0) + 1
+
+
+def _trivial_coverage(page: "fitz.Page", xrefs: Set[int]) -> float:
+    """
+    Fraksi luas halaman yang ditutup gambar-gambar ini (dari posisi gambar di halaman, tanpa decode).
+    """
+    area = abs(page.rect)
+    if area <= 0:
+        return 0.0
+    covered = 0.0
+    for xref in xrefs:
+        try:
+            rects = page.get_image_rects(xref)
+        except Exception:
+            continue
+        covered += sum(abs(r & page.rect) for r in rects)
+    return min(1.0, covered / area)
+
+
+def _iter_embedded_doc(doc: "fitz.Document", image_lists: List[List[Tuple]],
+                       skipped: Optional[Dict[str, int]] = None
+                       ) -> Iterator[Tuple[int, int, Optional[int], str, Optional[bytes]]]:
+    """
+    Isi iter_embedded_images untuk dokumen yang sudah dibuka. Halaman yang semua gambarnya dibuang
+    sebagai trivial tapi menutup bagian berarti dari halaman (lihat _trivial_coverage) di-yield sekali
+    sebagai (page, 1, None, "", None): kontennya bukan di embedded image (misal vector/teks di atas mask),
+    jadi pemanggil bisa render halaman itu. Halaman lain seperti itu (bullet/spacer di halaman teks)
+    dihitung sebagai "trivial_page" dan dilewati, sama seperti halaman teks tanpa gambar.
+    """
+    seen: Dict[int, str] = {}
+    dropped: Dict[int, str] = {}
+    smasks = _smask_xrefs(image_lists) if FILTER_TRIVIAL_IMAGES else set()
+    for page_i, image_list in enumerate(image_lists):
+        kept = 0
         for img_i, img in enumerate(image_list):
             xref = img[0]
-            base = doc.extract_image(xref)
-            img_bytes = base["image"]
-            ext = base.get("ext", "png")
-            out_path = out_dir / f"embedded_p{page_i+1}_img{img_i+1}.{ext}"
-            out_path.write_bytes(img_bytes)
-            saved.append((page_i + 1, img_i + 1, out_path))
-
-    doc.close()
-    return saved
+            if xref in dropped:
+                _skip(skipped, dropped[xref])
+                continue
+            if xref in seen:
+                kept += 1
+                yield page_i + 1, img_i + 1, xref, seen[xref], None
+                continue
+            reason = trivial_reason_meta(img, smasks)
+            if reason is None:
+                base = doc.extract_image(xref)
+                if is_flat_image(base["image"], img[2] * img[3]):
+                    reason = "flat"
+            if reason is not None:
+                dropped[xref] = reason
+                _skip(skipped, reason)
+                continue
+            seen[xref] = base.get("ext", "png")
+            kept += 1
+            yield page_i + 1, img_i + 1, xref, seen[xref], base["image"]
+        if image_list and kept == 0:
+            if _trivial_coverage(doc[page_i], {img[0] for img in image_list}) >= TRIVIAL_PAGE_RENDER_MIN_COVERAGE:
+                yield page_i + 1, 1, None, "", None
+            else:
+                _skip(skipped, "trivial_page")
+
 
-def render_pages_to_images(pdf_path: Path, out_dir: Path, dpi: int = RENDER_DPI) -> List[Tuple[int, int, Path]]:
+def iter_embedded_images(pdf_path: Path,
+                         skipped: Optional[Dict[str, int]] = None) -> Iterator[Tuple[int, int, int, str, Optional[bytes]]]:
     """
-    Render each page as one image.
-    Return list: (page_number_1based, img_index_1based(always 1), saved_path)
+    Yield (page_number_1based, img_index_1based, xref, ext, image_bytes) langsung dari PyMuPDF, tanpa tulis ke disk.
+    xref yang sama (logo/kop surat di tiap halaman) hanya di-extract sekali:
+    kemunculan berikutnya di-yield dengan image_bytes=None.
+    Gambar trivial (soft mask, spacer kecil, isi polos) tidak di-yield; jumlahnya per alasan
+    ditambahkan ke dict `skipped` kalau diberikan.
     """
-    out_dir.mkdir(parents=True, exist_ok=True)
     doc = fitz.open(pdf_path)
-    saved = []
+    try:
+        for page, idx, xref, ext, data in _iter_embedded_doc(doc, _page_image_lists(doc), skipped):
+            if xref is not None:
+                yield page, idx, xref, ext, data
+    finally:
+        doc.close()
+
+
+def pixmap_to_image(pix: "fitz.Pixmap") -> Image.Image:
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def _render_page(page: "fitz.Page", dpi: int, hash_size: Optional[int] = None) -> Image.Image:
+    zoom = page_zoom(page, dpi, hash_size)
+    return pixmap_to_image(page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False, colorspace=fitz.csRGB))
+
+
+def page_zoom(page: "fitz.Page", dpi: int, hash_size: Optional[int] = None) -> float:
+    """
+    Zoom render: dpi / 72, atau (hash_size) cukup supaya sisi terpendek halaman = hash_size px,
+    karena fingerprint toh di-resize ke hash_size x hash_size. Tidak pernah melebihi dpi.
+    """
     zoom = dpi / 72.0
-    mat = fitz.Matrix(zoom, zoom)
+    if hash_size:
+        short = min(page.rect.width, page.rect.height)
+        if short > 0:
+            zoom = min(zoom, hash_size / short)
+    return zoom
+
 
-    for page_i in range(len(doc)):
-        page = doc[page_i]
-        pix = page.get_pixmap(matrix=mat, alpha=False)
+def _render_range(pdf_path: Path, dpi: int, start: int, stop: int, out_dir: Optional[Path] = None,
+                  hash_size: Optional[int] = None) -> List[Tuple[int, Union[Image.Image, Path]]]:
+    """
+    Render halaman [start, stop) (0-based) dengan dokumen fitz sendiri (aman dipanggil di worker process).
+    out_dir: simpan JPG di sini dan return path-nya (tidak perlu kirim pixel antar process).
+    hash_size: render di resolusi hashing (lihat page_zoom), bukan dpi penuh.
+    return: list of (page_number_1based, image atau saved_path)
+    """
+    doc = fitz.open(pdf_path)
+    out: List[Tuple[int, Union[Image.Image, Path]]] = []
+    try:
+        for page_i in range(start, stop):
+            img = _render_page(doc[page_i], dpi, hash_size)
+            if out_dir is not None:
+                out_path = out_dir / extracted_filename("render", page_i + 1, 1, "jpg")
+                save_image_data(img, out_path)
+                out.append((page_i + 1, out_path))
+            else:
+                out.append((page_i + 1, img))
+    finally:
+        doc.close()
+    return out
+
+
+def _page_count(pdf_path: Path) -> int:
+    doc = fitz.open(pdf_path)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def _iter_render_ranges(pdf_path: Path, dpi: int, workers: Optional[int], out_dir: Optional[Path],
+                        hash_size: Optional[int] = None) -> Iterator[Tuple[int, Union[Image.Image, Path]]]:
+    """
+    Render semua halaman, dibagi per range RENDER_PAGES_PER_TASK ke worker process.
+    Urutan output tetap urut halaman; jumlah range yang jalan dibatasi supaya memory tidak meledak.
+    """
+    workers = RENDER_WORKERS if workers is None else workers
+    n_pages = _page_count(pdf_path)
+    # di dalam worker process (misal ingest_folder --workers) tidak bikin pool bersarang
+    if workers <= 1 or n_pages <= 1 or multiprocessing.parent_process() is not None:
+        yield from _render_range(pdf_path, dpi, 0, n_pages, out_dir, hash_size)
+        return
+
+    step = max(1, min(RENDER_PAGES_PER_TASK, -(-n_pages // workers)))
+    ranges = iter([(s, min(n_pages, s + step)) for s in range(0, n_pages, step)])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: deque = deque()
+
+        def submit_next() -> None:
+            r = next(ranges, None)
+            if r is not None:
+                pending.append(pool.submit(_render_range, pdf_path, dpi, r[0], r[1], out_dir, hash_size))
+
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            fut = pending.popleft()
+            submit_next()
+            yield from fut.result()
+
+
+def iter_rendered_pages(pdf_path: Path, dpi: int = RENDER_DPI, workers: Optional[int] = None,
+                        hash_size: Optional[int] = None) -> Iterator[Tuple[int, int, Image.Image]]:
+    """
+    Render tiap halaman langsung jadi PIL image (dari pixmap samples, tanpa PNG sementara).
+    workers > 1: halaman dirender paralel di beberapa process (default RENDER_WORKERS).
+    hash_size: render hanya sebesar yang dibutuhkan fingerprint (sisi terpendek = hash_size px).
+    Yield (page_number_1based, img_index_1based(always 1), image)
+    """
+    for page, img in _iter_render_ranges(pdf_path, dpi, workers, None, hash_size):
+        yield page, 1, img
+
+
+def count_embedded_images(pdf_path: Path) -> int:
+    """
+    Jumlah embedded image yang tidak trivial menurut metadata (spacer/mask tidak dihitung,
+    jadi PDF scan yang hanya punya gambar kecil tetap lewat render halaman).
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        return _count_embedded(_page_image_lists(doc))
+    finally:
+        doc.close()
+
+
+def _count_embedded(image_lists: List[List[Tuple]]) -> int:
+    smasks = _smask_xrefs(image_lists) if FILTER_TRIVIAL_IMAGES else set()
+    return sum(1 for images in image_lists for img in images if trivial_reason_meta(img, smasks) is None)
+
+
+def iter_pdf_images(pdf_path: Path, dpi: int = RENDER_DPI, render_workers: Optional[int] = None,
+                    hash_only: bool = RENDER_AT_HASH_SIZE, skipped: Optional[Dict[str, int]] = None
+                    ) -> Iterator[Tuple[str, int, int, Optional[int], str, Optional[ImageData]]]:
+    """
+    Embedded images kalau cukup, kalau tidak fallback render halaman. Di PDF embedded, halaman yang
+    semua gambarnya dibuang sebagai trivial juga dirender (kalau tidak, halaman itu hilang dari dedup).
+    Yield (source, page, img_index, xref, ext, data) dengan source "embedded"/"render".
+    Untuk render xref=None; untuk embedded, data=None berarti xref ini sudah di-yield sebelumnya.
+    hash_only: halaman dirender di resolusi hashing (bukan dpi), cukup untuk fingerprint, tidak untuk preview.
+    skipped: dict yang diisi jumlah gambar trivial yang dibuang per alasan (termasuk halaman kosong).
+    """
+    hash_size = HASH_INPUT_SIZE if hash_only else None
+    doc = fitz.open(pdf_path)
+    try:
+        image_lists = _page_image_lists(doc)
+        if _count_embedded(image_lists) >= MIN_EMBEDDED_IMAGES_TO_SKIP_RENDER:
+            for page, idx, xref, ext, data in _iter_embedded_doc(doc, image_lists, skipped):
+                if xref is not None:
+                    yield "embedded", page, idx, xref, ext, data
+                    continue
+                # semua gambar di halaman ini trivial: render halamannya supaya tetap ikut dedup
+                img = _render_page(doc[page - 1], dpi, hash_size)
+                if is_flat_image(img):
+                    _skip(skipped, "blank_page")
+                    continue
+                yield "render", page, idx, None, "jpg", img
+            return
+    finally:
+        doc.close()
+
+    for page, idx, img in iter_rendered_pages(pdf_path, dpi, render_workers, hash_size):
+        if is_flat_image(img):
+            # halaman kosong: semua halaman kosong akan saling DUP
+            _skip(skipped, "blank_page")
+            continue
+        yield "render", page, idx, None, "jpg", img
+
+
+def extracted_filename(source: str, page: int, img_index: int, ext: str) -> str:
+    if source == "render":
+        return f"render_p{page}.jpg"
+    return f"embedded_p{page}_img{img_index}.{ext}"
+
+
+def save_image_data(data: ImageData, out_path: Path) -> None:
+    """
+    Simpan hasil extract: bytes ditulis apa adanya, image render disimpan sebagai JPG.
+    """
+    if isinstance(data, bytes):
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_bytes(data)
+    else:
         # simpan sebagai JPG via PIL (lebih kecil daripada PNG)
-        tmp_png = out_dir / f"_tmp_render_p{page_i+1}.png"
-        pix.save(str(tmp_png))
+        safe_save_jpg(data, out_path, quality=92)
 
-        from PIL import Image
-        img = Image.open(tmp_png).convert("RGB")
-        out_path = out_dir / f"render_p{page_i+1}.jpg"
-        safe_save_jpg(img, out_path, quality=92)
-        tmp_png.unlink(missing_ok=True)
 
-        saved.append((page_i + 1, 1, out_path))
+def extract_embedded_images(pdf_path: Path, out_dir: Path) -> List[Tuple[int, int, Path]]:
+    """
+    Return list: (page_number_1based, img_index_1based, saved_path)
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    saved = []
+    first_path: Dict[int, Path] = {}
+
+    for page, idx, xref, ext, data in iter_embedded_images(pdf_path):
+        if data is None:
+            # xref berulang: pakai file yang sudah disimpan
+            saved.append((page, idx, first_path[xref]))
+            continue
+        out_path = out_dir / extracted_filename("embedded", page, idx, ext)
+        save_image_data(data, out_path)
+        first_path[xref] = out_path
+        saved.append((page, idx, out_path))
 
-    doc.close()
     return saved
+
+
+def render_pages_to_images(pdf_path: Path, out_dir: Path, dpi: int = RENDER_DPI,
+                           workers: Optional[int] = None) -> List[Tuple[int, int, Path]]:
+    """
+    Render each page as one image (workers > 1: paralel per range halaman, tiap worker tulis JPG sendiri).
+    Return list: (page_number_1based, img_index_1based(always 1), saved_path)
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return [(page, 1, out_path) for page, out_path in _iter_render_ranges(pdf_path, dpi, workers, out_dir)]
+
+
+def render_page_to_file(pdf_path: Path, page: int, out_path: Path, dpi: int = RENDER_DPI) -> Path:
+    """
+    Render 1 halaman (1-based) di dpi penuh ke out_path. Dipakai untuk preview render yang dibuat
+    belakangan (lazy) kalau saat ingest halaman hanya dirender di resolusi hashing.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        img = _render_page(doc[page - 1], dpi)
+    finally:
+        doc.close()
+    # tulis lewat file sementara supaya pembaca paralel tidak dapat file setengah jadi
+    tmp_path = out_path.with_name(f"{out_path.stem}.{uuid4().hex}.tmp")
+    safe_save_jpg(img, tmp_path, quality=92)
+    tmp_path.replace(out_path)
+    return out_path
@@ -0,0 +1,121 @@
+from typing import Any, Dict, Iterable, List, Tuple
+import numpy as np
+
+from src.config import REGION_THRESHOLD, REGION_MIN_VOTES, REGION_MAX_BUCKET
+from src.hash_index import MultiIndexHash, popcount64
+
+# Kandidat crop per query yang dikembalikan (urut vote terbanyak)
+REGION_TOP_K = 5
+
+RegionRow = Tuple[int, int, np.ndarray]
+
+
+class RegionIndex:
+    """
+    Inverted index region hash (lihat fingerprint.compute_region_hashes) seluruh corpus.
+    Tiap region non-polos jadi 1 entry (fingerprint_id, image_id, hash) di MultiIndexHash,
+    jadi lookup 1 region hanya menyentuh bucket di sekitar hash-nya, bukan semua region x semua gambar.
+    """
+
+    def __init__(self, rows: Iterable[RegionRow] = ()):
+        self._n = 0
+        self.fp_ids = np.empty(0, dtype=np.int64)
+        self.image_ids = np.empty(0, dtype=np.int64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self._mih = MultiIndexHash()
+        self.extend(rows)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _reserve(self, extra: int) -> None:
+        need = self._n + extra
+        cap = len(self.hashes)
+        if need <= cap:
+            return
+        new_cap = max(need, cap * 2, 4096)
+        for name in ("fp_ids", "image_ids", "hashes"):
+            old = getattr(self, name)
+            arr = np.empty(new_cap, dtype=old.dtype)
+            arr[:self._n] = old[:self._n]
+            setattr(self, name, arr)
+
+    def extend(self, rows: Iterable[RegionRow]) -> None:
+        """
+        rows: iterable of (fingerprint_id, image_id, region_hashes uint64); region 0 (polos) dilewati.
+        """
+        fp_ids: List[np.ndarray] = []
+        image_ids: List[np.ndarray] = []
+        hashes: List[np.ndarray] = []
+        for fp_id, image_id, regions in rows:
+            regions = np.asarray(regions, dtype=np.uint64)
+            regions = regions[regions != 0]
+            fp_ids.append(np.full(len(regions), fp_id, dtype=np.int64))
+            image_ids.append(np.full(len(regions), image_id, dtype=np.int64))
+            hashes.append(regions)
+        if not hashes:
+            return
+        values = np.concatenate(hashes)
+        k = len(values)
+        if k == 0:
+            return
+        self._reserve(k)
+        s = slice(self._n, self._n + k)
+        self.fp_ids[s] = np.concatenate(fp_ids)
+        self.image_ids[s] = np.concatenate(image_ids)
+        self.hashes[s] = values
+        self._mih.add_many(values, np.arange(self._n, self._n + k, dtype=np.int64))
+        self._n += k
+
+    def lookup(self, regions: np.ndarray, top_k: int = REGION_TOP_K) -> List[Dict[str, Any]]:
+        """
+        Voting: tiap region query yang cocok (jarak <= REGION_THRESHOLD) ke region sebuah gambar
+        memberi 1 vote ke gambar itu (maksimal 1 vote per region query per gambar).
+        return: kandidat dengan vote >= REGION_MIN_VOTES, urut vote terbanyak lalu jarak terdekat:
+                list of {"fingerprint_id", "image_id", "votes", "region_dist"}
+        """
+        regions = np.asarray(regions, dtype=np.uint64)
+        if self._n == 0:
+            return []
+        hit_pos: List[np.ndarray] = []
+        hit_q: List[np.ndarray] = []
+        hit_d: List[np.ndarray] = []
+        hashes = self.hashes[:self._n]
+        for qi, value in enumerate(regions):
+            if value == 0:
+                continue
+            cand = self._mih.candidates(int(value), REGION_THRESHOLD, max_bucket=REGION_MAX_BUCKET)
+            if len(cand) == 0:
+                continue
+            d = popcount64(hashes[cand] ^ value)
+            ok = d <= REGION_THRESHOLD
+            hit_pos.append(cand[ok])
+            hit_q.append(np.full(int(ok.sum()), qi, dtype=np.int64))
+            hit_d.append(d[ok].astype(np.int16))
+        if not hit_pos:
+            return []
+
+        pos = np.concatenate(hit_pos)
+        if len(pos) == 0:
+            return []
+        fp = self.fp_ids[pos]
+        q = np.concatenate(hit_q)
+        d = np.concatenate(hit_d)
+
+        # 1 vote per (gambar, region query): buang pasangan dobel, simpan jarak terkecil
+        order = np.lexsort((d, q, fp))
+        fp, q, d, pos = fp[order], q[order], d[order], pos[order]
+        first = np.ones(len(fp), dtype=bool)
+        first[1:] = (fp[1:] != fp[:-1]) | (q[1:] != q[:-1])
+        fp, d, pos = fp[first], d[first], pos[first]
+
+        uniq, start, votes = np.unique(fp, return_index=True, return_counts=True)
+        best_d = np.minimum.reduceat(d, start)
+        keep = votes >= REGION_MIN_VOTES
+        uniq, start, votes, best_d = uniq[keep], start[keep], votes[keep], best_d[keep]
+
+        rank = np.lexsort((best_d, -votes))[:top_k]
+        return [{"fingerprint_id": int(uniq[r]),
+                 "image_id": int(self.image_ids[pos[start[r]]]),
+                 "votes": int(votes[r]),
+                 "region_dist": int(best_d[r])} for r in rank]
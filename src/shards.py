@@ -0,0 +1,378 @@
+"""
+Export / merge shard fingerprint untuk ingest di beberapa mesin.
+
+Shard = 1 file .zip:
+  shard.db            SQLite kecil: pdf_files, images, fingerprints, region_hashes (id asli mesin asal)
+  manifest.json       asal shard, waktu export, jumlah baris, isi file opsional
+  images/pdf_<id>/..  (opsional, --images) hasil extract/render yang tersimpan
+  pdfs/<id>/<nama>    (opsional, --pdfs) file PDF asli
+
+Merge memasukkan satu atau beberapa shard ke DB pusat dalam 1 transaksi. id di-remap dengan offset
+(id lama - id terkecil di shard + 1 + id terbesar di DB pusat), jadi urutan id tetap dan tidak bentrok.
+PDF yang digest-nya sudah ada di DB pusat (di-ingest di 2 mesin, atau shard di-merge ulang) dilewati.
+Sebelum masuk, fingerprint tiap shard dicocokkan (vectorized, lewat matcher) ke DB pusat + shard
+sebelumnya di run yang sama; hasilnya = report duplicate lintas shard.
+
+Jalankan dari root repo:
+  py run.py export storage\\shard_mesin1.zip [--images] [--pdfs]
+  py run.py merge shard_mesin1.zip shard_mesin2.zip [--report merge_report.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+from src.config import IMAGES_DIR, PDF_DIR, FP_SNAPSHOT
+from src.db import get_conn, init_db, session, hash_from_db, fetch_fingerprints_since, fetch_images_info
+from src.fp_snapshot import open_snapshot
+from src.matcher import FingerprintIndex, find_best_matches
+
+SHARD_FORMAT = 1
+BATCH_SIZE = 50_000
+
+SHARD_DDL = """
+    CREATE TABLE pdf_files (
+        id INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        stored_path TEXT NOT NULL,
+        uploaded_at TEXT,
+        digest TEXT
+    );
+    CREATE TABLE images (
+        id INTEGER PRIMARY KEY,
+        pdf_id INTEGER NOT NULL,
+        page INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        img_index INTEGER NOT NULL,
+        file TEXT NOT NULL,
+        width INTEGER,
+        height INTEGER,
+        created_at TEXT,
+        digest TEXT
+    );
+    CREATE TABLE fingerprints (
+        id INTEGER PRIMARY KEY,
+        image_id INTEGER NOT NULL,
+        phash INTEGER NOT NULL,
+        dhash INTEGER NOT NULL,
+        ehash INTEGER NOT NULL
+    );
+    CREATE TABLE region_hashes (
+        fingerprint_id INTEGER PRIMARY KEY,
+        image_id INTEGER NOT NULL,
+        layout TEXT NOT NULL,
+        hashes BLOB NOT NULL
+    );
+"""
+
+
+def _basename(path: str) -> str:
+    # img_path bisa berasal dari Windows (backslash) atau Linux
+    return path.replace("\\", "/").rsplit("/", 1)[-1] if path else ""
+
+
+def _copy_table(src: sqlite3.Connection, dst: sqlite3.Connection, select_sql: str, insert_sql: str,
+                transform=None) -> int:
+    n = 0
+    cur = src.execute(select_sql)
+    while True:
+        rows = cur.fetchmany(BATCH_SIZE)
+        if not rows:
+            return n
+        if transform is not None:
+            rows = [transform(r) for r in rows]
+        dst.executemany(insert_sql, rows)
+        n += len(rows)
+
+
+def export_shard(out_path: Path, with_images: bool = False, with_pdfs: bool = False) -> Dict[str, Any]:
+    """
+    Tulis semua pdf_files/images/fingerprints/region_hashes DB ini ke 1 file shard (.zip).
+    return: manifest shard
+    """
+    init_db()
+    tmp_dir = Path(tempfile.mkdtemp(prefix="pdfdup_shard_"))
+    try:
+        shard_db = tmp_dir / "shard.db"
+        dst = sqlite3.connect(shard_db)
+        dst.executescript(SHARD_DDL)
+        src = get_conn()
+        try:
+            # 1 read transaction: isi shard konsisten walau ada ingest yang sedang jalan
+            src.execute("BEGIN")
+            counts = {
+                "pdf_files": _copy_table(
+                    src, dst, "SELECT id, filename, stored_path, uploaded_at, digest FROM pdf_files ORDER BY id",
+                    "INSERT INTO pdf_files VALUES(?,?,?,?,?)"),
+                "images": _copy_table(
+                    src, dst, "SELECT id, pdf_id, page, source, img_index, img_path, width, height, created_at, digest "
+                              "FROM images ORDER BY id",
+                    "INSERT INTO images VALUES(?,?,?,?,?,?,?,?,?,?)",
+                    lambda r: r[:5] + (_basename(r[5]),) + r[6:]),
+                "fingerprints": _copy_table(
+                    src, dst, "SELECT id, image_id, phash, dhash, ehash FROM fingerprints ORDER BY id",
+                    "INSERT INTO fingerprints VALUES(?,?,?,?,?)"),
+                "region_hashes": _copy_table(
+                    src, dst, "SELECT fingerprint_id, image_id, layout, hashes FROM region_hashes "
+                              "ORDER BY fingerprint_id",
+                    "INSERT INTO region_hashes VALUES(?,?,?,?)"),
+            }
+            files: List[Tuple[str, str]] = []  # (path di disk, nama di zip)
+            if with_images:
+                for image_id, pdf_id, img_path in src.execute("SELECT id, pdf_id, img_path FROM images ORDER BY id"):
+                    if img_path and Path(img_path).exists():
+                        files.append((img_path, f"images/pdf_{pdf_id}/{_basename(img_path)}"))
+            if with_pdfs:
+                for pdf_id, stored_path in src.execute("SELECT id, stored_path FROM pdf_files ORDER BY id"):
+                    if stored_path and Path(stored_path).exists():
+                        files.append((stored_path, f"pdfs/{pdf_id}/{_basename(stored_path)}"))
+            src.rollback()
+        finally:
+            src.close()
+        dst.commit()
+        dst.execute("VACUUM")
+        dst.close()
+
+        manifest = {
+            "format": SHARD_FORMAT,
+            "source": socket.gethostname(),
+            "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "counts": counts,
+            "images": with_images,
+            "pdfs": with_pdfs,
+        }
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_zip = out_path.with_name(f"{out_path.name}.tmp")
+        with zipfile.ZipFile(tmp_zip, "w") as z:
+            z.writestr("manifest.json", json.dumps(manifest, indent=2))
+            z.write(shard_db, "shard.db", compress_type=zipfile.ZIP_DEFLATED)
+            # gambar & PDF sudah terkompresi: simpan apa adanya
+            seen: Set[str] = set()
+            for path, arcname in files:
+                if arcname not in seen:
+                    seen.add(arcname)
+                    z.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+        tmp_zip.replace(out_path)
+        return manifest
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _id_offset(conn: sqlite3.Connection, shard: sqlite3.Connection, table: str) -> int:
+    """
+    Offset remap id: id baru = id shard + offset (id terkecil shard jadi max id pusat + 1).
+    """
+    central_max = int(conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0])
+    shard_min = shard.execute(f"SELECT MIN(id) FROM {table}").fetchone()[0]
+    return central_max + 1 - int(shard_min) if shard_min is not None else 0
+
+
+def _existing_digests(conn: sqlite3.Connection, digests: List[str]) -> Set[str]:
+    found: Set[str] = set()
+    for i in range(0, len(digests), 900):
+        chunk = digests[i:i + 900]
+        marks = ",".join("?" * len(chunk))
+        found.update(r[0] for r in conn.execute(f"SELECT digest FROM pdf_files WHERE digest IN ({marks})", chunk))
+    return found
+
+
+def _merge_one(conn: sqlite3.Connection, shard: sqlite3.Connection, z: zipfile.ZipFile, manifest: Dict[str, Any],
+               index: FingerprintIndex, staging: Path) -> Dict[str, Any]:
+    """
+    Masukkan 1 shard (di dalam transaksi pemanggil). Fingerprint shard dicocokkan dulu ke index
+    (DB pusat + shard sebelumnya), lalu index ditambah fingerprint shard ini.
+    """
+    pdf_off = _id_offset(conn, shard, "pdf_files")
+    img_off = _id_offset(conn, shard, "images")
+    fp_off = _id_offset(conn, shard, "fingerprints")
+    names = set(z.namelist())
+
+    # PDF yang sudah ada di DB pusat (digest sama) tidak dimasukkan lagi
+    pdf_rows = shard.execute(
+        "SELECT id, filename, stored_path, uploaded_at, digest FROM pdf_files ORDER BY id").fetchall()
+    known = _existing_digests(conn, [r[4] for r in pdf_rows if r[4]])
+    skipped_pdfs = {r[0] for r in pdf_rows if r[4] in known}
+    pdf_new: List[Tuple] = []
+    for pdf_id, filename, stored_path, uploaded_at, digest in pdf_rows:
+        if pdf_id in skipped_pdfs:
+            continue
+        new_id = pdf_id + pdf_off
+        arc = f"pdfs/{pdf_id}/{_basename(stored_path)}"
+        if arc in names:
+            # selalu prefix id baru: nama asli bisa bentrok dengan storage pusat, shard lain, atau PDF lain
+            # di shard yang sama, dan semuanya baru dipindah dari staging setelah commit
+            target = PDF_DIR / f"{new_id}_{_basename(stored_path)}"
+            _extract_to(z, arc, staging / "pdfs" / target.name)
+            stored_path = str(target)
+        pdf_new.append((new_id, filename, stored_path, uploaded_at, digest))
+    conn.executemany("INSERT INTO pdf_files(id, filename, stored_path, uploaded_at, digest) VALUES(?,?,?,?,?)", pdf_new)
+
+    skipped_images: Set[int] = set()
+    n_images = 0
+    cur = shard.execute("SELECT id, pdf_id, page, source, img_index, file, width, height, created_at, digest "
+                        "FROM images ORDER BY id")
+    while True:
+        rows = cur.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        batch = []
+        for image_id, pdf_id, page, source, img_index, file, w, h, created_at, digest in rows:
+            if pdf_id in skipped_pdfs:
+                skipped_images.add(image_id)
+                continue
+            img_path = ""
+            arc = f"images/pdf_{pdf_id}/{file}"
+            # render yang preview-nya belum dibuat tetap dapat path (dibuat saat dilihat, kalau PDF ikut)
+            if file and (arc in names or (source == "render" and manifest.get("pdfs"))):
+                img_path = str(IMAGES_DIR / f"pdf_{pdf_id + pdf_off}" / file)
+                if arc in names:
+                    _extract_to(z, arc, staging / "images" / f"pdf_{pdf_id + pdf_off}" / file)
+            batch.append((image_id + img_off, pdf_id + pdf_off, page, source, img_index, img_path, w, h,
+                          created_at, digest))
+        conn.executemany("""
+            INSERT INTO images(id, pdf_id, page, source, img_index, img_path, width, height, created_at, digest)
+            VALUES(?,?,?,?,?,?,?,?,?,?)
+        """, batch)
+        n_images += len(batch)
+
+    fp_rows: List[Tuple] = []
+    skipped_fps: Set[int] = set()
+    for r in shard.execute("SELECT id, image_id, phash, dhash, ehash FROM fingerprints ORDER BY id"):
+        if r[1] in skipped_images:
+            skipped_fps.add(r[0])
+        else:
+            fp_rows.append(r)
+    new_fps = [(fp_id + fp_off, image_id + img_off, hash_from_db(ph), hash_from_db(dh), hash_from_db(eh))
+               for fp_id, image_id, ph, dh, eh in fp_rows]
+
+    # duplicate lintas shard: semua fingerprint shard vs index sekaligus (blok numpy / multi-index hashing)
+    matches = find_best_matches([r[2:] for r in new_fps], index)
+    dup_pairs = [(fp[1], m) for fp, m in zip(new_fps, matches) if m is not None]
+
+    conn.executemany("INSERT INTO fingerprints(id, image_id, phash, dhash, ehash) VALUES(?,?,?,?,?)",
+                     [(fp_id + fp_off, image_id + img_off, ph, dh, eh) for fp_id, image_id, ph, dh, eh in fp_rows])
+    regions = [(fp_id + fp_off, image_id + img_off, layout, blob)
+               for fp_id, image_id, layout, blob in shard.execute(
+                   "SELECT fingerprint_id, image_id, layout, hashes FROM region_hashes ORDER BY fingerprint_id")
+               if fp_id not in skipped_fps]
+    conn.executemany("INSERT OR REPLACE INTO region_hashes(fingerprint_id, image_id, layout, hashes) VALUES(?,?,?,?)",
+                     regions)
+    index.extend(new_fps)
+
+    infos = fetch_images_info([i for i, _ in dup_pairs] + [m["image_id"] for _, m in dup_pairs], conn=conn)
+    duplicates = []
+    for image_id, m in dup_pairs:
+        new, old = infos.get(image_id), infos.get(m["image_id"])
+        if not new or not old:
+            continue
+        # info: (images.id, pdf_id, page, source, img_index, img_path, pdf_filename, pdf_stored_path)
+        duplicates.append({
+            "image_id": image_id, "pdf_id": new[1], "pdf_filename": new[6], "page": new[2], "img_index": new[4],
+            "old_image_id": old[0], "old_pdf_id": old[1], "old_pdf_filename": old[6], "old_page": old[2],
+            "old_img_index": old[4],
+            **{k: m[k] for k in ("score", "phash_dist", "dhash_dist", "ehash_dist")},
+        })
+
+    return {
+        "source": manifest.get("source"),
+        "pdfs": len(pdf_new),
+        "pdfs_skipped": len(skipped_pdfs),
+        "images": n_images,
+        "fingerprints": len(new_fps),
+        "cross_shard_duplicates": duplicates,
+    }
+
+
+def _extract_to(z: zipfile.ZipFile, arcname: str, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with z.open(arcname) as src, open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def _move_tree(src: Path, dst: Path) -> None:
+    if not src.exists():
+        return
+    for path in src.rglob("*"):
+        if path.is_file():
+            target = dst / path.relative_to(src)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(path), str(target))
+
+
+def merge_shards(shard_paths: List[Path]) -> Dict[str, Any]:
+    """
+    Merge semua shard ke DB pusat dalam 1 transaksi (gagal di tengah = tidak ada yang masuk).
+    File gambar/PDF dari shard ditaruh di staging dulu, baru dipindah ke storage setelah commit.
+    return: {"shards": [ringkasan per shard + cross_shard_duplicates]}
+    """
+    init_db()
+    tmp_dir = Path(tempfile.mkdtemp(prefix="pdfdup_merge_"))
+    staging = IMAGES_DIR / "_staging" / f"merge_{os.getpid()}_{int(time.time())}"
+    results = []
+    try:
+        with session() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # index awal = seluruh DB pusat (snapshot memmap + delta kalau ada)
+            snap = open_snapshot() if FP_SNAPSHOT else None
+            index = FingerprintIndex(base=snap[0]) if snap else FingerprintIndex()
+            index.extend(fetch_fingerprints_since(snap[1] if snap else 0, conn=conn))
+
+            for k, shard_path in enumerate(shard_paths):
+                with zipfile.ZipFile(shard_path) as z:
+                    manifest = json.loads(z.read("manifest.json"))
+                    if manifest.get("format") != SHARD_FORMAT:
+                        raise ValueError(f"{shard_path}: format shard tidak dikenal ({manifest.get('format')})")
+                    shard_db = tmp_dir / f"shard_{k}.db"
+                    _extract_to(z, "shard.db", shard_db)
+                    shard = sqlite3.connect(shard_db)
+                    try:
+                        res = _merge_one(conn, shard, z, manifest, index, staging)
+                    finally:
+                        shard.close()
+                res["shard"] = str(shard_path)
+                results.append(res)
+        _move_tree(staging / "images", IMAGES_DIR)
+        _move_tree(staging / "pdfs", PDF_DIR)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {"shards": results}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Export / merge shard fingerprint")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export", help="export DB ini jadi 1 file shard (.zip)")
+    ex.add_argument("out")
+    ex.add_argument("--images", action="store_true", help="ikutkan file gambar hasil extract/render")
+    ex.add_argument("--pdfs", action="store_true", help="ikutkan file PDF asli")
+    mg = sub.add_parser("merge", help="merge 1 atau lebih shard ke DB ini (1 transaksi)")
+    mg.add_argument("shards", nargs="+")
+    mg.add_argument("--report", help="tulis report duplicate lintas shard (JSON) ke file ini")
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        manifest = export_shard(Path(args.out), with_images=args.images, with_pdfs=args.pdfs)
+        c = manifest["counts"]
+        print(f"Shard {args.out}: {c['pdf_files']} PDF, {c['images']} image, {c['fingerprints']} fingerprint")
+        return
+
+    report = merge_shards([Path(p) for p in args.shards])
+    for r in report["shards"]:
+        print(f"{r['shard']} ({r['source']}): {r['pdfs']} PDF masuk, {r['pdfs_skipped']} sudah ada (skip), "
+              f"{r['fingerprints']} fingerprint, {len(r['cross_shard_duplicates'])} duplicate lintas shard")
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Report: {args.report}")
+    print("Jalankan 'py run.py snapshot' supaya snapshot fingerprint ikut berisi data hasil merge.")
+
+
+if __name__ == "__main__":
+    main()
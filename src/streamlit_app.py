@@ -1,15 +1,14 @@
 from pathlib import Path
-from uuid import uuid4
 import json
 
 import pandas as pd
 import streamlit as st
 
+from src.config import MAX_UPLOAD_BYTES, STREAMLIT_CACHE_ENTRIES, STREAMLIT_CACHE_TTL
 from src.ingest_pdf import ingest_pdf
-from src.compare_pdfs import compare_pdfs
-
-UPLOAD_DIR = Path("storage/uploads")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+from src.compare_pdfs import COMPARE_DIR, compare_pdfs, image_key, save_compare_images
+from src.uploads import save_upload_chunks, iter_file_chunks, digest_chunks
+from src.thumbnails import get_thumbnail, ensure_image_file
 
 st.set_page_config(
     page_title="PDF Image Duplicate Checker",
@@ -23,15 +22,25 @@ st.caption("Upload PDF → extract gambar → cek duplicate (vs database) atau c
 st.sidebar.header("⚙️ Pengaturan Tampilan")
 show_previews = st.sidebar.checkbox("Tampilkan preview gambar", value=True)
 max_preview_rows = st.sidebar.slider("Maks baris preview", min_value=1, max_value=50, value=10)
+show_full_size = st.sidebar.checkbox("Preview ukuran penuh (lebih berat)", value=False)
 st.sidebar.divider()
 st.sidebar.caption("Catatan: Proses bisa agak lama jika PDF scan (render halaman).")
 
 mode = st.radio("Mode", ["Cek vs Database (1 PDF)", "Compare 2 PDF"], horizontal=True)
 
-def safe_image_show(path: str, caption: str):
+def safe_image_show(path: str, caption: str, image_id=None):
+    if not path and pd.isna(image_id):
+        st.warning(f"{caption}: gambar tidak tersedia")
+        return
     try:
         p = Path(path)
+        if not p.exists() and path and not pd.isna(image_id):
+            # halaman render yang preview-nya belum pernah dibuat (lazy)
+            p = ensure_image_file(int(image_id)) or p
         if p.exists():
+            # default kirim thumbnail ke browser, gambar asli hanya kalau diminta
+            if not show_full_size:
+                p = get_thumbnail(str(p), None if pd.isna(image_id) else int(image_id)) or p
             st.image(str(p), caption=caption, use_container_width=True)
         else:
             st.warning(f"Gambar tidak ditemukan: {p}")
@@ -39,6 +48,70 @@ def safe_image_show(path: str, caption: str):
         st.warning(f"Gagal menampilkan gambar: {e}")
 
 
+if st.get_option("server.maxUploadSize") * 1024 * 1024 > MAX_UPLOAD_BYTES:
+    # upload sudah utuh di memory sebelum dicek di upload_digest: batas server yang melindungi memory
+    st.sidebar.warning(f"server.maxUploadSize ({st.get_option('server.maxUploadSize')} MB) lebih besar dari "
+                       f"MAX_UPLOAD_BYTES; jalankan lewat `py run.py ui` atau sesuaikan .streamlit/config.toml")
+
+
+def upload_digest(uploaded) -> str:
+    """
+    Digest UploadedFile (sudah di memory) untuk key cache; stop kalau terlalu besar.
+    Batas memory sebenarnya = server.maxUploadSize (diisi dari MAX_UPLOAD_BYTES oleh run.py ui).
+    """
+    if uploaded.size > MAX_UPLOAD_BYTES:
+        st.error(f"{uploaded.name}: file lebih besar dari batas {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+        st.stop()
+    return digest_chunks(iter_file_chunks(uploaded))
+
+
+def save_uploaded(uploaded):
+    """
+    Simpan UploadedFile ke storage/uploads per chunk. return: (path, digest)
+    """
+    return save_upload_chunks(uploaded.name, iter_file_chunks(uploaded))
+
+
+# Cache per digest file (+ mode lewat fungsi yang berbeda). Argumen berawalan "_" tidak ikut key,
+# jadi rerun karena widget (filter, slider, checkbox) langsung pakai hasil lama tanpa sentuh DB.
+@st.cache_data(max_entries=STREAMLIT_CACHE_ENTRIES, ttl=STREAMLIT_CACHE_TTL, show_spinner=False)
+def cached_ingest(digest: str, _uploaded) -> dict:
+    tmp_path, _ = save_uploaded(_uploaded)
+    # file upload dipindah ke storage/pdfs, bukan di-copy lagi
+    return ingest_pdf(tmp_path, pdf_digest=digest, move=True)
+
+
+@st.cache_data(max_entries=STREAMLIT_CACHE_ENTRIES, ttl=STREAMLIT_CACHE_TTL, show_spinner=False)
+def cached_compare(digest_a: str, digest_b: str, _up_a, _up_b) -> dict:
+    a_path, _ = save_uploaded(_up_a)
+    b_path, _ = save_uploaded(_up_b)
+    try:
+        # tanpa gambar: opsi preview tidak ikut key, jadi ganti opsi tampilan tidak compare ulang
+        return compare_pdfs(a_path, b_path)
+    finally:
+        a_path.unlink(missing_ok=True)
+        b_path.unlink(missing_ok=True)
+
+
+@st.cache_data(max_entries=STREAMLIT_CACHE_ENTRIES, ttl=STREAMLIT_CACHE_TTL, show_spinner=False)
+def cached_compare_images(digest: str, _uploaded) -> dict:
+    """
+    Gambar 1 PDF untuk preview compare, ditulis ke storage/compare/pdf_<digest>/ sekali per file,
+    baru saat preview pertama kali ditampilkan.
+    """
+    path, _ = save_uploaded(_uploaded)
+    try:
+        return save_compare_images(path, COMPARE_DIR / f"pdf_{digest}")
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def compare_preview_path(paths: dict, source, page, img_index) -> str:
+    if source is None or pd.isna(page) or pd.isna(img_index):
+        return ""
+    return paths.get(image_key(source, page, img_index), "")
+
+
 if mode == "Cek vs Database (1 PDF)":
     show_only_dup = st.sidebar.checkbox("Tampilkan hanya DUP", value=False)
 
@@ -48,14 +121,11 @@ if mode == "Cek vs Database (1 PDF)":
         st.info("Silakan upload PDF untuk mulai.")
         st.stop()
 
-    # Save uploaded file
-    tmp_name = f"{uuid4().hex}_{Path(uploaded.name).name}"
-    tmp_path = UPLOAD_DIR / tmp_name
-    tmp_path.write_bytes(uploaded.getbuffer())
+    digest = upload_digest(uploaded)
 
     st.success(f"File diterima: {uploaded.name}")
     with st.spinner("Memproses PDF... (extract + hashing + matching)"):
-        report = ingest_pdf(tmp_path)
+        report = cached_ingest(digest, uploaded)
 
     pdf_id = report.get("pdf_id")
     num_images = report.get("num_images_processed", 0)
@@ -77,6 +147,7 @@ if mode == "Cek vs Database (1 PDF)":
     for r in results:
         m = r.get("match") or {}
         rows.append({
+            "image_id": r.get("image_id"),
             "status": "DUP" if r.get("is_duplicate") else "NEW",
             "page": r.get("page"),
             "source": r.get("source"),
@@ -87,7 +158,9 @@ if mode == "Cek vs Database (1 PDF)":
             "phash_dist": m.get("phash_dist"),
             "dhash_dist": m.get("dhash_dist"),
             "ehash_dist": m.get("ehash_dist"),
+            "crop": bool(m.get("crop")),
             "old_img_path": m.get("old_img_path"),
+            "old_image_id": m.get("old_image_id"),
         })
 
     df = pd.DataFrame(rows)
@@ -133,18 +206,19 @@ if mode == "Cek vs Database (1 PDF)":
                     eh = row["ehash_dist"]
                     old_img_path = row["old_img_path"]
 
-                    st.caption(f"Match ke: {old_pdf} (page {old_page}) | score={score} | ph={ph}, dh={dh}, eh={eh}")
+                    crop = " | crop" if row["crop"] else ""
+                    st.caption(f"Match ke: {old_pdf} (page {old_page}) | score={score} | ph={ph}, dh={dh}, eh={eh}{crop}")
 
                     colA, colB = st.columns(2)
                     with colA:
-                        safe_image_show(img_path, "Gambar (PDF baru)")
+                        safe_image_show(img_path, "Gambar (PDF baru)", row["image_id"])
                     with colB:
                         if old_img_path:
-                            safe_image_show(old_img_path, "Gambar referensi (PDF lama)")
+                            safe_image_show(old_img_path, "Gambar referensi (PDF lama)", row["old_image_id"])
                         else:
                             st.info("Tidak ada path gambar referensi.")
                 else:
-                    safe_image_show(img_path, "Gambar (PDF baru)")
+                    safe_image_show(img_path, "Gambar (PDF baru)", row["image_id"])
 
                 st.markdown("---")
 
@@ -162,13 +236,11 @@ else:
         st.info("Upload kedua PDF untuk mulai compare.")
         st.stop()
 
-    a_path = UPLOAD_DIR / f"{uuid4().hex}_{Path(up_a.name).name}"
-    b_path = UPLOAD_DIR / f"{uuid4().hex}_{Path(up_b.name).name}"
-    a_path.write_bytes(up_a.getbuffer())
-    b_path.write_bytes(up_b.getbuffer())
+    digest_a = upload_digest(up_a)
+    digest_b = upload_digest(up_b)
 
     with st.spinner("Membandingkan PDF A vs PDF B..."):
-        rep = compare_pdfs(a_path, b_path)
+        rep = cached_compare(digest_a, digest_b, up_a, up_b)
 
     st.success(f"Selesai. A images={rep['num_images_a']} | B images={rep['num_images_b']}")
     results = rep["results"]
@@ -180,10 +252,10 @@ else:
             "status": "MATCH" if r["is_match"] else "NO_MATCH",
             "A_page": r["page"],
             "A_source": r["source"],
-            "A_img_path": r["img_path"],
+            "A_img_index": r["img_index"],
             "B_page": m.get("b_page"),
             "B_source": m.get("b_source"),
-            "B_img_path": m.get("b_img_path"),
+            "B_img_index": m.get("b_img_index"),
             "score": m.get("score"),
             "phash_dist": m.get("phash_dist"),
             "dhash_dist": m.get("dhash_dist"),
@@ -214,6 +286,9 @@ else:
         if len(preview_df) == 0:
             st.info("Tidak ada pair MATCH untuk dipreview.")
         else:
+            with st.spinner("Menyiapkan gambar preview..."):
+                images_a = cached_compare_images(digest_a, up_a)
+                images_b = cached_compare_images(digest_b, up_b)
             for _, row in preview_df.iterrows():
                 st.markdown(
                     f"**MATCH** | A page {row['A_page']} → B page {row['B_page']} "
@@ -221,7 +296,9 @@ else:
                 )
                 cA, cB = st.columns(2)
                 with cA:
-                    safe_image_show(row["A_img_path"], "PDF A")
+                    safe_image_show(compare_preview_path(images_a, row["A_source"], row["A_page"],
+                                                         row["A_img_index"]), "PDF A")
                 with cB:
-                    safe_image_show(row["B_img_path"], "PDF B")
+                    safe_image_show(compare_preview_path(images_b, row["B_source"], row["B_page"],
+                                                         row["B_img_index"]), "PDF B")
                 st.markdown("---")
@@ -0,0 +1,87 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from uuid import uuid4
+
+from PIL import Image
+
+from src.config import THUMBNAIL_SIZE, THUMBNAIL_QUALITY
+from src.db import fetch_image_info
+from src.fingerprint import file_digest
+from src.image_utils import safe_save_jpg
+from src.pdf_extract import render_page_to_file
+
+THUMBS_DIRNAME = "thumbs"
+
+
+def thumbnail_path(img_path: str, image_id: Optional[int] = None, size: int = THUMBNAIL_SIZE) -> Path:
+    """
+    Lokasi thumbnail: <folder gambar>/thumbs/<image_id>_<size>.jpg
+    (tanpa image_id, misal hasil compare, pakai nama file gambar).
+    """
+    p = Path(img_path)
+    key = str(image_id) if image_id is not None else p.stem
+    return p.parent / THUMBS_DIRNAME / f"{key}_{size}.jpg"
+
+
+def ensure_image_file(image_id: int) -> Optional[Path]:
+    """
+    Path gambar asli untuk image_id. Halaman render yang saat ingest hanya dirender di resolusi
+    hashing (RENDER_AT_HASH_SIZE) dirender RENDER_DPI di sini, sekali, saat pertama dibutuhkan.
+    return: path, atau None kalau gambar tidak ada dan tidak bisa dibuat.
+    """
+    info = fetch_image_info(image_id)
+    if info is None or not info[5]:
+        return None
+    img_path = Path(info[5])
+    if img_path.exists():
+        return img_path
+    # info: (images.id, pdf_id, page, source, img_index, img_path, pdf_filename, pdf_stored_path,
+    #        pdf_digest, image_digest)
+    if info[3] == "render" and info[7] and pdf_is_intact(Path(info[7]), info[8]):
+        img_path.parent.mkdir(parents=True, exist_ok=True)
+        return render_page_to_file(Path(info[7]), int(info[2]), img_path)
+    return None
+
+
+def pdf_is_intact(pdf_path: Path, pdf_digest: Optional[str]) -> bool:
+    """
+    File PDF di storage masih isi yang di-ingest (DB lama menyimpan PDF dengan nama asli saja,
+    jadi file-nya bisa sudah ditimpa PDF lain bernama sama). PDF tanpa digest tidak bisa dicek.
+    """
+    if not pdf_path.exists():
+        return False
+    if not pdf_digest:
+        return True
+    st = pdf_path.stat()
+    return _file_digest_cached(str(pdf_path), st.st_size, st.st_mtime_ns) == pdf_digest
+
+
+@lru_cache(maxsize=256)
+def _file_digest_cached(path: str, size: int, mtime_ns: int) -> str:
+    # size + mtime ikut jadi key: file yang diganti dihitung ulang
+    return file_digest(Path(path))
+
+
+def get_thumbnail(img_path: str, image_id: Optional[int] = None, size: int = THUMBNAIL_SIZE) -> Optional[Path]:
+    """
+    Thumbnail untuk preview, dibuat sekali saat pertama diminta lalu dipakai ulang.
+    return: path thumbnail, atau None kalau gambar aslinya tidak ada.
+    """
+    if not img_path or not Path(img_path).exists():
+        return None
+    out_path = thumbnail_path(img_path, image_id, size)
+    if out_path.exists():
+        return out_path
+
+    with Image.open(img_path) as img:
+        # JPEG: decode langsung di resolusi kecil
+        img.draft("RGB", (size, size))
+        img.thumbnail((size, size))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        # tulis ke file sementara dulu supaya request paralel tidak membaca file setengah jadi
+        tmp_path = out_path.with_name(f"{out_path.stem}.{uuid4().hex}.tmp")
+        safe_save_jpg(img, tmp_path, quality=THUMBNAIL_QUALITY)
+    tmp_path.replace(out_path)
+    return out_path
@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class StageTimings:
+    """
+    Catat wall time + CPU time (thread ini) per tahap, counter (jumlah gambar, byte dibaca/ditulis)
+    dan detail per gambar. Hasil to_dict() masuk ke report.json sebagai blok "timings".
+    Bisa dilanjutkan dari dict lama (misal hasil prepare_pdf di worker process).
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.stages: Dict[str, Dict[str, float]] = {k: dict(v) for k, v in data.get("stages", {}).items()}
+        self.counts: Dict[str, int] = dict(data.get("counts", {}))
+        self.images: List[Dict[str, Any]] = list(data.get("images", []))
+        self.last_wall_s = 0.0  # durasi panggilan stage() terakhir
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        w0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            rec = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0})
+            self.last_wall_s = time.perf_counter() - w0
+            rec["wall_s"] += self.last_wall_s
+            rec["cpu_s"] += time.thread_time() - c0
+            rec["calls"] += 1
+
+    def timed_iter(self, name: str, it: Iterator[T]) -> Iterator[T]:
+        """
+        Bungkus generator: waktu di dalam next() dihitung ke tahap `name`, waktu di loop pemanggil tidak.
+        """
+        it = iter(it)
+        while True:
+            with self.stage(name):
+                try:
+                    x = next(it)
+                except StopIteration:
+                    return
+            yield x
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def image(self, **fields: Any) -> None:
+        self.images.append(fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stages": {k: {"wall_s": round(v["wall_s"], 6), "cpu_s": round(v["cpu_s"], 6), "calls": int(v["calls"])}
+                       for k, v in self.stages.items()},
+            "total_wall_s": round(sum(v["wall_s"] for v in self.stages.values()), 6),
+            "counts": dict(self.counts),
+            "images": list(self.images),
+        }
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable, Tuple
+from uuid import uuid4
+
+from src.config import UPLOAD_DIR, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class _UploadWriter:
+    """
+    Tulis upload ke storage/uploads per chunk sambil menghitung digest file
+    (sama dengan fingerprint.file_digest), jadi ingest tidak perlu membaca ulang file-nya.
+    """
+
+    def __init__(self, filename: str, max_bytes: int):
+        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        self.path = UPLOAD_DIR / f"{uuid4().hex}_{Path(filename).name}"
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._f = open(self.path, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self._size += len(chunk)
+        if self._size > self._max_bytes:
+            raise UploadTooLarge(f"File lebih besar dari batas {self._max_bytes // (1024 * 1024)} MB")
+        self._hash.update(chunk)
+        self._f.write(chunk)
+
+    def close(self, ok: bool) -> None:
+        self._f.close()
+        if not ok:
+            self.path.unlink(missing_ok=True)
+
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def save_upload_chunks(filename: str, chunks: Iterable[bytes],
+                       max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[Path, str]:
+    """
+    return: (path file di storage/uploads, digest isi file). File sisa dihapus kalau gagal/terlalu besar.
+    """
+    w = _UploadWriter(filename, max_bytes)
+    try:
+        for chunk in chunks:
+            w.write(chunk)
+    except BaseException:
+        w.close(ok=False)
+        raise
+    w.close(ok=True)
+    return w.path, w.digest()
+
+
+async def save_upload_stream(filename: str, read: Callable[[int], Awaitable[bytes]],
+                             max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[Path, str]:
+    """
+    Versi async untuk FastAPI UploadFile: read = upload.read.
+    Tulis file + blake2b per chunk jalan di thread pool, jadi event loop tidak ikut menunggu disk.
+    """
+    loop = asyncio.get_running_loop()
+    w = _UploadWriter(filename, max_bytes)
+    try:
+        while True:
+            chunk = await read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await loop.run_in_executor(None, w.write, chunk)
+    except BaseException:
+        w.close(ok=False)
+        raise
+    w.close(ok=True)
+    return w.path, w.digest()
+
+
+def iter_file_chunks(f, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterable[bytes]:
+    """
+    Baca file-like object (misal UploadedFile streamlit) per chunk dari awal.
+    """
+    f.seek(0)
+    return iter(lambda: f.read(chunk_size), b"")
+
+
+def digest_chunks(chunks: Iterable[bytes]) -> str:
+    """
+    Digest isi file dari chunk yang sudah ada di memory (sama dengan fingerprint.file_digest).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+from uuid import uuid4
+
+import numpy as np
+from PIL import Image
+
+from src.config import (
+    IMAGES_DIR,
+    VERIFY_MIN_INLIERS,
+    VERIFY_ORB_FEATURES,
+    VERIFY_MAX_SIDE,
+    VERIFY_FEATURE_CACHE,
+)
+from src.db import fetch_image_info
+from src.thumbnails import ensure_image_file
+
+# OpenCV opsional: tanpa cv2, verifikasi dilewati dan matcher kembali ke hash saja
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+FEATURES_DIRNAME = "_features"
+_RATIO_TEST = 0.75  # Lowe ratio test untuk match descriptor
+_RANSAC_REPROJ_PX = 5.0
+
+# Features = (koordinat keypoint float32 (N, 2), descriptor ORB uint8 (N, 32))
+Features = Tuple[np.ndarray, np.ndarray]
+
+_lock = threading.Lock()
+# key = digest isi gambar (images.digest): gambar identik di PDF berbeda berbagi descriptor
+_cache: "OrderedDict[str, Optional[Features]]" = OrderedDict()
+
+
+def available() -> bool:
+    return cv2 is not None
+
+
+def features_path(image_digest: str) -> Path:
+    # per digest isi, bukan per image_id: file lama tidak pernah terpakai untuk gambar lain
+    return IMAGES_DIR / FEATURES_DIRNAME / image_digest[:2] / f"{image_digest}.npz"
+
+
+def compute_features(data: Union[bytes, Image.Image, Path]) -> Optional[Features]:
+    """
+    Keypoint + descriptor ORB dari bytes gambar, PIL image, atau path file.
+    return: Features, atau None kalau OpenCV tidak ada / gambar tanpa keypoint (polos)
+    """
+    if cv2 is None:
+        return None
+    if isinstance(data, bytes):
+        img = Image.open(BytesIO(data))
+    elif isinstance(data, Path):
+        img = Image.open(data)
+    else:
+        img = data
+    # JPEG: decode langsung di resolusi kecil
+    img.draft("L", (VERIFY_MAX_SIDE, VERIFY_MAX_SIDE))
+    g = img.convert("L")
+    g.thumbnail((VERIFY_MAX_SIDE, VERIFY_MAX_SIDE))
+    orb = cv2.ORB_create(nfeatures=VERIFY_ORB_FEATURES)
+    keypoints, desc = orb.detectAndCompute(np.asarray(g), None)
+    if desc is None or len(keypoints) < 4:
+        return None
+    pts = np.array([kp.pt for kp in keypoints], dtype=np.float32)
+    return pts, desc
+
+
+def _remember(image_digest: str, feats: Optional[Features]) -> None:
+    with _lock:
+        _cache[image_digest] = feats
+        _cache.move_to_end(image_digest)
+        while len(_cache) > VERIFY_FEATURE_CACHE:
+            _cache.popitem(last=False)
+
+
+def save_features(image_digest: Optional[str], feats: Optional[Features]) -> None:
+    """
+    Simpan descriptor gambar yang baru di-ingest, supaya verifikasi berikutnya tidak extract ulang.
+    """
+    if feats is None or not image_digest:
+        return
+    out_path = features_path(image_digest)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    # tulis ke file sementara dulu supaya process lain tidak membaca file setengah jadi
+    tmp_path = out_path.with_name(f"{out_path.stem}.{uuid4().hex}.tmp.npz")
+    np.savez(tmp_path, pts=feats[0], desc=feats[1])
+    tmp_path.replace(out_path)
+    _remember(image_digest, feats)
+
+
+def get_features(image_id: int) -> Optional[Features]:
+    """
+    Descriptor gambar di corpus: cache memory, lalu file _features/<digest>.npz,
+    terakhir extract dari file gambar (lalu disimpan).
+    """
+    info = fetch_image_info(image_id)
+    if info is None:
+        return None
+    # info: (images.id, pdf_id, page, source, img_index, img_path, pdf_filename, pdf_stored_path,
+    #        pdf_digest, image_digest)
+    image_digest = info[9]
+    if image_digest:
+        with _lock:
+            if image_digest in _cache:
+                _cache.move_to_end(image_digest)
+                return _cache[image_digest]
+        path = features_path(image_digest)
+        if path.exists():
+            with np.load(path) as z:
+                feats: Optional[Features] = (z["pts"], z["desc"])
+            _remember(image_digest, feats)
+            return feats
+
+    # ensure_image_file hanya render ulang dari PDF yang digest-nya masih cocok
+    img_path = ensure_image_file(image_id)
+    if img_path is None:
+        # file gambar tidak disimpan: tidak bisa diverifikasi (jangan di-cache, file bisa muncul nanti)
+        return None
+    with Image.open(img_path) as img:
+        feats = compute_features(img)
+    if not image_digest:
+        # baris lama tanpa digest: tidak ada key yang aman untuk cache
+        return feats
+    if feats is not None:
+        save_features(image_digest, feats)
+    else:
+        _remember(image_digest, None)
+    return feats
+
+
+def verify_pair(a: Optional[Features], b: Optional[Features]) -> Optional[Dict[str, Any]]:
+    """
+    Verifikasi geometris: match descriptor (Hamming + ratio test), lalu homography RANSAC.
+    return: {"inliers", "matches", "score", "ok"}; score = inliers / keypoint gambar yang lebih sedikit.
+            None kalau tidak bisa diverifikasi (OpenCV tidak ada / salah satu tanpa descriptor).
+    """
+    if cv2 is None or a is None or b is None:
+        return None
+    (pts_a, desc_a), (pts_b, desc_b) = a, b
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    good = [pair[0] for pair in matcher.knnMatch(desc_a, desc_b, k=2)
+            if len(pair) == 1 or (len(pair) == 2 and pair[0].distance < _RATIO_TEST * pair[1].distance)]
+    inliers = 0
+    if len(good) >= 4:
+        src = pts_a[[m.queryIdx for m in good]].reshape(-1, 1, 2)
+        dst = pts_b[[m.trainIdx for m in good]].reshape(-1, 1, 2)
+        _, mask = cv2.findHomography(src, dst, cv2.RANSAC, _RANSAC_REPROJ_PX)
+        if mask is not None:
+            inliers = int(mask.sum())
+    return {
+        "inliers": inliers,
+        "matches": len(good),
+        "score": round(inliers / max(1, min(len(pts_a), len(pts_b))), 4),
+        "ok": inliers >= VERIFY_MIN_INLIERS,
+    }
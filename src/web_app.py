@@ -1,16 +1,22 @@
 from pathlib import Path
-from uuid import uuid4
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
 from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, FileResponse, PlainTextResponse
 
-# pakai fungsi ingest yang sudah kamu punya
-from src.ingest_pdf import ingest_pdf
+from src.config import UPLOAD_DIR, THUMBNAIL_SIZE, WEB_INGEST_WORKERS, WEB_MAX_PENDING_JOBS, WEB_JOB_HISTORY
+from src.jobs import JobQueue, QueueFull
+from src.uploads import save_upload_stream, UploadTooLarge
+from src.db import count_fingerprints
+from src.fp_cache import loaded_size
+from src import metrics
+from src.thumbnails import get_thumbnail, ensure_image_file
 
 app = FastAPI(title="PDF Image Duplicate Checker")
 
-UPLOAD_DIR = Path("storage/uploads")
+# ingest jalan di background; handler hanya simpan file + daftarkan job
+jobs: Optional[JobQueue] = None
+
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 
@@ -22,6 +28,22 @@ def _html_escape(s: str) -> str:
              .replace("'", "&#39;"))
 
 
+@app.on_event("startup")
+def _start_jobs() -> None:
+    global jobs
+    jobs = JobQueue(WEB_INGEST_WORKERS, WEB_MAX_PENDING_JOBS, WEB_JOB_HISTORY)
+
+
+@app.on_event("shutdown")
+def _stop_jobs() -> None:
+    if jobs is not None:
+        jobs.shutdown()
+
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in job.items() if k != "report"}
+
+
 @app.get("/", response_class=HTMLResponse)
 def home():
     # Upload form sederhana
@@ -47,46 +69,153 @@ def home():
             <button type="submit">Proses</button>
           </form>
           <hr/>
-          <p class="hint">Kalau mau hasil JSON: POST ke <code>/api/upload</code></p>
+          <p class="hint">Kalau mau hasil JSON: POST ke <code>/api/upload</code> (dapat <code>job_id</code>),
+          lalu cek <code>/api/jobs/&lt;job_id&gt;</code> dan ambil <code>/api/jobs/&lt;job_id&gt;/result</code></p>
         </div>
       </body>
     </html>
     """
 
 
+async def _save_upload(pdf: UploadFile) -> Tuple[Path, str]:
+    # simpan file upload sementara per chunk (tidak utuh di memory), digest dihitung sambil jalan
+    return await save_upload_stream(pdf.filename, pdf.read)
+
+
+@app.get("/health")
+def health() -> Dict[str, Any]:
+    return {"status": "ok", "jobs": jobs.stats() if jobs is not None else None}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint() -> PlainTextResponse:
+    # ukuran corpus dari cache kalau sudah di-load, kalau belum hitung di DB
+    n = loaded_size()
+    if n is None:
+        n = count_fingerprints()
+    pending = jobs.stats()["pending"] if jobs is not None else None
+    return PlainTextResponse(metrics.render(fingerprints=n, jobs_pending=pending),
+                             media_type="text/plain; version=0.0.4")
+
+
 @app.post("/api/upload")
 async def api_upload(pdf: UploadFile = File(...)) -> JSONResponse:
     if not pdf.filename.lower().endswith(".pdf"):
         return JSONResponse({"error": "File harus .pdf"}, status_code=400)
 
-    # simpan file upload sementara
-    safe_name = f"{uuid4().hex}_{Path(pdf.filename).name}"
-    tmp_path = UPLOAD_DIR / safe_name
+    try:
+        tmp_path, digest = await _save_upload(pdf)
+    except UploadTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
 
-    content = await pdf.read()
-    tmp_path.write_bytes(content)
+    # proses di background, langsung balas dengan job_id
+    try:
+        job_id = jobs.submit(tmp_path, Path(pdf.filename).name, digest)
+    except QueueFull as e:
+        tmp_path.unlink(missing_ok=True)
+        return JSONResponse({"error": str(e)}, status_code=503)
 
-    # proses pakai pipeline kamu
-    report: Dict[str, Any] = ingest_pdf(tmp_path)
+    return JSONResponse({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result",
+    }, status_code=202)
 
-    return JSONResponse(report)
+
+@app.get("/api/jobs/{job_id}")
+def api_job_status(job_id: str) -> JSONResponse:
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job tidak ditemukan"}, status_code=404)
+    return JSONResponse(_job_view(job))
+
+
+@app.get("/api/jobs/{job_id}/result")
+def api_job_result(job_id: str) -> JSONResponse:
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job tidak ditemukan"}, status_code=404)
+    if job["status"] == "error":
+        return JSONResponse(_job_view(job), status_code=500)
+    if job["status"] != "done":
+        # belum selesai: cek lagi nanti
+        return JSONResponse(_job_view(job), status_code=409)
+    return JSONResponse(job["report"])
 
 
 @app.post("/upload", response_class=HTMLResponse)
-async def upload(pdf: UploadFile = File(...)) -> HTMLResponse:
+async def upload(pdf: UploadFile = File(...)):
     if not pdf.filename.lower().endswith(".pdf"):
         return HTMLResponse("<h3>Error: File harus PDF</h3>", status_code=400)
 
-    # simpan file upload sementara
-    safe_name = f"{uuid4().hex}_{Path(pdf.filename).name}"
-    tmp_path = UPLOAD_DIR / safe_name
+    try:
+        tmp_path, digest = await _save_upload(pdf)
+    except UploadTooLarge as e:
+        return HTMLResponse(f"<h3>Error: {_html_escape(str(e))}</h3>", status_code=413)
+
+    try:
+        job_id = jobs.submit(tmp_path, Path(pdf.filename).name, digest)
+    except QueueFull as e:
+        tmp_path.unlink(missing_ok=True)
+        return HTMLResponse(f"<h3>Error: {_html_escape(str(e))}</h3>", status_code=503)
+
+    # halaman job auto-refresh sampai hasil siap
+    return RedirectResponse(f"/jobs/{job_id}", status_code=303)
+
+
+@app.get("/jobs/{job_id}", response_class=HTMLResponse)
+def job_page(job_id: str) -> HTMLResponse:
+    job = jobs.get(job_id)
+    if job is None:
+        return HTMLResponse("<h3>Error: Job tidak ditemukan</h3>", status_code=404)
+    if job["status"] == "error":
+        return HTMLResponse(f"""
+        <html><body style="font-family: Arial, sans-serif; margin: 40px;">
+          <h3>Gagal memproses {_html_escape(job["filename"])}</h3>
+          <pre>{_html_escape(job["error"] or "")}</pre>
+          <p><a href="/">← Upload lagi</a></p>
+        </body></html>
+        """, status_code=500)
+    if job["status"] != "done":
+        return HTMLResponse(f"""
+        <html>
+          <head><meta http-equiv="refresh" content="2"/><title>Memproses...</title></head>
+          <body style="font-family: Arial, sans-serif; margin: 40px;">
+            <h3>Memproses {_html_escape(job["filename"])}...</h3>
+            <p>Status: <b>{_html_escape(job["status"])}</b> (halaman ini refresh otomatis)</p>
+          </body>
+        </html>
+        """)
+    return _render_report_html(job["report"])
+
+
+@app.get("/images/{image_id}")
+def image_full(image_id: int):
+    # gambar ukuran asli, hanya kalau diminta (klik thumbnail)
+    path = ensure_image_file(image_id)
+    if path is None:
+        return JSONResponse({"error": "Gambar tidak ditemukan"}, status_code=404)
+    return FileResponse(path)
+
+
+@app.get("/images/{image_id}/thumb")
+def image_thumb(image_id: int, size: int = THUMBNAIL_SIZE):
+    path = ensure_image_file(image_id)
+    thumb = get_thumbnail(str(path), image_id, min(max(size, 32), 1024)) if path else None
+    if thumb is None:
+        return JSONResponse({"error": "Gambar tidak ditemukan"}, status_code=404)
+    return FileResponse(thumb, media_type="image/jpeg", headers={"Cache-Control": "max-age=86400"})
+
 
-    content = await pdf.read()
-    tmp_path.write_bytes(content)
+def _thumb_html(image_id: Any) -> str:
+    if image_id is None:
+        return "-"
+    return (f'<a href="/images/{int(image_id)}" target="_blank">'
+            f'<img src="/images/{int(image_id)}/thumb" loading="lazy" style="max-width:120px; max-height:120px"/></a>')
 
-    # proses pipeline
-    report: Dict[str, Any] = ingest_pdf(tmp_path)
 
+def _render_report_html(report: Dict[str, Any]) -> HTMLResponse:
     # render hasil ke HTML
     pdf_name = _html_escape(report.get("pdf_filename", ""))
     pdf_id = report.get("pdf_id", "")
@@ -112,15 +241,16 @@ async def upload(pdf: UploadFile = File(...)) -> HTMLResponse:
             ph = m.get("phash_dist", "")
             dh = m.get("dhash_dist", "")
             eh = m.get("ehash_dist", "")
+            crop = f" | crop ({m.get('region_votes')} region)" if m.get("crop") else ""
 
             rows.append(f"""
             <tr>
               <td>DUP</td>
               <td>{page}</td>
               <td>{src}</td>
-              <td>{img_name}</td>
-              <td>{old_pdf} (page {old_page})</td>
-              <td>score={score} | ph={ph} dh={dh} eh={eh}</td>
+              <td>{img_name}<br/>{_thumb_html(r.get("image_id"))}</td>
+              <td>{old_pdf} (page {old_page})<br/>{_thumb_html(m.get("old_image_id"))}</td>
+              <td>score={score} | ph={ph} dh={dh} eh={eh}{crop}</td>
             </tr>
             """)
         else:
@@ -129,7 +259,7 @@ async def upload(pdf: UploadFile = File(...)) -> HTMLResponse:
               <td>NEW</td>
               <td>{page}</td>
               <td>{src}</td>
-              <td>{img_name}</td>
+              <td>{img_name}<br/>{_thumb_html(r.get("image_id"))}</td>
               <td>-</td>
               <td>-</td>
             </tr>
@@ -0,0 +1,64 @@
+"""
+Regression test fingerprint: gambar di PDF kecil hasil generate, di-extract lewat pipeline
+(iter_pdf_images) lalu di-hash dengan compute_hashes_from_data, dibandingkan per gambar dengan
+implementasi lama (bench.hash_regression.legacy_compute_hashes) di bawah TOLERANCE.
+
+Jalankan dari root repo:
+  py -m pytest tests
+"""
+import random
+from pathlib import Path
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+import pytest
+
+from bench.hash_regression import TOLERANCE, encode, legacy_compute_hashes, synthetic_image
+from src.fingerprint import compute_hashes_from_data, hamming_hex
+from src.pdf_extract import iter_pdf_images
+
+# (ukuran gambar, format) per halaman: JPEG besar (draft decode), grayscale, CMYK, PNG
+IMAGES = [
+    ((600, 400), "JPEG"),
+    ((1654, 2339), "JPEG"),
+    ((3000, 4000), "JPEG"),
+    ((1200, 900), "JPEG-L"),
+    ((1200, 900), "JPEG-CMYK"),
+    ((800, 600), "PNG"),
+]
+
+
+@pytest.fixture(scope="module")
+def extracted(tmp_path_factory) -> List[Tuple[int, bytes]]:
+    """
+    PDF 1 gambar per halaman; return: (page, bytes gambar hasil extract) urut halaman.
+    """
+    rng = random.Random(0)
+    pdf_path: Path = tmp_path_factory.mktemp("hash_regression") / "sample.pdf"
+    doc = fitz.open()
+    for size, fmt in IMAGES:
+        page = doc.new_page(width=595, height=842)
+        page.insert_image(page.rect, stream=encode(synthetic_image(rng, size), fmt))
+    doc.save(pdf_path)
+    doc.close()
+
+    out = []
+    for source, page, _, _, _, data in iter_pdf_images(pdf_path):
+        assert source == "embedded"
+        out.append((page, data))
+    return out
+
+
+def test_all_images_extracted(extracted):
+    assert len(extracted) == len(IMAGES)
+
+
+@pytest.mark.parametrize("i", range(len(IMAGES)), ids=[f"{fmt}-{w}x{h}" for (w, h), fmt in IMAGES])
+def test_hash_within_tolerance(extracted, i):
+    _, data = extracted[i]
+    old = legacy_compute_hashes(data)
+    new = compute_hashes_from_data(data)
+
+    assert new[3:] == old[3:]  # width, height asli
+    for name, o, n in zip(("phash", "dhash", "ehash"), old, new):
+        assert hamming_hex(o, n) <= TOLERANCE[name], f"{name}: {o} vs {n}"